@@ -0,0 +1,10 @@
+"""Benchmarks for the bot.
+
+They run against a temporary database unless TASKBOT_DATABASE_URL is set,
+so importing them never touches the bot's own db.sqlite3.
+"""
+import os
+import tempfile
+
+os.environ.setdefault('TASKBOT_DATABASE_URL', 'sqlite:///{}'.format(
+    os.path.join(tempfile.mkdtemp(prefix='taskbot-bench-'), 'db.sqlite3')))
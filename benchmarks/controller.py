@@ -0,0 +1,168 @@
+"""This benchmark times the TasksController methods on synthetic large boards.
+
+Run it from the repository root:
+
+    python -m benchmarks.controller --chats 5 --tasks 2000 --shape wide \
+        --output controller.json [--baseline previous.json]
+"""
+import argparse
+import datetime
+import json
+import random
+import subprocess
+import time
+
+from sqlalchemy import event
+
+import db
+from db import Task, TaskDependency
+from tasks_controller import TasksController
+
+FIRST_CHAT = 900000
+
+def seed(chats, tasks, shape, fanout, depth):
+    """This function fills the database with chats boards of tasks each."""
+    first_id = (db.session.query(db.func.max(Task.id)).scalar() or 0) + 1
+    boards = {}
+    task_rows = []
+    edge_rows = []
+    for chat in range(FIRST_CHAT, FIRST_CHAT + chats):
+        ids = list(range(first_id, first_id + tasks))
+        first_id += tasks
+        boards[chat] = ids
+
+        for i, task_id in enumerate(ids):
+            task_rows.append({'id': task_id, 'chat': chat, 'name': 'task {}'.format(i),
+                              'status': random.choice(['TODO', 'DOING', 'DONE']),
+                              'priority': random.choice(['', 'low', 'medium', 'high']),
+                              'overdue': False})
+            if shape == 'wide' and i > 0:
+                parent = ids[(i - 1) // fanout]
+            elif shape == 'deep' and i % depth > 0:
+                parent = ids[i - 1]
+            else:
+                continue
+            edge_rows.append({'chat': chat, 'task_id': parent, 'depends_on_id': task_id})
+
+    db.session.execute(Task.__table__.insert(), task_rows)
+    if edge_rows:
+        db.session.execute(TaskDependency.__table__.insert(), edge_rows)
+    db.session.commit()
+    return boards
+
+class Recorder:
+    """This class collects the latency and SQL statement count of each call."""
+
+    def __init__(self):
+        self.statements = 0
+        self.samples = {}
+        event.listen(db.engine, 'before_cursor_execute', self.count)
+
+    def count(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements += 1
+
+    def time(self, name, function, *args):
+        self.statements = 0
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        self.samples.setdefault(name, []).append((elapsed, self.statements))
+        db.session.remove()
+        return result
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+def summarize(samples):
+    """This function gets the latency percentiles (ms) and query counts of each method."""
+    results = {}
+    for name, calls in sorted(samples.items()):
+        latencies = [elapsed * 1000 for elapsed, _ in calls]
+        queries = [statements for _, statements in calls]
+        results[name] = {'calls': len(calls),
+                         'p50_ms': percentile(latencies, 0.5),
+                         'p90_ms': percentile(latencies, 0.9),
+                         'p99_ms': percentile(latencies, 0.99),
+                         'max_ms': max(latencies),
+                         'queries_mean': sum(queries) / float(len(queries)),
+                         'queries_max': max(queries)}
+    return results
+
+def run(boards, iterations):
+    controller = TasksController()
+    recorder = Recorder()
+    duedate = (datetime.date.today() + datetime.timedelta(days=30)).strftime('%d/%m/%Y')
+
+    for _ in range(iterations):
+        chat = random.choice(list(boards))
+        ids = boards[chat]
+
+        controller.list_cache.clear()
+        recorder.time('list_tasks', controller.list_tasks, '', chat)
+        recorder.time('list_tasks_cached', controller.list_tasks, '', chat)
+
+        status_ids = ' '.join(str(task_id) for task_id in random.sample(ids, 10))
+        recorder.time('change_multiple', controller.change_multiple, status_ids, chat, 'DOING')
+        recorder.time('set_duedate', controller.set_duedate,
+                      '{} {}'.format(random.choice(ids), duedate), chat)
+
+        scratch = controller.new_task('scratch', chat).split('[[')[1].split(']]')[0]
+        db.session.remove()
+        recorder.time('depends_on', controller.depends_on,
+                      '{} {}'.format(scratch, random.choice(ids)), chat)
+        duplicate = recorder.time('duplicate_task', controller.duplicate_task,
+                                  str(random.choice(ids)), chat)
+        duplicate = duplicate.split('[[')[1].split(']]')[0]
+        recorder.time('delete_task', controller.delete_task, duplicate, chat)
+        recorder.time('delete_task', controller.delete_task, scratch, chat)
+
+    return summarize(recorder.samples)
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--chats', type=int, default=5)
+    parser.add_argument('--tasks', type=int, default=2000, help='tasks per chat')
+    parser.add_argument('--shape', choices=['flat', 'wide', 'deep'], default='wide')
+    parser.add_argument('--fanout', type=int, default=8, help='children per task (wide)')
+    parser.add_argument('--depth', type=int, default=50, help='length of each chain (deep)')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='controller_benchmark.json')
+    parser.add_argument('--baseline', help='a previous output to compare against')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    boards = seed(args.chats, args.tasks, args.shape, args.fanout, args.depth)
+    results = run(boards, args.iterations)
+
+    report = {'revision': git_revision(),
+              'config': vars(args),
+              'results': results}
+    with open(args.output, 'w') as output:
+        json.dump(report, output, indent=2, sort_keys=True)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+
+    print('{:18} {:>9} {:>9} {:>9} {:>8} {:>9}'.format(
+        'method', 'p50 ms', 'p90 ms', 'p99 ms', 'queries', 'vs base'))
+    for name, result in results.items():
+        compared = ''
+        if name in baseline:
+            compared = '{:+.0%}'.format(result['p50_ms'] / baseline[name]['p50_ms'] - 1)
+        print('{:18} {:9.2f} {:9.2f} {:9.2f} {:8.1f} {:>9}'.format(
+            name, result['p50_ms'], result['p90_ms'], result['p99_ms'],
+            result['queries_mean'], compared))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""This load test replays commands from many chats through a local fake Bot API.
+
+Run it from the repository root:
+
+    python -m benchmarks.load --chats 200 --commands 20 --mode async
+"""
+import argparse
+import asyncio
+import bisect
+import json
+import os
+import random
+import threading
+import time
+
+from fake_telegram import FakeTelegram
+from taskbot_api import Api
+
+FIRST_CHAT = 800000
+
+COMMANDS = ['/new load task {n}', '/list', '/done {n}', '/doing {n}',
+            '/priority {n} high', '/rename {n} renamed {n}', '/help']
+
+def make_script(chats, commands, seed):
+    """This function builds the updates of every chat, interleaved at random."""
+    rng = random.Random(seed)
+    script = []
+    pending = dict((chat, commands) for chat in range(FIRST_CHAT, FIRST_CHAT + chats))
+    while pending:
+        chat = rng.choice(list(pending))
+        text = '/new first task' if pending[chat] == commands else rng.choice(COMMANDS)
+        script.append({'message': {'chat': {'id': chat},
+                                   'text': text.format(n=rng.randint(1, chats * commands))}})
+        pending[chat] -= 1
+        if not pending[chat]:
+            del pending[chat]
+    return script
+
+def run_polling(api, stop):
+    last_update_id = None
+    while not stop.is_set():
+        updates = api.get_updates(last_update_id)
+        if updates["result"]:
+            last_update_id = api.get_last_update_id(updates) + 1
+            api.handle_updates(updates)
+
+def run_async(api, stop):
+    import taskbot_async
+
+    loop = asyncio.new_event_loop()
+    task = loop.create_task(taskbot_async.AsyncBot(api).run())
+    threading.Thread(target=lambda: stop.wait() or loop.call_soon_threadsafe(task.cancel),
+                     daemon=True).start()
+    try:
+        loop.run_until_complete(task)
+    except asyncio.CancelledError:
+        pass
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+def measure(server, started, finished):
+    """This function gets the throughput, reply latency and call counts of a run."""
+    sends = {}
+    for sent_at, payload in server.sent:
+        sends.setdefault(payload['chat_id'], []).append(sent_at)
+
+    latencies = []
+    for update in server.queued:
+        chat = update['message']['chat']['id']
+        times = sends.get(chat, [])
+        reply = bisect.bisect_left(times, server.served_at.get(update['update_id'], finished))
+        if reply < len(times):
+            latencies.append((times[reply] - server.queued_at[update['update_id']]) * 1000)
+
+    methods = {}
+    for method, _ in server.requests:
+        methods[method] = methods.get(method, 0) + 1
+
+    return {'updates': len(server.queued),
+            'answered': len(latencies),
+            'seconds': finished - started,
+            'updates_per_second': len(server.queued) / (finished - started),
+            'latency_p50_ms': percentile(latencies, 0.5) if latencies else None,
+            'latency_p95_ms': percentile(latencies, 0.95) if latencies else None,
+            'latency_p99_ms': percentile(latencies, 0.99) if latencies else None,
+            'calls': methods,
+            'connections': server.connections}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--chats', type=int, default=200)
+    parser.add_argument('--commands', type=int, default=20, help='commands per chat')
+    parser.add_argument('--mode', choices=['async', 'polling'], default='async')
+    parser.add_argument('--idle', type=float, default=2.0,
+                        help='seconds without replies after which the run is over')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the results as JSON here')
+    args = parser.parse_args()
+
+    os.environ.setdefault('TASKBOT_GITHUB_ISSUES', '0')
+    server = FakeTelegram(poll_cap=0.2).start()
+    api = Api(token='LOAD', api_url=server.url)
+    stop = threading.Event()
+    runner = run_async if args.mode == 'async' else run_polling
+    threading.Thread(target=runner, args=(api, stop), daemon=True).start()
+
+    script = make_script(args.chats, args.commands, args.seed)
+    started = time.monotonic()
+    server.queue_updates(script)
+
+    finished = started
+    while True:
+        time.sleep(0.1)
+        with server.lock:
+            served = len(server.served_at) == len(script)
+            if server.sent:
+                finished = server.sent[-1][0]
+        if served and time.monotonic() - max(finished, started) > args.idle:
+            break
+    stop.set()
+
+    results = measure(server, started, finished)
+    server.stop()
+
+    for name, value in sorted(results.items()):
+        print('{:20} {}'.format(name, round(value, 2) if isinstance(value, float) else value))
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({'config': vars(args), 'results': results}, output, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
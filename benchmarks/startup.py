@@ -0,0 +1,75 @@
+"""This benchmark compares import time and call overhead with the contracts checked or not.
+
+Run it from the repository root:
+
+    python -m benchmarks.startup --runs 5 --calls 20000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+CHILD = '''
+import json, sys, time
+start = time.perf_counter()
+import taskbot_api
+imported = time.perf_counter() - start
+
+from benchmarks.startup import time_calls
+result = {'import_ms': imported * 1000,
+          'contracts_loaded': 'contracts' in sys.modules,
+          'github_loaded': 'github_integration' in sys.modules}
+result.update(time_calls(int(sys.argv[1])))
+print(json.dumps(result))
+'''
+
+def time_calls(calls):
+    """This function times small controller and cache calls, in microseconds per call."""
+    from dependency_graph import DependencyGraph
+    from list_cache import ListCache
+    from tasks_controller import TasksController
+
+    controller = TasksController()
+    cache = ListCache()
+    graph = DependencyGraph([(1, 2), (2, 3)])
+
+    results = {}
+    for name, function in [('task_names', lambda: controller.task_names('one\ntwo')),
+                           ('get_status_icon', lambda: controller.get_status_icon('DOING')),
+                           ('list_cache_version', lambda: cache.version(1)),
+                           ('creates_cycle', lambda: graph.creates_cycle(3, 1))]:
+        start = time.perf_counter()
+        for _ in range(calls):
+            function()
+        results[name + '_us'] = (time.perf_counter() - start) / calls * 1e6
+    return results
+
+def run_child(checked, calls):
+    environment = dict(os.environ, TASKBOT_CONTRACTS='1' if checked else '0',
+                       TASKBOT_GITHUB_ISSUES='0')
+    output = subprocess.check_output([sys.executable, '-c', CHILD, str(calls)],
+                                     env=environment)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters per mode')
+    parser.add_argument('--calls', type=int, default=20000)
+    args = parser.parse_args()
+
+    modes = {}
+    for name, checked in [('checked', True), ('production', False)]:
+        runs = [run_child(checked, args.calls) for _ in range(args.runs)]
+        modes[name] = {key: sorted(run[key] for run in runs)[len(runs) // 2]
+                       for key in runs[0]}
+
+    print('{:22} {:>12} {:>12}'.format('median', 'checked', 'production'))
+    for key in modes['checked']:
+        print('{:22} {:>12} {:>12}'.format(
+            key, *[round(modes[mode][key], 2) if isinstance(modes[mode][key], float)
+                   else str(modes[mode][key]) for mode in ['checked', 'production']]))
+
+if __name__ == '__main__':
+    main()
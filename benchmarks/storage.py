@@ -0,0 +1,45 @@
+"""This benchmark compares the write throughput of the SQLite storage settings.
+
+Run it from the repository root:
+
+    python -m benchmarks.storage --writes 2000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import db
+
+BASELINE_PRAGMAS = {'journal_mode': 'DELETE', 'synchronous': 'FULL'}
+
+def writes_per_second(pragmas, writes):
+    """This function times writes single-row transactions, the way /new commits them."""
+    directory = tempfile.mkdtemp(prefix='taskbot-bench-')
+    engine = db.make_engine('sqlite:///' + os.path.join(directory, 'bench.sqlite3'),
+                            pragmas=pragmas)
+    db.Base.metadata.create_all(engine)
+    session = db.sessionmaker(bind=engine)()
+
+    start = time.perf_counter()
+    for i in range(writes):
+        session.add(db.Task(chat=i % 10, name='task {}'.format(i), status='TODO',
+                            priority='', overdue=False))
+        session.commit()
+    elapsed = time.perf_counter() - start
+
+    session.close()
+    engine.dispose()
+    return writes / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--writes', type=int, default=2000)
+    args = parser.parse_args()
+
+    for name, pragmas in [('before (DELETE journal, synchronous=FULL)', BASELINE_PRAGMAS),
+                          ('after (settings from db.SQLITE_PRAGMAS)', db.SQLITE_PRAGMAS)]:
+        print('{:45} {:10.0f} writes/s'.format(name, writes_per_second(pragmas, args.writes)))
+
+if __name__ == '__main__':
+    main()
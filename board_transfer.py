@@ -0,0 +1,179 @@
+"""This module exports a chat's board as JSON lines and imports it back."""
+import datetime
+import json
+
+import sqlalchemy
+
+import db
+import settings
+from db import Task, TaskDependency
+from tasks_controller import TasksController
+from typecheck import contract
+
+STATUSES = ('TODO', 'DOING', 'DONE')
+PRIORITIES = ('', 'low', 'medium', 'high')
+
+class BoardImportError(ValueError):
+    """This class is an import file that can't be loaded, and the line it failed at."""
+
+    def __init__(self, line, reason):
+        super().__init__('line {}: {}'.format(line, reason))
+        self.line = line
+        self.reason = reason
+
+class BoardTransfer:
+    """This class streams a board to and from its JSON lines document.
+
+    Every line is either a task, {"type": "task", "id", "name", "status",
+    "priority", "duedate"}, or an edge, {"type": "dependency", "task_id",
+    "depends_on_id"}, with the ids local to the document.
+    """
+
+    BATCH_SIZE = settings.get_int('import_batch_size', 1000)
+
+    @contract(chat='int', returns='tuple')
+    def export_board(self, chat, output):
+        """This function writes a chat's tasks and edges to output, a batch at a time."""
+        tasks = Task.__table__
+        edges = TaskDependency.__table__
+        options = {'yield_per': self.BATCH_SIZE}
+        task_count = 0
+        query = sqlalchemy.select(tasks.c.id, tasks.c.name, tasks.c.status, tasks.c.priority,
+                                  tasks.c.duedate).where(tasks.c.chat == chat)
+        for task_id, name, status, priority, duedate in db.session.execute(
+                query.order_by(tasks.c.id), execution_options=options):
+            self.write_line(output, {'type': 'task', 'id': task_id, 'name': name,
+                                     'status': status, 'priority': priority or '',
+                                     'duedate': duedate.isoformat() if duedate else None})
+            task_count += 1
+
+        edge_count = 0
+        query = sqlalchemy.select(edges.c.task_id, edges.c.depends_on_id).where(
+            edges.c.chat == chat)
+        for task_id, depends_on_id in db.session.execute(
+                query.order_by(edges.c.task_id, edges.c.depends_on_id),
+                execution_options=options):
+            self.write_line(output, {'type': 'dependency', 'task_id': task_id,
+                                     'depends_on_id': depends_on_id})
+            edge_count += 1
+
+        db.session.remove()
+        return task_count, edge_count
+
+    def write_line(self, output, record):
+        output.write(json.dumps(record, ensure_ascii=False).encode('utf8') + b'\n')
+
+    @contract(chat='int', returns='tuple')
+    def import_board(self, chat, lines):
+        """This function loads a document into chat in one transaction, with new ids.
+
+        The tasks are inserted in batches as they are read, and the database
+        gives their ids, so a concurrent /new can't take them. The edges are
+        checked for unknown tasks and cycles before anything is committed.
+        """
+        today = datetime.date.today()
+        new_ids = {}
+        seen = set()
+        edges = []
+        batch_ids = []
+        batch = []
+        try:
+            for number, line in enumerate(lines, 1):
+                if not line.strip():
+                    continue
+                record = self.parse_line(number, line)
+                if record['type'] == 'task':
+                    if record['id'] in seen:
+                        raise BoardImportError(number, 'task {} twice'.format(record['id']))
+                    seen.add(record['id'])
+                    batch_ids.append(record['id'])
+                    batch.append(self.task_row(number, record, chat, today))
+                    if len(batch) == self.BATCH_SIZE:
+                        new_ids.update(zip(batch_ids, TasksController.insert_tasks(batch)))
+                        batch_ids, batch = [], []
+                else:
+                    edges.append((number, record['task_id'], record['depends_on_id']))
+            if batch:
+                new_ids.update(zip(batch_ids, TasksController.insert_tasks(batch)))
+
+            edge_rows = self.edge_rows(chat, edges, new_ids)
+            task_ids = list(new_ids.values())
+            for start in range(0, len(task_ids), self.BATCH_SIZE):
+                TasksController.flow_log.record(chat, 'create',
+                                                task_ids[start:start + self.BATCH_SIZE])
+            for start in range(0, len(edge_rows), self.BATCH_SIZE):
+                db.session.execute(sqlalchemy.insert(TaskDependency),
+                                   edge_rows[start:start + self.BATCH_SIZE])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        TasksController.list_cache.bump(chat)
+        TasksController.graphs.invalidate(chat)
+        return len(new_ids), len(edge_rows)
+
+    @contract(number='int', line='str|bytes', returns='dict')
+    def parse_line(self, number, line):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise BoardImportError(number, 'not JSON')
+        if not isinstance(record, dict) or record.get('type') not in ('task', 'dependency'):
+            raise BoardImportError(number, 'not a task or a dependency')
+
+        fields = ('id', 'name') if record['type'] == 'task' else ('task_id', 'depends_on_id')
+        for field in fields:
+            if field not in record:
+                raise BoardImportError(number, 'no {}'.format(field))
+        return record
+
+    def task_row(self, number, record, chat, today):
+        status = record.get('status') or 'TODO'
+        priority = record.get('priority') or ''
+        if status not in STATUSES:
+            raise BoardImportError(number, 'unknown status {}'.format(status))
+        if priority not in PRIORITIES:
+            raise BoardImportError(number, 'unknown priority {}'.format(priority))
+
+        duedate = None
+        if record.get('duedate'):
+            try:
+                duedate = datetime.date.fromisoformat(record['duedate'])
+            except (TypeError, ValueError):
+                raise BoardImportError(number, 'bad duedate {}'.format(record['duedate']))
+
+        # The same rule as the overdue sweep, which flags finished tasks too.
+        return {'chat': chat, 'name': str(record['name']), 'status': status,
+                'priority': priority, 'duedate': duedate,
+                'overdue': duedate is not None and duedate < today}
+
+    def edge_rows(self, chat, edges, new_ids):
+        """This function maps the edges to the new ids, rejecting unknown tasks and cycles."""
+        dependencies = {}
+        for number, task_id, depends_on_id in edges:
+            for edge_id in (task_id, depends_on_id):
+                if edge_id not in new_ids:
+                    raise BoardImportError(number, 'unknown task {}'.format(edge_id))
+            dependencies.setdefault(new_ids[task_id], set()).add(new_ids[depends_on_id])
+
+        # Kahn's algorithm: whatever can't be ordered is on a cycle.
+        waiting = {}
+        for task_id, dep_ids in dependencies.items():
+            for depends_on_id in dep_ids:
+                waiting[depends_on_id] = waiting.get(depends_on_id, 0) + 1
+        ready = [task_id for task_id in dependencies if not waiting.get(task_id)]
+        ordered = 0
+        while ready:
+            task_id = ready.pop()
+            ordered += 1
+            for depends_on_id in dependencies.get(task_id, ()):
+                waiting[depends_on_id] -= 1
+                if not waiting[depends_on_id]:
+                    ready.append(depends_on_id)
+        nodes = set(dependencies) | set(waiting)
+        if ordered < len(nodes):
+            raise BoardImportError(edges[-1][0], 'the dependencies make a cycle')
+
+        return [{'chat': chat, 'task_id': task_id, 'depends_on_id': depends_on_id}
+                for task_id, dep_ids in dependencies.items() for depends_on_id in dep_ids]
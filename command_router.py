@@ -0,0 +1,124 @@
+"""This module parses the bot updates into commands and routes them to their handlers."""
+import collections
+import traceback
+
+from typecheck import contract
+
+class Reply(collections.namedtuple('Reply', 'text reply_markup message_id')):
+    """This class is a response with an inline keyboard, or an edit of message_id."""
+
+    __slots__ = ()
+
+    def __new__(cls, text, reply_markup=None, message_id=None):
+        return super().__new__(cls, text, reply_markup, message_id)
+
+@contract(update='dict', returns='dict|None')
+def get_message(update):
+    """This function gets the message of an update, or the one a pressed button is on."""
+    if 'callback_query' in update:
+        return update['callback_query'].get('message')
+    return update.get('message') or update.get('edited_message')
+
+@contract(update='dict', returns='int|None')
+def get_chat_id(update):
+    """This function gets the chat of an update."""
+    message = get_message(update)
+    if not message or 'chat' not in message:
+        return None
+    return message['chat']['id']
+
+class Command(collections.namedtuple('Command', 'name text chat sender update')):
+    """This class is an update parsed once: its command, the text after it and its chat."""
+
+    __slots__ = ()
+
+    @classmethod
+    @contract(update='dict')
+    def parse(cls, update):
+        """This function parses an update, returning None if it holds no command.
+
+        A pressed inline button is parsed from its callback data, which is
+        written as a command, and a sent file from its caption.
+        """
+        message = get_message(update)
+        if 'callback_query' in update:
+            sender = update['callback_query'].get('from', {})
+            text = update['callback_query'].get('data')
+        else:
+            sender = (message or {}).get('from', {})
+            text = (message or {}).get('text') or (message or {}).get('caption')
+        if not message or 'chat' not in message or not text:
+            return None
+
+        words = text.split(None, 1)
+        if not words:
+            return None
+        name = words[0].split('@', 1)[0]
+        text = words[1].strip() if len(words) > 1 else ''
+        chat = message['chat']['id']
+        return cls(name, text, chat, sender.get('id', chat), update)
+
+def parse_updates(updates):
+    """This generator parses the updates, logging and skipping the ones with no command."""
+    for update in updates:
+        command = Command.parse(update)
+        if command is None:
+            print('Can\'t process! {}'.format(update))
+            continue
+        yield command
+
+class CommandRouter:
+    """This class answers each command with the handler registered for its name."""
+
+    FAILED = "I'm sorry dave. Something went wrong with that command."
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+        self.handlers = {}
+
+    @contract(name='str', returns='None')
+    def register(self, name, handler):
+        """This function makes handler answer the command name."""
+        self.handlers[name] = handler
+
+    @contract(name='str', returns='str')
+    def label(self, name):
+        """This function gets the name of a command as labeled in the metrics."""
+        return name if name in self.handlers else 'other'
+
+    @contract(returns='list')
+    def route(self, command):
+        """This function runs the handler of a command and returns its responses."""
+        responses = self.handlers.get(command.name, self.fallback)(command)
+        if isinstance(responses, (str, Reply)):
+            responses = [responses]
+        return responses
+
+    def answer(self, commands, process=None):
+        """This generator yields each command with its responses, isolating failures.
+
+        A command that raises is logged and answered with FAILED, and the
+        commands after it still run.
+        """
+        process = process or self.route
+        for command in commands:
+            try:
+                responses = process(command)
+            except Exception:
+                print('Command {} of chat {} failed'.format(command.name, command.chat))
+                traceback.print_exc()
+                responses = [self.FAILED]
+            yield command, responses
+
+    def deliver(self, command, responses, reply):
+        """This function sends each response of a command with reply, isolating failures.
+
+        A response that can't be sent is logged, and the other responses
+        and commands are still sent.
+        """
+        for response in responses:
+            try:
+                reply(response, command.chat)
+            except Exception:
+                print('Reply to {} of chat {} failed'.format(command.name, command.chat))
+                traceback.print_exc()
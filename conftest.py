@@ -0,0 +1,9 @@
+import os
+import tempfile
+
+# The tests always check the contracts, whatever the config file says.
+os.environ['TASKBOT_CONTRACTS'] = '1'
+
+# Keep the tests off the bot's own db.sqlite3.
+os.environ.setdefault('TASKBOT_DATABASE_URL', 'sqlite:///{}'.format(
+    os.path.join(tempfile.mkdtemp(prefix='taskbot-test-'), 'db.sqlite3')))
@@ -1,25 +1,58 @@
 #!/usr/bin/env python3
 
 from sqlalchemy import *
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import event
+from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlalchemy.types import *
 from sqlalchemy.ext.declarative import declarative_base
 
-engine = create_engine('sqlite:///db.sqlite3', echo=True)
+import settings
+from metrics import metrics
+
+SQLITE_PRAGMAS = {
+    'journal_mode': settings.get('sqlite_journal_mode', 'WAL'),
+    'synchronous': settings.get('sqlite_synchronous', 'NORMAL'),
+    'mmap_size': settings.get_int('sqlite_mmap_size', 256 * 1024 * 1024),
+    'cache_size': settings.get_int('sqlite_cache_size', -64 * 1024),
+    'busy_timeout': settings.get_int('sqlite_busy_timeout', 5000),
+}
+
+def make_engine(url, echo=False, pragmas=None):
+    """This function creates an engine, setting the SQLite pragmas on every connection."""
+    new_engine = create_engine(url, echo=echo)
+    if new_engine.dialect.name == 'sqlite' and pragmas:
+        def set_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                cursor.execute('PRAGMA {} = {}'.format(name, value))
+            cursor.close()
+
+        event.listen(new_engine, 'connect', set_pragmas)
+    return new_engine
+
+engine = make_engine(settings.get('database_url', 'sqlite:///db.sqlite3'),
+                     echo=settings.get_bool('sql_echo', False),
+                     pragmas=SQLITE_PRAGMAS)
+metrics.track_sql(engine)
 Session = sessionmaker(bind=engine)
-session = Session()
+# Each thread gets its own session; call session.remove() once an update is done.
+session = scoped_session(Session)
 
 Base = declarative_base()
 
 class Task(Base):
     __tablename__ = 'tasks'
+    __table_args__ = (
+        Index('ix_tasks_chat_id', 'chat', 'id'),
+        Index('ix_tasks_chat_duedate', 'chat', 'duedate'),
+        # The reminders are refreshed for every chat at once, by due date.
+        Index('ix_tasks_duedate_status', 'duedate', 'status'),
+    )
 
     id = Column(Integer, primary_key=True)
     chat = Column(Integer)
     name = Column(String)
     status = Column(String)
-    dependencies = Column(String)
-    parents = Column(String)
     priority = Column(String)
     overdue = Column(Boolean)
     duedate = Column(Date)
@@ -29,7 +62,157 @@ class Task(Base):
             self.id, self.chat, self.name, self.status
         )
 
+class TaskDependency(Base):
+    """An edge of the dependency graph: task_id depends on depends_on_id."""
+    __tablename__ = 'task_dependencies'
+    __table_args__ = (
+        Index('ix_task_dependencies_chat_task_id', 'chat', 'task_id'),
+        Index('ix_task_dependencies_chat_depends_on_id', 'chat', 'depends_on_id'),
+    )
+
+    task_id = Column(Integer, primary_key=True)
+    depends_on_id = Column(Integer, primary_key=True)
+    chat = Column(Integer, nullable=False)
+
+    def __repr__(self):
+        return "<TaskDependency(chat={}, task_id={}, depends_on_id={})>".format(
+            self.chat, self.task_id, self.depends_on_id
+        )
+
+class GithubIssue(Base):
+    """An issue waiting in the outbox to be created on GitHub."""
+    __tablename__ = 'github_outbox'
+    __table_args__ = (
+        Index('ix_github_outbox_status_next_attempt', 'status', 'next_attempt'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    chat = Column(Integer, nullable=False)
+    title = Column(String, nullable=False)
+    body = Column(String, default='')
+    status = Column(String, default='PENDING')
+    attempts = Column(Integer, default=0)
+    next_attempt = Column(DateTime)
+
+    def __repr__(self):
+        return "<GithubIssue(id={}, chat={}, title='{}', status='{}')>".format(
+            self.id, self.chat, self.title, self.status
+        )
+
+class TaskEvent(Base):
+    """An append-only record of a change to a task: its kind, new value and time."""
+    __tablename__ = 'task_events'
+    __table_args__ = (
+        Index('ix_task_events_task_id_kind', 'task_id', 'kind'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    chat = Column(Integer, nullable=False)
+    task_id = Column(Integer, nullable=False)
+    kind = Column(String, nullable=False)
+    value = Column(String)
+    created_at = Column(DateTime, nullable=False)
+
+    def __repr__(self):
+        return "<TaskEvent(id={}, task_id={}, kind='{}', value='{}')>".format(
+            self.id, self.task_id, self.kind, self.value
+        )
+
+class FlowDay(Base):
+    """The flow totals of a chat's tasks finished on one day, kept as the events arrive."""
+    __tablename__ = 'flow_days'
+
+    chat = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    done = Column(Integer, nullable=False, default=0)
+    lead_count = Column(Integer, nullable=False, default=0)
+    lead_seconds = Column(Float, nullable=False, default=0)
+    cycle_count = Column(Integer, nullable=False, default=0)
+    cycle_seconds = Column(Float, nullable=False, default=0)
+
+    def __repr__(self):
+        return "<FlowDay(chat={}, day={}, done={})>".format(self.chat, self.day, self.done)
+
+def migrate_dependency_strings(bind=None):
+    """This function moves the legacy comma separated dependencies to task_dependencies.
+
+    The legacy columns are dropped once they are converted, so later
+    startups skip it (dropping a column needs SQLite 3.35).
+    """
+    bind = bind or engine
+    columns = [column['name'] for column in inspect(bind).get_columns('tasks')]
+    if 'dependencies' not in columns:
+        return
+
+    with bind.begin() as connection:
+        rows = connection.execute(text('SELECT id, chat, dependencies FROM tasks')).fetchall()
+        existing = set((chat, task_id) for task_id, chat, _ in rows)
+
+        edges = []
+        for task_id, chat, dependencies in rows:
+            for dependency in (dependencies or '').split(','):
+                if dependency.isdigit() and (chat, int(dependency)) in existing:
+                    edges.append({'chat': chat, 'task_id': task_id,
+                                  'depends_on_id': int(dependency)})
+
+        if edges:
+            connection.execute(text(
+                'INSERT OR IGNORE INTO task_dependencies (chat, task_id, depends_on_id) '
+                'VALUES (:chat, :task_id, :depends_on_id)'), edges)
+        for column in ('dependencies', 'parents'):
+            if column in columns:
+                connection.execute(text('ALTER TABLE tasks DROP COLUMN {}'.format(column)))
+
+def migrate_indexes():
+    """This function creates the indexes missing from tables created by older versions."""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
+SEARCH_SCHEMA = [
+    "CREATE VIRTUAL TABLE tasks_fts USING fts5(name, chat, content='tasks', content_rowid='id')",
+    "CREATE TRIGGER tasks_fts_insert AFTER INSERT ON tasks BEGIN "
+    "INSERT INTO tasks_fts (rowid, name, chat) VALUES (new.id, new.name, new.chat); END",
+    "CREATE TRIGGER tasks_fts_delete AFTER DELETE ON tasks BEGIN "
+    "INSERT INTO tasks_fts (tasks_fts, rowid, name, chat) "
+    "VALUES ('delete', old.id, old.name, old.chat); END",
+    "CREATE TRIGGER tasks_fts_update AFTER UPDATE OF name, chat ON tasks BEGIN "
+    "INSERT INTO tasks_fts (tasks_fts, rowid, name, chat) "
+    "VALUES ('delete', old.id, old.name, old.chat); "
+    "INSERT INTO tasks_fts (rowid, name, chat) VALUES (new.id, new.name, new.chat); END",
+]
+
+def migrate_search():
+    """This function creates the full-text index of the task names, filling it from tasks.
+
+    It returns False when the database has no FTS5, and /search then falls
+    back to LIKE.
+    """
+    if engine.dialect.name != 'sqlite':
+        return False
+    if 'tasks_fts' in inspect(engine).get_table_names():
+        return True
+
+    try:
+        with engine.begin() as connection:
+            for statement in SEARCH_SCHEMA:
+                connection.execute(text(statement))
+            connection.execute(text("INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild')"))
+    except exc.OperationalError as error:
+        print('Full-text search is off: {}'.format(error))
+        return False
+    return True
+
+def migrate():
+    """This function brings an existing database up to the current schema."""
+    global SEARCH
+    migrate_dependency_strings()
+    migrate_indexes()
+    SEARCH = migrate_search()
+
+SEARCH = False
 Base.metadata.create_all(engine)
+migrate()
 
 if __name__ == '__main__':
-    pass
+    migrate()
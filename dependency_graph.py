@@ -0,0 +1,218 @@
+"""This module keeps the task dependencies of each chat with their transitive closure."""
+import collections
+import threading
+
+from typecheck import contract
+
+import db
+import settings
+from db import TaskDependency
+
+class DependencyGraph:
+    """This class keeps the dependencies of one chat and which tasks reach which.
+
+    Adding an edge updates the closure incrementally, so checking whether a
+    new edge closes a cycle is a set lookup. Removing edges recomputes the
+    closure of only the tasks that reached them.
+    """
+
+    def __init__(self, edges=()):
+        self.dependencies = {}
+        self.dependents = {}
+        self.reach = {}
+        self.blocking = {}
+        self.pairs = 0
+        for task_id, depends_on_id in edges:
+            self.dependencies.setdefault(task_id, set()).add(depends_on_id)
+            self.dependents.setdefault(depends_on_id, set()).add(task_id)
+
+        # The closures are joined dependencies first, a set union per task.
+        if not self.close_all(set(self.dependencies), set(self.dependents)):
+            self.rebuild()
+
+    @classmethod
+    def close(cls, edges, task_ids, closed):
+        """This function fills closed with every task reachable over edges from task_ids.
+
+        closed must already be right for the tasks outside task_ids. It
+        returns False, leaving closed half done, if task_ids lie on a cycle.
+        """
+        for task_id in task_ids:
+            stack = [task_id]
+            path = set()
+            while stack:
+                top = stack[-1]
+                if top in closed:
+                    stack.pop()
+                elif top in path:
+                    stack.pop()
+                    path.discard(top)
+                    reach = set(edges.get(top, ()))
+                    for next_id in edges.get(top, ()):
+                        reach.update(closed.get(next_id, ()))
+                    closed[top] = reach
+                else:
+                    path.add(top)
+                    for next_id in edges.get(top, ()):
+                        if next_id in path:
+                            return False
+                        if next_id in task_ids and next_id not in closed:
+                            stack.append(next_id)
+        return True
+
+    @contract(task_id='int', depends_on_id='int', returns='bool')
+    def creates_cycle(self, task_id, depends_on_id):
+        """This function checks if task_id depending on depends_on_id closes a cycle."""
+        return task_id == depends_on_id or task_id in self.reach.get(depends_on_id, ())
+
+    @contract(task_id='int', depends_on_id='int', returns='None')
+    def add(self, task_id, depends_on_id):
+        """This function adds an edge, extending the closure with the paths through it."""
+        dependencies = self.dependencies.setdefault(task_id, set())
+        if depends_on_id in dependencies:
+            return
+        dependencies.add(depends_on_id)
+        self.dependents.setdefault(depends_on_id, set()).add(task_id)
+
+        sources = self.blocking.get(task_id, set()) | {task_id}
+        targets = self.reach.get(depends_on_id, set()) | {depends_on_id}
+        for source in sources:
+            reach = self.reach.setdefault(source, set())
+            self.pairs -= len(reach)
+            reach.update(targets)
+            self.pairs += len(reach)
+        for target in targets:
+            self.blocking.setdefault(target, set()).update(sources)
+
+    @contract(task_id='int', returns='None')
+    def clear_dependencies(self, task_id):
+        """This function removes the edges leaving task_id."""
+        dependencies = self.dependencies.pop(task_id, None)
+        if dependencies:
+            for depends_on_id in dependencies:
+                self.dependents[depends_on_id].discard(task_id)
+            self.repair(self.blocking.get(task_id, set()) | {task_id},
+                        set(self.reach.get(task_id, ())))
+
+    @contract(task_id='int', returns='None')
+    def remove_task(self, task_id):
+        """This function removes a task and every edge touching it."""
+        self.remove_tasks([task_id])
+
+    @contract(task_ids='list(int)', returns='None')
+    def remove_tasks(self, task_ids):
+        """This function removes tasks and every edge touching them."""
+        task_ids = set(task_ids)
+        sources = set()
+        targets = set()
+        for task_id in task_ids:
+            sources.update(self.blocking.pop(task_id, ()))
+            reach = self.reach.pop(task_id, set())
+            targets.update(reach)
+            self.pairs -= len(reach)
+            for depends_on_id in self.dependencies.pop(task_id, ()):
+                self.dependents.get(depends_on_id, set()).discard(task_id)
+            for dependent_id in self.dependents.pop(task_id, ()):
+                self.dependencies.get(dependent_id, set()).discard(task_id)
+        self.repair(sources - task_ids, targets - task_ids)
+
+    def repair(self, sources, targets):
+        """This function recomputes the closures that went through removed edges.
+
+        Only the sources could reach the edges and only the targets be
+        reached through them, so every other closure still holds.
+        """
+        for source in sources:
+            self.pairs -= len(self.reach.pop(source, ()))
+        for target in targets:
+            self.blocking.pop(target, None)
+        if not self.close_all(sources, targets):
+            self.rebuild()
+
+    def close_all(self, sources, targets):
+        """This function fills in the missing reach of sources and blocking of targets."""
+        if not (self.close(self.dependencies, sources, self.reach) and
+                self.close(self.dependents, targets, self.blocking)):
+            return False
+        self.pairs += sum(len(self.reach[source]) for source in sources)
+        return True
+
+    def rebuild(self):
+        """This function recomputes the closure edge by edge, which also copes with cycles."""
+        edges = [(task_id, depends_on_id)
+                 for task_id, dependencies in self.dependencies.items()
+                 for depends_on_id in dependencies]
+        self.dependencies = {}
+        self.dependents = {}
+        self.reach = {}
+        self.blocking = {}
+        self.pairs = 0
+        for task_id, depends_on_id in edges:
+            self.add(task_id, depends_on_id)
+
+    @contract(task_id='int', returns='isinstance(set)')
+    def depends_on(self, task_id):
+        """This function gets every task task_id depends on, directly or not."""
+        return set(self.reach.get(task_id, ()))
+
+    @contract(task_id='int', pending='isinstance(set)', returns='bool')
+    def is_ready(self, task_id, pending):
+        """This function checks if task_id depends on none of the pending tasks."""
+        return self.reach.get(task_id, set()).isdisjoint(pending)
+
+    @contract(task_id='int', returns='isinstance(set)')
+    def blocked_by(self, task_id):
+        """This function gets every task that depends on task_id, directly or not."""
+        return set(self.blocking.get(task_id, ()))
+
+class DependencyGraphs:
+    """This class keeps the graph of the most recent chats, with LRU eviction.
+
+    The closure can grow with the square of a chat's tasks, so the cache is
+    bounded by the pairs held in all the closures and not by the chats.
+    The graph in use is kept even if it alone is over the bound.
+    """
+
+    PAIRS = settings.get_int('dependency_graph_pairs', 1000000)
+
+    def __init__(self, pairs=None):
+        self.pairs = pairs or self.PAIRS
+        self.graphs = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    @contract(chat='int', returns='isinstance(DependencyGraph)')
+    def get(self, chat):
+        """This function gets the graph of a chat, loading its edges on a miss."""
+        with self.lock:
+            graph = self.graphs.get(chat)
+            if graph is not None:
+                self.graphs.move_to_end(chat)
+                self.evict()
+                return graph
+
+        query = db.session.query(TaskDependency.task_id, TaskDependency.depends_on_id)
+        graph = DependencyGraph(query.filter_by(chat=chat).all())
+        with self.lock:
+            self.graphs[chat] = graph
+            self.graphs.move_to_end(chat)
+            self.evict()
+        return graph
+
+    def evict(self):
+        """This function drops the least recent graphs until the rest fit the bound."""
+        total = sum(graph.pairs for graph in self.graphs.values())
+        while len(self.graphs) > 1 and total > self.pairs:
+            _, graph = self.graphs.popitem(last=False)
+            total -= graph.pairs
+
+    @contract(chat='int', returns='None')
+    def invalidate(self, chat):
+        """This function drops the graph of a chat, to be loaded again when needed."""
+        with self.lock:
+            self.graphs.pop(chat, None)
+
+    @contract(returns='None')
+    def clear(self):
+        """This function drops every graph."""
+        with self.lock:
+            self.graphs.clear()
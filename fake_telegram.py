@@ -0,0 +1,182 @@
+"""This module runs a local stand-in for the Telegram Bot API."""
+import email.parser
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    """This class answers the Bot API requests with keep-alive connections."""
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.record_connection()
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path.startswith('/file/'):
+            self.download(url.path.split('/', 3)[-1])
+            return
+        self.answer(url.path, dict(parse_qsl(url.query)))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        content_type = self.headers.get('Content-Type', '')
+        if content_type.startswith('multipart/form-data'):
+            payload = self.parse_multipart(content_type, body)
+        else:
+            payload = json.loads(body.decode('utf8')) if body else {}
+        self.answer(urlsplit(self.path).path, payload)
+
+    @classmethod
+    def parse_multipart(cls, content_type, body):
+        """This function gets the fields of a form, the files as bytes."""
+        message = email.parser.BytesParser().parsebytes(
+            b'Content-Type: ' + content_type.encode('latin1') + b'\r\n\r\n' + body)
+        payload = {}
+        for part in message.get_payload():
+            content = part.get_payload(decode=True)
+            if part.get_filename() is None:
+                content = content.decode('utf8')
+            payload[part.get_param('name', header='content-disposition')] = content
+        return payload
+
+    def download(self, file_path):
+        content = self.server.files.get(file_path)
+        self.send_response(200 if content is not None else 404)
+        self.send_header('Content-Length', str(len(content or b'')))
+        self.end_headers()
+        self.wfile.write(content or b'')
+
+    def answer(self, path, payload):
+        method = path.rsplit('/', 1)[-1]
+        status, response = self.server.respond(method, payload)
+        if isinstance(response, str):
+            content_type, content = 'text/html', response.encode('utf8')
+        else:
+            content_type, content = 'application/json', json.dumps(response).encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+class FakeTelegram(ThreadingHTTPServer):
+    """This class serves scripted updates and records every Bot API call it receives."""
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), poll_cap=1.0):
+        super().__init__(address, FakeTelegramHandler)
+        self.lock = threading.Condition()
+        self.thread = None
+        self.poll_cap = poll_cap
+        self.connections = 0
+        self.requests = []
+        self.failures = []
+        self.updates = []
+        self.queued = []
+        self.next_update_id = 1
+        self.queued_at = {}
+        self.served_at = {}
+        self.sent = []
+        self.files = {}
+
+    @property
+    def url(self):
+        """This function gets the base url of the server."""
+        return 'http://{}:{}/'.format(*self.server_address)
+
+    def bot_url(self, token='TOKEN'):
+        """This function gets the url the Api prefixes to the methods."""
+        return '{}bot{}/'.format(self.url, token)
+
+    def start(self):
+        """This function serves the requests on a background thread."""
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """This function stops the server."""
+        self.shutdown()
+        self.server_close()
+
+    def record_connection(self):
+        with self.lock:
+            self.connections += 1
+
+    def fail_next(self, status=429, retry_after=0, html=False):
+        """This function makes the next request fail with status, as a proxy's page if html."""
+        with self.lock:
+            self.failures.append((status, retry_after, html))
+
+    def sent_messages(self):
+        """This function gets the payloads of every sendMessage received."""
+        with self.lock:
+            return [payload for _, payload in self.sent]
+
+    def add_file(self, file_id, content):
+        """This function makes content downloadable through getFile as file_id."""
+        with self.lock:
+            self.files['documents/' + file_id] = content
+
+    def queue_updates(self, updates):
+        """This function makes updates available to getUpdates, numbering them."""
+        with self.lock:
+            now = time.monotonic()
+            for update in updates:
+                update = dict(update, update_id=self.next_update_id)
+                self.next_update_id += 1
+                self.updates.append(update)
+                self.queued.append(update)
+                self.queued_at[update['update_id']] = now
+            self.lock.notify_all()
+
+    def get_updates(self, payload):
+        """This function long polls the queued updates, as getUpdates does."""
+        offset = int(payload.get('offset') or 0)
+        self.updates = [update for update in self.updates if update['update_id'] >= offset]
+        deadline = time.monotonic() + min(float(payload.get('timeout') or 0), self.poll_cap)
+        while not self.updates and time.monotonic() < deadline:
+            self.lock.wait(deadline - time.monotonic())
+
+        updates = self.updates[:int(payload.get('limit') or 100)]
+        now = time.monotonic()
+        for update in updates:
+            self.served_at.setdefault(update['update_id'], now)
+        return updates
+
+    def respond(self, method, payload):
+        """This function builds the status and body of a Bot API answer."""
+        with self.lock:
+            self.requests.append((method, payload))
+            if self.failures:
+                status, retry_after, html = self.failures.pop(0)
+                if html:
+                    return status, '<html><body>{} Bad Gateway</body></html>'.format(status)
+                return status, {'ok': False,
+                                'error_code': status,
+                                'description': 'Too Many Requests',
+                                'parameters': {'retry_after': retry_after}}
+
+            if method == 'getUpdates':
+                return 200, {'ok': True, 'result': self.get_updates(payload)}
+
+            if method == 'getFile':
+                return 200, {'ok': True,
+                             'result': {'file_id': payload.get('file_id'),
+                                        'file_path': 'documents/' + payload.get('file_id')}}
+
+            if method == 'sendMessage':
+                self.sent.append((time.monotonic(), payload))
+            message_id = len(self.requests)
+        return 200, {'ok': True,
+                     'result': {'message_id': message_id,
+                                'chat': {'id': payload.get('chat_id')},
+                                'text': payload.get('text')}}
@@ -0,0 +1,129 @@
+"""This module records the task events and keeps the flow totals behind /report."""
+import datetime
+
+import sqlalchemy
+
+import db
+from db import FlowDay, TaskEvent
+from typecheck import contract
+
+class FlowLog:
+    """This class appends the task events and adds each finished task to its day's totals.
+
+    The events are written in the caller's transaction, before its commit.
+    A task counts for the day it moves into DONE; its lead time is measured
+    from its creation and its cycle time from its first move to DOING.
+    """
+
+    KINDS = ('create', 'status', 'rename', 'priority', 'duedate', 'delete')
+
+    def __init__(self, now=datetime.datetime.now):
+        self.now = now
+
+    @contract(chat='int', kind='str', task_ids='list(int)', value='str|None', returns='None')
+    def record(self, chat, kind, task_ids, value=None):
+        """This function appends one event of kind for each task, in a single insert."""
+        assert kind in self.KINDS, kind
+        if not task_ids:
+            return
+        now = self.now()
+        db.session.execute(sqlalchemy.insert(TaskEvent),
+                           [{'chat': chat, 'task_id': task_id, 'kind': kind, 'value': value,
+                             'created_at': now} for task_id in task_ids])
+
+    @contract(chat='int', old_statuses='dict', new_status='str', returns='None')
+    def record_status(self, chat, old_statuses, new_status):
+        """This function records the tasks whose status changes, counting the finished ones."""
+        task_ids = sorted(task_id for task_id, status in old_statuses.items()
+                          if status != new_status)
+        if new_status == 'DONE':
+            self.add_done(chat, task_ids)
+        self.record(chat, 'status', task_ids, new_status)
+
+    def flow_times(self, chat, task_ids):
+        """This function gets when each task was created and first started.
+
+        Deleted ids can be given to new tasks, so only the events after a
+        task's latest create or delete are its own.
+        """
+        query = db.session.query(TaskEvent.task_id, TaskEvent.kind, TaskEvent.value,
+                                 TaskEvent.created_at).filter(
+            TaskEvent.task_id.in_(task_ids), TaskEvent.chat == chat,
+            TaskEvent.kind.in_(['create', 'delete', 'status']))
+        created = {}
+        started = {}
+        for task_id, kind, value, created_at in query.order_by(TaskEvent.id):
+            if kind in ('create', 'delete'):
+                started.pop(task_id, None)
+                created.pop(task_id, None)
+                if kind == 'create':
+                    created[task_id] = created_at
+            elif value == 'DOING':
+                started.setdefault(task_id, created_at)
+        return created, started
+
+    def add_done(self, chat, task_ids):
+        """This function adds tasks that were just finished to today's totals."""
+        if not task_ids:
+            return
+        now = self.now()
+        created, started = self.flow_times(chat, task_ids)
+        lead_times = [(now - created[task_id]).total_seconds()
+                      for task_id in task_ids if task_id in created]
+        cycle_times = [(now - started[task_id]).total_seconds()
+                       for task_id in task_ids if task_id in started]
+
+        totals = {'done': len(task_ids),
+                  'lead_count': len(lead_times), 'lead_seconds': sum(lead_times),
+                  'cycle_count': len(cycle_times), 'cycle_seconds': sum(cycle_times)}
+        key = (FlowDay.chat == chat, FlowDay.day == now.date())
+        result = db.session.execute(sqlalchemy.update(FlowDay).where(*key).values(
+            {getattr(FlowDay, name): getattr(FlowDay, name) + value
+             for name, value in totals.items()}))
+        if result.rowcount == 0:
+            db.session.execute(sqlalchemy.insert(FlowDay).values(
+                chat=chat, day=now.date(), **totals))
+
+    @contract(chat='int', returns='str')
+    def report(self, chat):
+        """This function reports the throughput, lead time and cycle time of a chat."""
+        today = self.now().date()
+        week = today - datetime.timedelta(days=6)
+        month = today - datetime.timedelta(days=29)
+
+        def total(column, since=None):
+            if since is not None:
+                column = sqlalchemy.case((FlowDay.day >= since, column), else_=0)
+            return sqlalchemy.func.coalesce(sqlalchemy.func.sum(column), 0)
+
+        row = db.session.query(
+            total(FlowDay.done, week), total(FlowDay.done, month), total(FlowDay.done),
+            total(FlowDay.lead_count, month), total(FlowDay.lead_seconds, month),
+            total(FlowDay.lead_count), total(FlowDay.lead_seconds),
+            total(FlowDay.cycle_count, month), total(FlowDay.cycle_seconds, month),
+            total(FlowDay.cycle_count), total(FlowDay.cycle_seconds)).filter(
+                FlowDay.chat == chat).one()
+        if not row[2]:
+            return "No task was finished yet, so there is nothing to report"
+
+        lines = ['\U0001F4C8 Flow report\n',
+                 'Throughput: {} this week, {} in 30 days, {} in all\n'.format(*row[:3]),
+                 'Lead time: {} in 30 days, {} in all\n'.format(
+                     self.average(*row[3:5]), self.average(*row[5:7])),
+                 'Cycle time: {} in 30 days, {} in all\n'.format(
+                     self.average(*row[7:9]), self.average(*row[9:11]))]
+        return ''.join(lines)
+
+    @classmethod
+    @contract(count='int', seconds='float|int', returns='str')
+    def average(cls, count, seconds):
+        """This function formats the average duration of count tasks, like 2d 3h."""
+        if not count:
+            return '-'
+        seconds = int(seconds / count)
+        days, seconds = divmod(seconds, 86400)
+        hours, seconds = divmod(seconds, 3600)
+        minutes = seconds // 60
+        parts = [(days, 'd'), (hours, 'h'), (minutes, 'm')]
+        parts = ['{}{}'.format(value, unit) for value, unit in parts if value][:2]
+        return ' '.join(parts) or '<1m'
@@ -1,16 +1,21 @@
 import json
-import urllib
 import requests
 
-from contracts import contract
+from typecheck import contract
 
 class GithubIntegration:
     REPOSITORY_OWNER='TecProg-20181'
     REPOSITORY_NAME='T--kanbot'
+    API_URL = 'https://api.github.com'
 
     USERNAME = ''
     PASSWORD = ''
 
+    def __init__(self, api_url=None, login=None):
+        self.api_url = api_url or self.API_URL
+        self.login = login
+        self.session = None
+
     @contract(returns='list')
     def user_login(self):
         """This function gets the bot login."""
@@ -18,28 +23,38 @@ class GithubIntegration:
             login = login_file.read().split('\n')
             return login
 
-    @contract(msg='str', body='str', returns='str')
-    def create_issue(self, msg, body=None):
-        """This function creates an issue on github."""
-        login = self.user_login()
+    def get_session(self):
+        """This function gets the authenticated session, reading the login only once."""
+        if self.session is None:
+            login = self.login or self.user_login()
 
-        self.USERNAME = login[0]
-        self.PASSWORD = login[1]
+            self.USERNAME = login[0]
+            self.PASSWORD = login[1]
 
-        url = 'https://api.github.com/repos/%s/%s/issues' % (self.REPOSITORY_OWNER, self.REPOSITORY_NAME)
-        
-        session = requests.Session()
+            self.session = requests.Session()
+            self.session.auth = (self.USERNAME, self.PASSWORD)
 
-        session.auth = (self.USERNAME, self.PASSWORD)
+        return self.session
+
+    @contract(msg='str', body='str|None', returns='int')
+    def post_issue(self, msg, body=None):
+        """This function posts an issue on github and returns the response status."""
+        url = '%s/repos/%s/%s/issues' % (self.api_url, self.REPOSITORY_OWNER, self.REPOSITORY_NAME)
 
         issue = {'title': msg,
                 'body': body}
 
         payload = json.dumps(issue)
-        response = session.post(url, payload)
+        response = self.get_session().post(url, payload, timeout=30)
 
-        if response.status_code == 201:
+        if response.status_code != 201:
+            print ('Response:', response.content)
+        return response.status_code
+
+    @contract(msg='str', body='str|None', returns='str')
+    def create_issue(self, msg, body=None):
+        """This function creates an issue on github."""
+        if self.post_issue(msg, body) == 201:
             return 'Successfully created Issue {0:s}'.format(msg)
         else:
-            print ('Response:', response.content)
-            return 'Could not create Issue {0:s}'.format(msg)
\ No newline at end of file
+            return 'Could not create Issue {0:s}'.format(msg)
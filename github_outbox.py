@@ -0,0 +1,110 @@
+"""This module creates the GitHub issues of new tasks off the update loop."""
+import datetime
+import threading
+
+import requests
+
+import db
+from db import GithubIssue
+from typecheck import contract
+
+class GithubOutbox:
+    """This class drains the github_outbox table on a background thread."""
+
+    BATCH_SIZE = 20
+    MAX_ATTEMPTS = 5
+    BACKOFF = 2
+    POLL_INTERVAL = 5
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, notify, github=None):
+        self.notify = notify
+        self.github = github
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def get_github(self):
+        """This function gets the GitHub client, importing it on the first issue."""
+        if self.github is None:
+            from github_integration import GithubIntegration
+            self.github = GithubIntegration()
+        return self.github
+
+    @contract(chat='int', titles='str|list(str)', body='str', returns='list(int)')
+    def enqueue(self, chat, titles, body=''):
+        """This function queues issues to be created on GitHub."""
+        if isinstance(titles, str):
+            titles = [titles]
+
+        session = db.Session()
+        try:
+            now = datetime.datetime.now()
+            issues = [GithubIssue(chat=chat, title=title, body=body, status='PENDING',
+                                  attempts=0, next_attempt=now)
+                      for title in titles]
+            session.add_all(issues)
+            session.flush()
+            issue_ids = [issue.id for issue in issues]
+            session.commit()
+        finally:
+            session.close()
+
+        self.wakeup.set()
+        return issue_ids
+
+    @contract(returns='int')
+    def drain(self):
+        """This function creates a batch of the pending issues and returns its size."""
+        session = db.Session()
+        try:
+            now = datetime.datetime.now()
+            query = session.query(GithubIssue).filter(
+                GithubIssue.status == 'PENDING',
+                GithubIssue.next_attempt <= now).order_by(GithubIssue.id).limit(self.BATCH_SIZE)
+            issues = query.all()
+
+            messages = []
+            for issue in issues:
+                try:
+                    status = self.get_github().post_issue(issue.title, issue.body)
+                except requests.RequestException as error:
+                    print('GitHub request failed: {!r}'.format(error))
+                    status = None
+
+                issue.attempts += 1
+                if status == 201:
+                    issue.status = 'CREATED'
+                    messages.append(('Successfully created Issue {}'.format(issue.title), issue.chat))
+                elif (status is None or status in self.RETRY_STATUSES) and issue.attempts < self.MAX_ATTEMPTS:
+                    delay = self.BACKOFF * 2 ** (issue.attempts - 1)
+                    issue.next_attempt = now + datetime.timedelta(seconds=delay)
+                else:
+                    issue.status = 'FAILED'
+                    messages.append(('Could not create Issue {}'.format(issue.title), issue.chat))
+
+            session.commit()
+        finally:
+            session.close()
+
+        for text, chat in messages:
+            self.notify(text, chat)
+        return len(issues)
+
+    def run(self):
+        while True:
+            try:
+                drained = self.drain()
+            except Exception as error:
+                print('GitHub outbox failed: {!r}'.format(error))
+                drained = 0
+
+            if drained < self.BATCH_SIZE:
+                self.wakeup.wait(self.POLL_INTERVAL)
+                self.wakeup.clear()
+
+    def start(self):
+        """This function drains the outbox on a background thread."""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        return self
@@ -0,0 +1,95 @@
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from typecheck import contract
+
+import settings
+
+class HttpSession:
+    """This class keeps a pooled keep-alive HTTP session for the Bot API calls."""
+
+    POOL_SIZE = settings.get_int('http_pool_size', 10)
+    CONNECT_TIMEOUT = settings.get_float('http_connect_timeout', 5.0)
+    READ_TIMEOUT = settings.get_float('http_read_timeout', 30.0)
+    MAX_RETRIES = settings.get_int('http_max_retries', 3)
+    BACKOFF = 0.5
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, pool_size=None, connect_timeout=None, read_timeout=None,
+                 max_retries=None, backoff=None):
+        self.pool_size = pool_size or self.POOL_SIZE
+        self.connect_timeout = connect_timeout or self.CONNECT_TIMEOUT
+        self.read_timeout = read_timeout or self.READ_TIMEOUT
+        self.max_retries = self.MAX_RETRIES if max_retries is None else max_retries
+        self.backoff = self.BACKOFF if backoff is None else backoff
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_size,
+                              pool_maxsize=self.pool_size,
+                              pool_block=True)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    @classmethod
+    @contract(returns='float|None')
+    def get_retry_after(cls, response):
+        """This function gets how long Telegram asked us to wait, if it did."""
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        return cls.parse_retry_after(body, response.headers)
+
+    @classmethod
+    @contract(returns='float|None')
+    def parse_retry_after(cls, body, headers):
+        """This function reads the wait from a decoded answer, or else its Retry-After header."""
+        try:
+            retry_after = body['parameters']['retry_after']
+        except (KeyError, TypeError):
+            retry_after = headers.get('Retry-After')
+
+        if retry_after is None:
+            return None
+        return float(retry_after)
+
+    def request(self, method, url, read_timeout=None, **kwargs):
+        """This function sends a request, retrying on 429, 5xx and connection errors."""
+        timeout = (self.connect_timeout, read_timeout or self.read_timeout)
+        attempt = 0
+        while True:
+            delay = self.backoff * 2 ** attempt
+            for upload in (kwargs.get('files') or {}).values():
+                upload[1].seek(0)
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.max_retries:
+                    raise
+            else:
+                if response.status_code not in self.RETRY_STATUSES or attempt >= self.max_retries:
+                    return response
+                retry_after = self.get_retry_after(response)
+                if retry_after is not None:
+                    delay = retry_after
+
+            attempt += 1
+            time.sleep(delay)
+
+    def get(self, url, params=None, read_timeout=None):
+        """This function sends a GET request."""
+        return self.request('GET', url, params=params, read_timeout=read_timeout)
+
+    def post_json(self, url, payload, read_timeout=None):
+        """This function POSTs payload as a JSON body."""
+        return self.request('POST', url, json=payload, read_timeout=read_timeout)
+
+    def post_file(self, url, data, files, read_timeout=None):
+        """This function POSTs data and files as a multipart form."""
+        return self.request('POST', url, data=data, files=files, read_timeout=read_timeout)
+
+    def close(self):
+        """This function closes the pooled connections."""
+        self.session.close()
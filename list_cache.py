@@ -0,0 +1,69 @@
+"""This module caches the rendered /list of each chat."""
+import collections
+import threading
+
+from typecheck import contract
+
+import settings
+
+class ListCache:
+    """This class keeps the rendered /list of the most recent chats, with LRU eviction.
+
+    Every write to a chat bumps its version, and an entry is only served
+    for the version and the day it was rendered on.
+    """
+
+    SIZE = settings.get_int('list_cache_size', 256)
+
+    def __init__(self, size=None):
+        self.size = size or self.SIZE
+        self.entries = collections.OrderedDict()
+        self.versions = {}
+        self.lock = threading.Lock()
+
+    @contract(chat='int', returns='int')
+    def version(self, chat):
+        """This function gets the current version of a chat's board."""
+        with self.lock:
+            return self.versions.get(chat, 0)
+
+    @contract(chat='int', returns='None')
+    def bump(self, chat):
+        """This function marks the board of a chat as changed."""
+        with self.lock:
+            self.versions[chat] = self.versions.get(chat, 0) + 1
+            self.entries.pop(chat, None)
+
+    @contract(chat='int', returns='list|None')
+    def get(self, chat, today):
+        """This function gets the cached messages of a chat, if they are still valid."""
+        with self.lock:
+            entry = self.entries.get(chat)
+            if entry is None:
+                return None
+
+            version, day, messages = entry
+            if version != self.versions.get(chat, 0) or day != today:
+                del self.entries[chat]
+                return None
+
+            self.entries.move_to_end(chat)
+            return list(messages)
+
+    @contract(chat='int', version='int', messages='list', returns='None')
+    def put(self, chat, today, version, messages):
+        """This function caches the messages rendered for version of a chat's board."""
+        with self.lock:
+            if version != self.versions.get(chat, 0):
+                return
+
+            self.entries[chat] = (version, today, list(messages))
+            self.entries.move_to_end(chat)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    @contract(returns='None')
+    def clear(self):
+        """This function drops every cached board."""
+        with self.lock:
+            self.entries.clear()
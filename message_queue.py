@@ -0,0 +1,182 @@
+"""This module coalesces the outgoing messages of each chat before sending them."""
+import threading
+import time
+
+from typecheck import contract
+
+MESSAGE_LIMIT = 4096
+
+@contract(text='str', returns='list')
+def open_entities(text):
+    """This function gets the Markdown entities left open at the end of text."""
+    entities = []
+    i = 0
+    while i < len(text):
+        if text.startswith('```', i):
+            marker = '```'
+        elif entities and entities[-1] in ('```', '`'):
+            marker = '`' if text[i] == '`' and entities[-1] == '`' else None
+        elif text[i] == '\\':
+            i += 2
+            continue
+        elif text[i] in '*_`':
+            marker = text[i]
+        else:
+            marker = None
+
+        if marker is not None:
+            if entities and entities[-1] == marker:
+                entities.pop()
+            elif marker not in entities:
+                entities.append(marker)
+        i += len(marker) if marker else 1
+
+    return entities
+
+@contract(text='str', limit='int,>0', returns='int')
+def find_cut(text, limit):
+    """This function finds where to cut text so no Markdown entity is split."""
+    for separator in ('\n', ' '):
+        cut = text.rfind(separator, 0, limit)
+        while cut > 0:
+            if not open_entities(text[:cut]):
+                return cut + 1
+            cut = text.rfind(separator, 0, cut)
+
+    return limit
+
+@contract(text='str', limit='int,>0', returns='list(str)')
+def split_message(text, limit=MESSAGE_LIMIT):
+    """This function splits text into messages of at most limit characters."""
+    chunks = []
+    while len(text) > limit:
+        cut = find_cut(text, limit)
+        chunk = text[:cut]
+        entities = open_entities(chunk)
+        if entities:
+            # No clean cut exists: close the entities here and reopen them
+            # in the next chunk.
+            reopen = ''.join(entities)
+            chunk = text[:limit - len(reopen)]
+            entities = open_entities(chunk)
+            reopen = ''.join(entities)
+            cut = len(chunk)
+            chunk += ''.join(reversed(entities))
+            text = reopen + text[cut:]
+        else:
+            text = text[cut:]
+        chunks.append(chunk.rstrip('\n'))
+
+    chunks.append(text)
+    return chunks
+
+@contract(texts='list(str)', limit='int,>0', returns='list(str)')
+def coalesce(texts, limit=MESSAGE_LIMIT):
+    """This function merges texts into as few messages of at most limit characters."""
+    messages = []
+    current = ''
+    for text in texts:
+        for chunk in split_message(text, limit):
+            if current and len(current) + 1 + len(chunk) <= limit:
+                current += '\n' + chunk
+            else:
+                if current:
+                    messages.append(current)
+                current = chunk
+
+    if current:
+        messages.append(current)
+    return messages
+
+class TokenBucket:
+    """This class paces the deliveries to rate per second with bursts of capacity."""
+
+    def __init__(self, rate=30, capacity=30, clock=time.monotonic):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.clock = clock
+        self.tokens = self.capacity
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    @contract(returns='float,>=0')
+    def reserve(self):
+        """This function takes a token and returns how long to wait before using it."""
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+class MessageQueue:
+    """This class merges the messages a chat receives within a flush window."""
+
+    def __init__(self, deliver, flush_window=0.2, bucket=None, limit=MESSAGE_LIMIT):
+        self.deliver = deliver
+        self.flush_window = flush_window
+        self.bucket = bucket if bucket is not None else TokenBucket()
+        self.limit = limit
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def put(self, text, chat_id, reply_markup=None):
+        """This function queues a message for chat_id."""
+        with self.lock:
+            if chat_id not in self.pending:
+                self.pending[chat_id] = (time.monotonic(), [])
+            self.pending[chat_id][1].append((text, reply_markup))
+        self.wakeup.set()
+
+    def take(self, older_than=None):
+        """This function removes and returns the pending messages to deliver."""
+        with self.lock:
+            chats = [chat_id for chat_id, (queued_at, _) in self.pending.items()
+                     if older_than is None or queued_at <= older_than]
+            return [(chat_id, self.pending.pop(chat_id)[1]) for chat_id in chats]
+
+    def flush(self, older_than=None):
+        """This function delivers the pending messages as few calls per chat."""
+        with self.flush_lock:
+            for chat_id, messages in self.take(older_than):
+                texts = []
+                for text, reply_markup in messages:
+                    if reply_markup is None:
+                        texts.append(text)
+                        continue
+                    # The keyboard goes with the last part of a message that must be split.
+                    chunks = split_message(text, self.limit)
+                    self.send(coalesce(texts, self.limit) + chunks[:-1], chat_id)
+                    texts = []
+                    self.send(chunks[-1:], chat_id, reply_markup)
+                self.send(coalesce(texts, self.limit), chat_id)
+
+    def send(self, texts, chat_id, reply_markup=None):
+        for text in texts:
+            time.sleep(self.bucket.reserve())
+            try:
+                self.deliver(text, chat_id, reply_markup)
+            except Exception as error:
+                print('Could not deliver to chat {}: {!r}'.format(chat_id, error))
+
+    def run(self):
+        while True:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            time.sleep(self.flush_window)
+            self.flush(time.monotonic() - self.flush_window)
+            with self.lock:
+                if self.pending:
+                    self.wakeup.set()
+
+    def start(self):
+        """This function flushes the queue on a background thread."""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        return self
@@ -0,0 +1,266 @@
+"""This module records the bot metrics and exposes them in the Prometheus text format."""
+import collections
+import functools
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from typecheck import contract
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    """This class counts observations in cumulative latency buckets."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def state(self):
+        """This function gets the counts as plain values, to send to another process."""
+        return list(self.counts), self.sum, self.count
+
+    def merge(self, state):
+        """This function adds the counts of another histogram's state."""
+        counts, total, count = state
+        self.counts = [mine + theirs for mine, theirs in zip(self.counts, counts)]
+        self.sum += total
+        self.count += count
+
+    @contract(fraction='float,>=0,<=1', returns='float')
+    def quantile(self, fraction):
+        """This function estimates a quantile as the upper bound of its bucket."""
+        if not self.count:
+            return 0.0
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= fraction * self.count:
+                return bound
+        return float('inf')
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            yield '{}_bucket{} {}'.format(name, format_labels(labels + [('le', le)]), cumulative)
+        yield '{}_sum{} {}'.format(name, format_labels(labels), self.sum)
+        yield '{}_count{} {}'.format(name, format_labels(labels), self.count)
+
+@contract(labels='list(tuple)', returns='str')
+def format_labels(labels):
+    """This function formats Prometheus labels, escaping their values."""
+    if not labels:
+        return ''
+    pairs = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append('{}="{}"'.format(name, value))
+    return '{' + ','.join(pairs) + '}'
+
+class Metrics:
+    """This class keeps every metric of the bot."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.commands = collections.defaultdict(Histogram)
+        self.controller = collections.defaultdict(Histogram)
+        self.http = collections.defaultdict(Histogram)
+        self.chats = collections.Counter()
+        self.db_queries = Histogram()
+        self.updates_pending = 0
+        self.worker_depths = {}
+
+    def observe_command(self, command, chat, seconds):
+        with self.lock:
+            self.commands[command].observe(seconds)
+            if chat is not None:
+                self.chats[chat] += 1
+
+    def observe_controller(self, method, seconds):
+        with self.lock:
+            self.controller[method].observe(seconds)
+
+    def observe_http(self, method, seconds):
+        with self.lock:
+            self.http[method].observe(seconds)
+
+    def observe_query(self, seconds):
+        with self.lock:
+            self.db_queries.observe(seconds)
+
+    def add_pending(self, updates):
+        """This function changes the number of updates received but not yet answered."""
+        with self.lock:
+            self.updates_pending += updates
+
+    @contract(returns='dict')
+    def drain(self):
+        """This function takes the observations made since the last drain, for merge().
+
+        A worker process drains its metrics after every batch, so the process
+        serving /metrics and /stats sees every worker.
+        """
+        with self.lock:
+            state = {'histograms': {name: {key: histogram.state()
+                                           for key, histogram in getattr(self, name).items()}
+                                    for name in ('commands', 'controller', 'http')},
+                     'chats': dict(self.chats),
+                     'db_queries': self.db_queries.state()}
+            self.commands.clear()
+            self.controller.clear()
+            self.http.clear()
+            self.chats.clear()
+            self.db_queries = Histogram()
+        return state
+
+    @contract(state='dict', returns='None')
+    def merge(self, state):
+        """This function adds the observations drained from another process."""
+        with self.lock:
+            for name, histograms in state['histograms'].items():
+                for key, histogram in histograms.items():
+                    getattr(self, name)[key].merge(histogram)
+            self.chats.update(state['chats'])
+            self.db_queries.merge(state['db_queries'])
+
+    def set_worker_depth(self, worker, depth):
+        """This function records how many updates a worker process has yet to answer."""
+        with self.lock:
+            self.worker_depths[worker] = depth
+
+    @contract(returns='str')
+    def render(self):
+        """This function renders every metric in the Prometheus text format."""
+        lines = []
+        with self.lock:
+            for name, help_text, label, histograms in [
+                    ('taskbot_command_seconds', 'Time to answer a bot command.',
+                     'command', self.commands),
+                    ('taskbot_controller_seconds', 'Time spent in a TasksController method.',
+                     'method', self.controller),
+                    ('taskbot_http_request_seconds', 'Latency of the outbound Bot API calls.',
+                     'method', self.http)]:
+                lines.append('# HELP {} {}'.format(name, help_text))
+                lines.append('# TYPE {} histogram'.format(name))
+                for value, histogram in sorted(histograms.items()):
+                    lines.extend(histogram.lines(name, [(label, value)]))
+
+            lines.append('# HELP taskbot_db_query_seconds Time spent in each SQL statement.')
+            lines.append('# TYPE taskbot_db_query_seconds histogram')
+            lines.extend(self.db_queries.lines('taskbot_db_query_seconds', []))
+            lines.append('# HELP taskbot_updates_pending Updates received but not answered yet.')
+            lines.append('# TYPE taskbot_updates_pending gauge')
+            lines.append('taskbot_updates_pending {}'.format(self.updates_pending))
+            lines.append('# HELP taskbot_worker_queue_depth Updates queued to a worker process.')
+            lines.append('# TYPE taskbot_worker_queue_depth gauge')
+            for worker, depth in sorted(self.worker_depths.items()):
+                lines.append('taskbot_worker_queue_depth{} {}'.format(
+                    format_labels([('worker', worker)]), depth))
+        return '\n'.join(lines) + '\n'
+
+    @contract(top='int,>0', returns='str')
+    def summary(self, top=5):
+        """This function summarizes the hottest commands and chats for /stats."""
+        with self.lock:
+            text = '*Commands*\n'
+            hottest = sorted(self.commands.items(), key=lambda item: -item[1].count)[:top]
+            for command, histogram in hottest:
+                text += '{} {}x p50 {:.0f}ms p95 {:.0f}ms\n'.format(
+                    command, histogram.count, histogram.quantile(0.5) * 1000,
+                    histogram.quantile(0.95) * 1000)
+
+            text += '\n*Chats*\n'
+            for chat, count in self.chats.most_common(top):
+                text += '{} {} commands\n'.format(chat, count)
+
+            text += '\n*Database*\n{} queries, {:.1f}ms total\n'.format(
+                self.db_queries.count, self.db_queries.sum * 1000)
+
+            text += '\n*Bot API*\n'
+            for method, histogram in sorted(self.http.items()):
+                text += '{} {}x p95 {:.0f}ms\n'.format(
+                    method, histogram.count, histogram.quantile(0.95) * 1000)
+
+            text += '\n{} updates pending\n'.format(self.updates_pending)
+            for worker, depth in sorted(self.worker_depths.items()):
+                text += 'worker {} has {} queued\n'.format(worker, depth)
+        return text
+
+    def track_sql(self, engine):
+        """This function times every SQL statement run on engine."""
+        from sqlalchemy import event
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            self.observe_query(time.perf_counter() - conn.info['metrics_started'].pop())
+
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+
+    def instrument(self, *names):
+        """This function makes a class decorator that times the methods called names.
+
+        Only the entry points should be named: every call takes the lock,
+        and a helper run once per task would swamp the histograms.
+        """
+        def decorate(cls):
+            for name in names:
+                attribute = vars(cls)[name]
+                if isinstance(attribute, classmethod):
+                    setattr(cls, name, classmethod(self.timed(name, attribute.__func__)))
+                else:
+                    setattr(cls, name, self.timed(name, attribute))
+            return cls
+        return decorate
+
+    def timed(self, name, function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.observe_controller(name, time.perf_counter() - start)
+        return wrapper
+
+    def serve(self, port, host='127.0.0.1'):
+        """This function serves /metrics on a background thread."""
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                content = metrics.render().encode('utf8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+metrics = Metrics()
@@ -0,0 +1,132 @@
+"""This module keeps the overdue flags current and reminds chats of due tasks."""
+import datetime
+import heapq
+import threading
+import time
+
+import sqlalchemy
+
+import db
+from db import Task
+from typecheck import contract
+
+class OverdueScheduler:
+    """This class sweeps the overdue flags at day rollover and sends due-soon reminders."""
+
+    REMINDER_TIME = datetime.time(9, 0)
+    REMINDER_ADVANCE = datetime.timedelta(days=1)
+    REFRESH_INTERVAL = datetime.timedelta(minutes=10)
+
+    def __init__(self, notify, now=datetime.datetime.now, on_sweep=None):
+        self.notify = notify
+        self.now = now
+        self.on_sweep = on_sweep
+        self.today = None
+        self.refreshed_at = None
+        self.reminders = []
+        self.reminded = set()
+        self.thread = None
+
+    @contract(returns='int')
+    def sweep(self, today):
+        """This function flags the tasks that became overdue with a single UPDATE.
+
+        Only a range of the due date index is read. A flag never has to be
+        cleared here, since set_duedate clears it whenever the date moves.
+        """
+        statement = sqlalchemy.update(Task).where(
+            Task.duedate < today, Task.overdue.isnot(True)).values(overdue=True)
+
+        session = db.Session()
+        try:
+            result = session.execute(statement)
+            session.commit()
+        finally:
+            session.close()
+        return result.rowcount
+
+    def remind_at(self, duedate):
+        """This function gets when to remind a chat of a task due on duedate."""
+        return datetime.datetime.combine(duedate, self.REMINDER_TIME) - self.REMINDER_ADVANCE
+
+    @contract(returns='int')
+    def refresh(self, today):
+        """This function rebuilds the heap of reminders for the tasks due soon."""
+        last_day = today + self.REMINDER_ADVANCE
+        session = db.Session()
+        try:
+            query = session.query(Task.chat, Task.id, Task.duedate).filter(
+                Task.duedate >= today, Task.duedate <= last_day, Task.status != 'DONE')
+            rows = query.all()
+        finally:
+            session.close()
+
+        self.reminders = [(self.remind_at(duedate), chat, task_id, duedate)
+                          for chat, task_id, duedate in rows
+                          if (chat, task_id, duedate) not in self.reminded]
+        heapq.heapify(self.reminders)
+        return len(self.reminders)
+
+    @contract(returns='int')
+    def remind(self, now):
+        """This function sends the reminders that are due by now."""
+        sent = 0
+        session = db.Session()
+        try:
+            while self.reminders and self.reminders[0][0] <= now:
+                _, chat, task_id, duedate = heapq.heappop(self.reminders)
+                key = (chat, task_id, duedate)
+                if key in self.reminded:
+                    continue
+                self.reminded.add(key)
+
+                task = session.query(Task).filter_by(id=task_id, chat=chat).one_or_none()
+                if task is None or task.duedate != duedate or task.status == 'DONE':
+                    continue
+
+                self.notify('\U000023F0 Task [[{}]] {} is due on {}'.format(
+                    task.id, task.name, duedate.strftime('%d/%m/%Y')), chat)
+                sent += 1
+        finally:
+            session.close()
+        return sent
+
+    @contract(returns='float')
+    def tick(self):
+        """This function does the pending work and returns how long to sleep."""
+        now = self.now()
+        if now.date() != self.today:
+            self.today = now.date()
+            if self.sweep(self.today) and self.on_sweep is not None:
+                self.on_sweep()
+            self.reminded = set(key for key in self.reminded if key[2] >= self.today)
+            self.refresh(self.today)
+            self.refreshed_at = now
+        elif now - self.refreshed_at >= self.REFRESH_INTERVAL:
+            self.refresh(self.today)
+            self.refreshed_at = now
+
+        self.remind(now)
+
+        wakeup = min(datetime.datetime.combine(self.today + datetime.timedelta(days=1),
+                                               datetime.time()),
+                     self.refreshed_at + self.REFRESH_INTERVAL)
+        if self.reminders:
+            wakeup = min(wakeup, self.reminders[0][0])
+        return max(0.0, (wakeup - now).total_seconds())
+
+    def run(self):
+        while True:
+            try:
+                delay = self.tick()
+            except Exception as error:
+                print('Overdue scheduler failed: {!r}'.format(error))
+                delay = 60.0
+            time.sleep(delay)
+
+    def start(self):
+        """This function runs the scheduler on a background thread."""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        return self
@@ -0,0 +1,32 @@
+"""This module reads the bot settings from taskbot.cfg and the environment.
+
+A setting named database_url is read from the TASKBOT_DATABASE_URL
+environment variable or, failing that, from the [taskbot] section of the
+file named by TASKBOT_CONFIG (taskbot.cfg by default).
+"""
+import configparser
+import os
+
+SECTION = 'taskbot'
+
+parser = configparser.ConfigParser()
+parser.read(os.environ.get('TASKBOT_CONFIG', 'taskbot.cfg'))
+
+def get(name, default=None):
+    """This function gets a setting, the environment overriding the config file."""
+    value = os.environ.get('TASKBOT_' + name.upper())
+    if value is None:
+        value = parser.get(SECTION, name, fallback=default)
+    return value
+
+def get_int(name, default):
+    """This function gets an integer setting."""
+    return int(get(name, str(default)))
+
+def get_float(name, default):
+    """This function gets a float setting."""
+    return float(get(name, str(default)))
+
+def get_bool(name, default):
+    """This function gets a boolean setting such as 1/0, true/false or on/off."""
+    return get(name, str(default)).strip().lower() in ('1', 'true', 'yes', 'on')
@@ -0,0 +1,221 @@
+"""This module shards the updates by chat across worker processes."""
+import multiprocessing
+import queue
+import signal
+import threading
+
+from typecheck import contract
+
+import settings
+from command_router import Command, get_chat_id
+from message_queue import TokenBucket
+from metrics import metrics
+# Importing the Api here also creates the schema before any worker starts.
+from taskbot_api import Api
+
+BATCH_SIZE = 100
+# Queued to every worker when the overdue sweep changed the boards they may have cached.
+CLEAR_CACHES = 'clear_caches'
+# Answered by the dispatcher itself, which merges the metrics of every worker.
+LOCAL_COMMANDS = ('/stats',)
+
+def run_worker(index, updates, depth, reports, token, api_url, workers):
+    """This function answers the updates of one shard on its own Api and database session.
+
+    The metrics it records are sent to the dispatcher on reports after
+    every batch.
+    """
+    api = Api(token=token, api_url=api_url, background=False)
+    # The workers share the bot's sendMessage budget.
+    api.outbox.bucket = TokenBucket(rate=api.outbox.bucket.rate / workers,
+                                    capacity=max(1, api.outbox.bucket.capacity // workers))
+    stopping = False
+    while not stopping:
+        batch = []
+        update = updates.get()
+        while update is not None:
+            if update == CLEAR_CACHES:
+                api.controller.list_cache.clear()
+            else:
+                batch.append(update)
+            if len(batch) == BATCH_SIZE:
+                break
+            try:
+                update = updates.get_nowait()
+            except queue.Empty:
+                break
+        else:
+            # None is queued by restart() and stop(), behind the updates to answer.
+            stopping = True
+        if not batch:
+            continue
+        try:
+            api.handle_updates({'result': batch})
+        except Exception as error:
+            print('Worker {} failed on updates: {!r}'.format(index, error))
+        finally:
+            with depth.get_lock():
+                depth.value -= len(batch)
+            reports.put(metrics.drain())
+
+class Shard:
+    """This class is a worker process with the queue of the chats hashed to it."""
+
+    def __init__(self, index, context, reports):
+        self.index = index
+        self.context = context
+        self.reports = reports
+        self.updates = context.Queue()
+        self.depth = context.Value('i', 0)
+        self.process = None
+        self.restarting = False
+
+    def start(self, token, api_url, workers):
+        self.process = self.context.Process(
+            target=run_worker, name='taskbot-worker-{}'.format(self.index),
+            args=(self.index, self.updates, self.depth, self.reports, token, api_url, workers),
+            daemon=True)
+        self.process.start()
+
+    def put(self, update):
+        with self.depth.get_lock():
+            self.depth.value += 1
+        self.updates.put(update)
+
+class ShardedDispatcher:
+    """This class hands each update to the worker of its chat, keeping every chat in order.
+
+    It has the handle_updates of Api, so the poller and the webhook feed it
+    the same way. Dead workers are started again, and restart() replaces a
+    worker only after it answered the updates already queued to it.
+
+    Given the api of the receiving process, the dispatcher answers /stats
+    there, with the metrics of every worker merged in. It also passes that
+    api's overdue sweeps on to the workers' list caches.
+    """
+
+    SUPERVISE_INTERVAL = 1.0
+
+    def __init__(self, workers=None, token=None, api_url=None, context=None, api=None):
+        self.workers = workers or settings.get_int('processes', multiprocessing.cpu_count())
+        self.api = api
+        self.token = token if api is None else api.token
+        self.api_url = api_url if api is None else api.api_url
+        self.context = context or multiprocessing.get_context('spawn')
+        self.reports = self.context.Queue()
+        self.shards = [Shard(index, self.context, self.reports) for index in range(self.workers)]
+        if api is not None:
+            api.overdue_scheduler.on_sweep = self.clear_caches
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @classmethod
+    @contract(update='dict', returns='int|None')
+    def get_chat_id(cls, update):
+        """This function gets the chat of an update."""
+        return get_chat_id(update)
+
+    @contract(update='dict', returns='int')
+    def shard_of(self, update):
+        """This function gets the index of the worker answering an update."""
+        chat = self.get_chat_id(update)
+        return abs(chat or 0) % self.workers
+
+    def dispatch(self, update):
+        """This function queues an update behind the previous ones of its chat."""
+        if self.api is not None:
+            command = Command.parse(update)
+            if command is not None and command.name in LOCAL_COMMANDS:
+                self.collect()
+                self.api.handle_updates({'result': [update]})
+                return
+
+        shard = self.shards[self.shard_of(update)]
+        shard.put(update)
+        metrics.set_worker_depth(shard.index, shard.depth.value)
+
+    @contract(updates='dict', returns='NoneType')
+    def handle_updates(self, updates):
+        """This function dispatches the updates to the workers."""
+        for update in updates["result"]:
+            self.dispatch(update)
+
+    def collect(self):
+        """This function merges the metrics the workers sent since the last call."""
+        for shard in self.shards:
+            metrics.set_worker_depth(shard.index, shard.depth.value)
+        while True:
+            try:
+                metrics.merge(self.reports.get_nowait())
+            except queue.Empty:
+                return
+
+    def clear_caches(self):
+        """This function drops the cached /list of every process, after the overdue sweep."""
+        if self.api is not None:
+            self.api.controller.list_cache.clear()
+        for shard in self.shards:
+            shard.updates.put(CLEAR_CACHES)
+
+    @contract(returns='list(int)')
+    def depths(self):
+        """This function gets how many updates each worker has yet to answer."""
+        return [shard.depth.value for shard in self.shards]
+
+    @contract(index='int,>=0', returns='None')
+    def restart(self, index):
+        """This function replaces a worker once it answered the updates queued to it."""
+        shard = self.shards[index]
+        with self.lock:
+            shard.restarting = True
+            shard.updates.put(None)
+
+    def restart_all(self):
+        """This function replaces every worker, one after the other."""
+        for shard in self.shards:
+            process = shard.process
+            self.restart(shard.index)
+            process.join()
+            self.supervise()
+
+    def restart_on_hangup(self):
+        """This function makes SIGHUP replace every worker. Call it from the main thread."""
+        signal.signal(signal.SIGHUP, lambda signum, frame: threading.Thread(
+            target=self.restart_all, daemon=True).start())
+
+    def supervise(self):
+        """This function starts again the workers that exited and merges their metrics."""
+        self.collect()
+        with self.lock:
+            for shard in self.shards:
+                if shard.process.is_alive():
+                    continue
+                if not shard.restarting:
+                    print('Worker {} exited with {}, starting it again'.format(
+                        shard.index, shard.process.exitcode))
+                shard.restarting = False
+                shard.start(self.token, self.api_url, self.workers)
+
+    def run(self):
+        while not self.stopped.wait(self.SUPERVISE_INTERVAL):
+            self.supervise()
+
+    def start(self):
+        """This function starts the workers and their supervisor."""
+        for shard in self.shards:
+            shard.start(self.token, self.api_url, self.workers)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """This function lets the workers answer their queued updates and stops them."""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        for shard in self.shards:
+            shard.updates.put(None)
+        for shard in self.shards:
+            shard.process.join(timeout)
+        self.collect()
@@ -2,15 +2,23 @@
 # -*- coding: utf-8 -*-
 
 """This code controls a telegram bot. This bot is a kanban."""
+import argparse
 import time
 
+import settings
+from metrics import metrics
 from taskbot_api import Api
-     
-def main():
-    """This function controls the bot. """
-    
+
+def poll(workers=1):
+    """This function polls the updates, handling them or sharding them to workers."""
+
     last_update_id = None
     api = Api()
+    handler = api
+    if workers > 1:
+        import sharding
+        handler = sharding.ShardedDispatcher(workers, api=api).start()
+        handler.restart_on_hangup()
 
     while True:
         print("Updates")
@@ -18,9 +26,34 @@ def main():
 
         if updates["result"]:
             last_update_id = api.get_last_update_id(updates) + 1
-            api.handle_updates(updates)
+            handler.handle_updates(updates)
 
         time.sleep(0.5)
 
+def main():
+    """This function controls the bot. """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--mode', choices=['async', 'polling', 'webhook'], default='async',
+                        help='async processes chats concurrently, polling one update at a '
+                             'time and webhook receives the updates Telegram posts')
+    parser.add_argument('--workers', type=int, default=settings.get_int('processes', 1),
+                        help='processes the polling and webhook modes shard the chats across')
+    args = parser.parse_args()
+    if args.mode == 'async' and args.workers > 1:
+        parser.error('--workers needs the polling or the webhook mode')
+
+    metrics_port = settings.get_int('metrics_port', 0)
+    if metrics_port:
+        metrics.serve(metrics_port)
+
+    if args.mode == 'async':
+        import taskbot_async
+        taskbot_async.main()
+    elif args.mode == 'webhook':
+        import webhook
+        webhook.main(args.workers)
+    else:
+        poll(args.workers)
+
 if __name__ == '__main__':
     main()
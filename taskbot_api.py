@@ -1,32 +1,66 @@
-import json
-import urllib
-import requests
+import datetime
+import tempfile
+import time
 
-from contracts import contract
+from typecheck import contract
 
+import db
+import settings
+from board_transfer import BoardImportError, BoardTransfer
+from command_router import Command, CommandRouter, Reply, parse_updates
+from http_session import HttpSession
+from message_queue import MessageQueue
+from metrics import metrics
+from overdue_scheduler import OverdueScheduler
 from tasks_controller import TasksController
-from github_integration import GithubIntegration
 
 class Api:
     """This class controls the API."""
-    def __init__(self):
-        self.token = self.get_token()
-        self.url = "https://api.telegram.org/bot{}/".format(self.token)
+
+    POLL_TIMEOUT = 100
+    API_URL = settings.get('api_url', 'https://api.telegram.org')
+    ADMINS = [int(admin) for admin in (settings.get('admins') or '').split(',') if admin.strip()]
+
+    def __init__(self, token=None, api_url=None, background=True):
+        self.token = token or self.get_token()
+        self.api_url = (api_url or self.API_URL).rstrip('/')
+        self.url = "{}/bot{}/".format(self.api_url, self.token)
+        self.http = HttpSession()
         self.controller = TasksController()
+        self.board_transfer = BoardTransfer()
+        self.outbox = MessageQueue(self.deliver_message).start()
+        # Only one process may drain the GitHub outbox and sweep the due dates.
+        self.github_outbox = None
+        if settings.get_bool('github_issues', True):
+            from github_outbox import GithubOutbox
+            self.github_outbox = GithubOutbox(self.send_message)
+            if background:
+                self.github_outbox.start()
+        self.overdue_scheduler = OverdueScheduler(
+            self.send_message, on_sweep=self.controller.list_cache.clear)
+        if background:
+            self.overdue_scheduler.start()
         self.help = """
                     /new NOME
                     /todo ID
                     /doing ID
                     /done ID
-                    /delete ID
+                    /delete ID [subtree]
                     /list
                     /rename ID NOME
                     /dependson ID ID...
-                    /duplicate ID
+                    /blocked ID
+                    /ready
+                    /search TEXT
+                    /report
+                    /export
+                    /import (caption of a sent export file, or a reply to one)
+                    /duplicate ID [subtree]
                     /priority ID PRIORITY{low, medium, high}
                     /duedate ID DATE{dd/mm/yyyy}
                     /help
                     """
+        self.router = self.build_router()
                     
     @classmethod
     @contract(returns='str')
@@ -37,38 +71,89 @@ class Api:
             token = token_file.read()
             return token
 
-    @classmethod
-    @contract(url='str', returns='str')
-    def get_url(cls, url):
-        """This function gets the bot url."""
-        response = requests.get(url)
-        content = response.content.decode("utf8")
-        return content
-    
-    @contract(url='str', returns='dict')
-    def get_json_from_url(self, url):
-        """This function gets de json from url."""
-        content = self.get_url(url)
-        json_response = json.loads(content)
-        return json_response
+    @contract(method='str', payload='dict', returns='dict')
+    def call(self, method, payload, read_timeout=None):
+        """This function calls a Bot API method with a JSON body."""
+        start = time.perf_counter()
+        try:
+            response = self.http.post_json(self.url + method, payload, read_timeout)
+        finally:
+            metrics.observe_http(method, time.perf_counter() - start)
+        return response.json()
 
-    # @contract(offset='NoneType', returns='dict')
+    @contract(offset='int|None', returns='dict')
     def get_updates(self, offset=None):
         """This function gets the bot updates."""
-        url = self.url + "getUpdates?timeout=100"
+        payload = {'timeout': self.POLL_TIMEOUT}
         if offset:
-            url += "&offset={}".format(offset)
-        json_response = self.get_json_from_url(url)
+            payload['offset'] = offset
+        json_response = self.call('getUpdates', payload, read_timeout=self.POLL_TIMEOUT + 30)
         return json_response
 
-    @contract(text='str', chat_id='int', reply_markup='NoneType', returns='None')
+    @contract(url='str', secret_token='str', returns='dict')
+    def set_webhook(self, url, secret_token):
+        """This function makes Telegram post the updates to url instead of queueing them."""
+        return self.call('setWebhook', {'url': url, 'secret_token': secret_token})
+
+    @contract(text='str', chat_id='int', reply_markup='dict|None', returns='None')
     def send_message(self, text, chat_id, reply_markup=None):
+        """This function queues messages for the user."""
+        self.outbox.put(text, chat_id, reply_markup)
+
+    @contract(text='str', chat_id='int', reply_markup='dict|None', returns='None')
+    def deliver_message(self, text, chat_id, reply_markup=None):
         """This function sends messages for the user."""
-        text = urllib.parse.quote_plus(text)
-        url = self.url + "sendMessage?text={}&chat_id={}&parse_mode=Markdown".format(text, chat_id)
+        payload = {'chat_id': chat_id, 'text': text, 'parse_mode': 'Markdown'}
         if reply_markup:
-            url += "&reply_markup={}".format(reply_markup)
-        self.get_url(url)
+            payload['reply_markup'] = reply_markup
+        self.call('sendMessage', payload)
+
+    @contract(chat_id='int', filename='str', caption='str', returns='dict')
+    def send_document(self, chat_id, filename, document, caption=''):
+        """This function uploads an open file to the chat as a document."""
+        start = time.perf_counter()
+        try:
+            response = self.http.post_file(self.url + 'sendDocument',
+                                           {'chat_id': chat_id, 'caption': caption},
+                                           {'document': (filename, document)})
+        finally:
+            metrics.observe_http('sendDocument', time.perf_counter() - start)
+        return response.json()
+
+    @contract(file_id='str', returns='None')
+    def download_file(self, file_id, destination):
+        """This function streams a file sent to the bot into destination."""
+        file_path = self.call('getFile', {'file_id': file_id})['result']['file_path']
+        url = '{}/file/bot{}/{}'.format(self.api_url, self.token, file_path)
+        start = time.perf_counter()
+        try:
+            with self.http.request('GET', url, stream=True) as response:
+                response.raise_for_status()
+                for chunk in response.iter_content(64 * 1024):
+                    destination.write(chunk)
+        finally:
+            metrics.observe_http('getFile', time.perf_counter() - start)
+        destination.seek(0)
+
+    @classmethod
+    @contract(chat_id='int', returns='tuple')
+    def edit_call(cls, reply, chat_id):
+        """This function gets the method and payload that edit a message into reply."""
+        payload = {'chat_id': chat_id, 'message_id': reply.message_id, 'text': reply.text,
+                   'parse_mode': 'Markdown'}
+        if reply.reply_markup:
+            payload['reply_markup'] = reply.reply_markup
+        return 'editMessageText', payload
+
+    @contract(chat_id='int', returns='None')
+    def reply(self, response, chat_id):
+        """This function sends a response, editing the message a Reply points to."""
+        if not isinstance(response, Reply):
+            self.send_message(response, chat_id)
+        elif response.message_id is None:
+            self.send_message(response.text, chat_id, response.reply_markup)
+        else:
+            self.call(*self.edit_call(response, chat_id))
 
     @classmethod
     @contract(updates='dict', returns='int')
@@ -80,77 +165,156 @@ class Api:
 
         return max(update_ids)
 
-    @contract(msg='str', chat='int', status='str', returns='NoneType')
+    @contract(msg='str', chat='int', status='str', returns='list')
     def handle_status_change(self, msg, chat, status):
         response_list = self.controller.change_multiple(msg, chat, status)
-        for response in response_list:
-            self.send_message(response, chat)
+        return response_list
+
+    def build_router(self):
+        """This function builds the table routing each command to its handler."""
+        router = CommandRouter(self.unknown_command)
+        router.register('/new', self.new_task)
+        router.register('/list', self.list_tasks)
+        router.register('/page', self.list_page)
+        for name, method in [('/rename', self.controller.rename_task),
+                             ('/duplicate', self.controller.duplicate_task),
+                             ('/delete', self.controller.delete_task),
+                             ('/dependson', self.controller.depends_on),
+                             ('/blocked', self.controller.blocked_tasks),
+                             ('/ready', self.controller.ready_tasks),
+                             ('/search', self.controller.search_tasks),
+                             ('/report', self.controller.flow_report),
+                             ('/priority', self.controller.set_priority),
+                             ('/duedate', self.controller.set_duedate)]:
+            router.register(name, lambda command, method=method: method(command.text, command.chat))
+        for name, status in [('/todo', 'TODO'), ('/doing', 'DOING'), ('/done', 'DONE')]:
+            router.register(name, lambda command, status=status: self.handle_status_change(
+                command.text, command.chat, status))
+        router.register('/start', lambda command: ["Welcome! Here is a list of things you can do.",
+                                                   self.help])
+        router.register('/help', lambda command: ["Here is a list of things you can do.",
+                                                  self.help])
+        router.register('/stats', self.stats)
+        router.register('/export', self.export_board)
+        router.register('/import', self.import_board)
+        return router
+
+    def new_task(self, command):
+        response = self.controller.new_task(command.text, command.chat)
+        if self.github_outbox is not None:
+            self.github_outbox.enqueue(command.chat, self.controller.task_names(command.text))
+        return response
+
+    def list_tasks(self, command):
+        """This function lists a board whole if its tree fits one message, else by pages.
+
+        A paged board gets only the tree, since its status and priority
+        lists would cost as much as the whole board. Either answer is
+        cached for the board's version, so an unchanged board is not
+        rendered again.
+        """
+        today = datetime.date.today()
+        list_cache = self.controller.list_cache
+        version = list_cache.version(command.chat)
+        responses = list_cache.get(command.chat, today)
+        if responses is not None:
+            return responses
+
+        responses = self.controller.list_whole(command.chat)
+        if responses is None:
+            page = self.controller.list_page(command.chat)
+            responses = [Reply(page['text'], self.page_keyboard(page))]
+        list_cache.put(command.chat, today, version, responses)
+        return responses
+
+    def list_page(self, command):
+        """This function answers the Previous and Next buttons of a paged /list."""
+        words = command.text.split()
+        if len(words) != 2 or words[0] not in ('after', 'before') or not words[1].isdigit():
+            return "I'm sorry dave. I'm afraid I can't do that."
+
+        page = self.controller.list_page(command.chat, **{words[0]: int(words[1])})
+        message_id = None
+        if 'callback_query' in command.update:
+            message_id = command.update['callback_query']['message']['message_id']
+        return Reply(page['text'], self.page_keyboard(page), message_id)
+
+    @classmethod
+    @contract(page='dict', returns='dict')
+    def page_keyboard(cls, page):
+        """This function builds the inline keyboard that moves between the pages."""
+        buttons = []
+        if page['has_previous'] and page['first'] is not None:
+            buttons.append({'text': '\u25C0 Previous',
+                            'callback_data': '/page before {}'.format(page['first'])})
+        if page['has_next']:
+            buttons.append({'text': 'Next \u25B6',
+                            'callback_data': '/page after {}'.format(page['last'])})
+        return {'inline_keyboard': [buttons]}
+
+    def export_board(self, command):
+        """This function sends the chat's board as a JSON lines file."""
+        with tempfile.TemporaryFile() as document:
+            tasks, dependencies = self.board_transfer.export_board(command.chat, document)
+            self.send_document(command.chat, 'board-{}.jsonl'.format(command.chat), document)
+        return "Exported {} tasks and {} dependencies".format(tasks, dependencies)
+
+    def import_board(self, command):
+        """This function loads an exported file, sent with /import or replied to."""
+        message = command.update.get('message') or {}
+        document = message.get('document') or (message.get('reply_to_message') or {}).get(
+            'document')
+        if document is None:
+            return "Send an exported file with /import as its caption, or reply to one"
+
+        with tempfile.TemporaryFile() as board:
+            self.download_file(document['file_id'], board)
+            try:
+                tasks, dependencies = self.board_transfer.import_board(command.chat, board)
+            except BoardImportError as error:
+                return "Import failed at line {}: {}".format(error.line, error.reason)
+        return "Imported {} tasks and {} dependencies".format(tasks, dependencies)
+
+    def stats(self, command):
+        """This function summarizes the metrics for the admins only."""
+        if command.sender not in self.ADMINS:
+            return self.unknown_command(command)
+        return metrics.summary()
+
+    def unknown_command(self, command):
+        return "I'm sorry dave. I'm afraid I can't do that."
+
+    @contract(returns='list')
+    def process_command(self, command):
+        """This function answers a command on its own database session."""
+        start = time.perf_counter()
+        try:
+            return self.router.route(command)
+        finally:
+            db.session.remove()
+            if 'callback_query' in command.update:
+                self.call('answerCallbackQuery',
+                          {'callback_query_id': command.update['callback_query']['id']})
+            metrics.observe_command(self.router.label(command.name), command.chat,
+                                    time.perf_counter() - start)
+
+    @contract(update='dict', returns='tuple')
+    def process_update(self, update):
+        """This function parses an update and answers its command."""
+        command = Command.parse(update)
+        if command is None:
+            print('Can\'t process! {}'.format(update))
+            return None, []
+        return command.chat, self.process_command(command)
 
     @contract(updates='dict', returns='NoneType')
     def handle_updates(self, updates):
-        """This function controls the updates."""
-        for update in updates["result"]:
-            if 'message' in update:
-                message = update['message']
-            elif 'edited_message' in update:
-                message = update['edited_message']
-            else:
-                print ('Can\'t process! {}').format(update)
-                return
-
-            print(message)
-
-            command = message["text"].split(" ", 1)[0]
-            msg = ''
-            if len(message["text"].split(" ", 1)) > 1:
-                msg = message["text"].split(" ", 1)[1].strip()
-
-            chat = message["chat"]["id"]
-
-            print(command, msg, chat)
-
-            if command == '/new':
-                response = self.controller.new_task(msg, chat)
-                github = GithubIntegration()
-                github_response = github.create_issue(msg, '')
-                self.send_message(response, chat)
-                self.send_message(github_response, chat)                
-            elif command == '/rename':
-                response = self.controller.rename_task(msg, chat)
-                self.send_message(response, chat)
-            elif command == '/duplicate':
-                response = self.controller.duplicate_task(msg, chat)
-                self.send_message(response, chat)
-            elif command == '/delete':
-                response = self.controller.delete_task(msg, chat)
-                self.send_message(response, chat)
-            elif command == '/todo':
-                status = 'TODO'
-                self.handle_status_change(msg, chat, status)
-            elif command == '/doing':
-                status = 'DOING'
-                self.handle_status_change(msg, chat, status)
-            elif command == '/done':
-                status = 'DONE'
-                self.handle_status_change(msg, chat, status)
-            elif command == '/list':
-                response_list = self.controller.list_tasks(msg, chat)
-                for response in response_list:
-                    self.send_message(response, chat)
-            elif command == '/dependson':
-                response = self.controller.depends_on(msg, chat)
-                self.send_message(response, chat)
-            elif command == '/priority':
-                response = self.controller.set_priority(msg, chat)
-                self.send_message(response, chat)
-            elif command == '/duedate':
-                response = self.controller.set_duedate(msg, chat)
-                self.send_message(response, chat)
-            elif command == '/start':
-                self.send_message("Welcome! Here is a list of things you can do.", chat)
-                self.send_message(self.help, chat)
-            elif command == '/help':
-                self.send_message("Here is a list of things you can do.", chat)
-                self.send_message(self.help, chat)
-            else:
-                self.send_message("I'm sorry dave. I'm afraid I can't do that.", chat)
+        """This function answers a batch of updates, one failing update not stopping the rest."""
+        metrics.add_pending(len(updates["result"]))
+        try:
+            commands = parse_updates(updates["result"])
+            for command, responses in self.router.answer(commands, self.process_command):
+                self.router.deliver(command, responses, self.reply)
+            self.outbox.flush()
+        finally:
+            metrics.add_pending(-len(updates["result"]))
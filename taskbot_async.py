@@ -0,0 +1,188 @@
+"""This module runs the bot on asyncio, processing the chats concurrently."""
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+
+from typecheck import contract
+
+import settings
+from command_router import Reply, get_chat_id
+from http_session import HttpSession
+from message_queue import TokenBucket, coalesce, split_message
+from metrics import metrics
+from taskbot_api import Api
+
+class AsyncBot:
+    """This class polls the updates and gives each chat its own ordered worker."""
+
+    POLL_TIMEOUT = 100
+    MAX_BACKOFF = 30
+
+    def __init__(self, api=None, executor=None, max_retries=None, backoff=None):
+        self.api = api if api is not None else Api()
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=settings.get_int('workers', 4))
+        self.executor = executor
+        self.http = None
+        self.max_retries = HttpSession.MAX_RETRIES if max_retries is None else max_retries
+        self.backoff = HttpSession.BACKOFF if backoff is None else backoff
+        self.bucket = TokenBucket()
+        self.chat_queues = {}
+        self.chat_workers = {}
+
+    @classmethod
+    @contract(update='dict', returns='int|None')
+    def get_chat_id(cls, update):
+        """This function gets the chat of an update."""
+        return get_chat_id(update)
+
+    async def call(self, method, payload):
+        """This function calls a Bot API method, retrying like HttpSession.
+
+        429, 5xx and connection errors are retried with exponential backoff,
+        waiting retry_after when Telegram gives it. An answer that is still
+        not JSON after the retries raises ValueError.
+        """
+        attempt = 0
+        while True:
+            delay = self.backoff * 2 ** attempt
+            start = time.perf_counter()
+            try:
+                async with self.http.post(self.api.url + method, json=payload) as response:
+                    status = response.status
+                    headers = response.headers
+                    text = await response.text()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt >= self.max_retries:
+                    raise
+            else:
+                try:
+                    body = json.loads(text)
+                except ValueError:
+                    body = None
+                if status not in HttpSession.RETRY_STATUSES or attempt >= self.max_retries:
+                    if body is None:
+                        raise ValueError('{} answered {} without JSON'.format(method, status))
+                    return body
+                retry_after = HttpSession.parse_retry_after(body, headers)
+                if retry_after is not None:
+                    delay = retry_after
+            finally:
+                metrics.observe_http(method, time.perf_counter() - start)
+
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def get_updates(self, offset=None):
+        """This function long polls the bot updates."""
+        payload = {'timeout': self.POLL_TIMEOUT}
+        if offset:
+            payload['offset'] = offset
+        return await self.call('getUpdates', payload)
+
+    async def send_message(self, text, chat_id, reply_markup=None):
+        """This function sends messages for the user."""
+        payload = {'chat_id': chat_id, 'text': text, 'parse_mode': 'Markdown'}
+        if reply_markup:
+            payload['reply_markup'] = reply_markup
+        response = await self.call('sendMessage', payload)
+        if not response.get('ok'):
+            raise RuntimeError('sendMessage failed: {}'.format(response.get('description')))
+
+    def dispatch(self, update):
+        """This function queues an update behind the previous ones of its chat."""
+        chat = self.get_chat_id(update)
+        if chat is None:
+            print('Can\'t process! {}'.format(update))
+            return
+
+        queue = self.chat_queues.get(chat)
+        if queue is None:
+            queue = asyncio.Queue()
+            self.chat_queues[chat] = queue
+            self.chat_workers[chat] = asyncio.ensure_future(self.chat_worker(chat, queue))
+        queue.put_nowait(update)
+        metrics.add_pending(1)
+
+    @classmethod
+    @contract(responses='list', returns='list')
+    def deliveries(cls, responses):
+        """This function coalesces the plain texts between the Replies, which go alone."""
+        deliveries = []
+        texts = []
+        for response in responses:
+            if isinstance(response, Reply) and response.message_id is None:
+                # The keyboard goes with the last part of a message that must be split.
+                chunks = split_message(response.text)
+                deliveries += coalesce(texts) + chunks[:-1] + [response._replace(text=chunks[-1])]
+                texts = []
+            elif isinstance(response, Reply):
+                deliveries += coalesce(texts) + [response]
+                texts = []
+            else:
+                texts.append(response)
+        return deliveries + coalesce(texts)
+
+    async def chat_worker(self, chat, queue):
+        """This function processes the updates of one chat in order."""
+        loop = asyncio.get_event_loop()
+        while not queue.empty():
+            responses = []
+            while not queue.empty():
+                update = queue.get_nowait()
+                try:
+                    _, update_responses = await loop.run_in_executor(
+                        self.executor, self.api.process_update, update)
+                    responses += update_responses
+                except Exception as error:
+                    print('Update {} failed: {!r}'.format(update.get('update_id'), error))
+                finally:
+                    metrics.add_pending(-1)
+
+            for response in self.deliveries(responses):
+                await asyncio.sleep(self.bucket.reserve())
+                try:
+                    if not isinstance(response, Reply):
+                        await self.send_message(response, chat)
+                    elif response.message_id is None:
+                        await self.send_message(response.text, chat, response.reply_markup)
+                    else:
+                        await self.call(*self.api.edit_call(response, chat))
+                except Exception as error:
+                    print('Could not deliver to chat {}: {!r}'.format(chat, error))
+
+        del self.chat_queues[chat]
+        del self.chat_workers[chat]
+
+    async def run(self):
+        """This function controls the bot."""
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=self.POLL_TIMEOUT + 30)
+        async with aiohttp.ClientSession(timeout=timeout) as self.http:
+            last_update_id = None
+            backoff = 0
+            while True:
+                try:
+                    updates = await self.get_updates(last_update_id)
+                    if not updates.get('ok') or 'result' not in updates:
+                        raise ValueError(updates.get('description', updates))
+                    backoff = 0
+                except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as error:
+                    backoff = min(self.MAX_BACKOFF, backoff * 2 or 1)
+                    print('getUpdates failed: {!r}, retrying in {}s'.format(error, backoff))
+                    await asyncio.sleep(backoff)
+                    continue
+
+                if updates["result"]:
+                    last_update_id = self.api.get_last_update_id(updates) + 1
+                    for update in updates["result"]:
+                        self.dispatch(update)
+
+def main():
+    """This function runs the asyncio bot."""
+    asyncio.run(AsyncBot().run())
+
+if __name__ == '__main__':
+    main()
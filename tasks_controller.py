@@ -1,22 +1,67 @@
 import datetime
-import requests
+import re
+
 import sqlalchemy
 
 import db
-from db import Task
-from contracts import contract
-
+import settings
+from db import Task, TaskDependency
+from dependency_graph import DependencyGraphs
+from flow_log import FlowLog
+from list_cache import ListCache
+from message_queue import MESSAGE_LIMIT
+from metrics import metrics
+from typecheck import contract
+
+@metrics.instrument('new_task', 'rename_task', 'duplicate_task', 'delete_task',
+                    'change_multiple', 'change_status', 'list_tasks', 'list_whole',
+                    'list_page', 'depends_on', 'blocked_tasks', 'ready_tasks',
+                    'flow_report', 'search_tasks', 'set_priority', 'set_duedate')
 class TasksController:
     """This class controls the tasks."""
 
+    PAGE_SIZE = settings.get_int('list_page_size', 20)
+    # A board with more tasks than this is paged without trying to list it whole.
+    WHOLE_BOARD_SIZE = settings.get_int('list_whole_size', 200)
+    SEARCH_LIMIT = settings.get_int('search_limit', 10)
+
+    list_cache = ListCache()
+    graphs = DependencyGraphs()
+    flow_log = FlowLog()
+
+    @classmethod
+    @contract(msg='str', returns='list(str)')
+    def task_names(cls, msg):
+        """This function gets the name of each task of a message, one per line."""
+        names = [line.strip() for line in msg.split('\n') if line.strip()]
+        return names or [msg]
+
     @classmethod
     @contract(msg='str', chat='int', returns='str')
     def new_task(cls, msg, chat):
-        """This function creates the new tasks."""
-        task = Task(chat=chat, name=msg, status='TODO', dependencies='', parents='', priority='')
-        db.session.add(task)
+        """This function creates the new tasks, one per line, in a single insert."""
+        names = cls.task_names(msg)
+        rows = [{'chat': chat, 'name': name, 'status': 'TODO', 'priority': '', 'overdue': False}
+                for name in names]
+        new_ids = cls.insert_tasks(rows)
+        cls.flow_log.record(chat, 'create', new_ids)
         db.session.commit()
-        return "New task *TODO* [[{}]] {}".format(task.id, task.name)
+        cls.list_cache.bump(chat)
+
+        responses = ["New task *TODO* [[{}]] {}".format(task_id, name)
+                     for task_id, name in zip(new_ids, names)]
+        return '\n'.join(responses)
+
+    @classmethod
+    @contract(rows='list(dict)', returns='list(int)')
+    def insert_tasks(cls, rows):
+        """This function inserts the task rows in one statement and gets their ids, in order.
+
+        RETURNING doesn't promise an order, but the new ids grow in the
+        order the rows are inserted, so sorting them matches them to rows.
+        """
+        query = sqlalchemy.insert(Task).values(rows).returning(Task.id)
+        return sorted(task_id for task_id, in db.session.execute(query))
 
     @classmethod
     @contract(msg='str', chat='int', returns='str')
@@ -45,13 +90,33 @@ class TasksController:
 
             old_text = task.name
             task.name = text
+            cls.flow_log.record(chat, 'rename', [task_id], text)
             db.session.commit()
+            cls.list_cache.bump(chat)
             return "Task {} redefined from {} to {}".format(task_id, old_text, text)
 
+    @classmethod
+    @contract(msg='str', returns='tuple')
+    def subtree_argument(cls, msg):
+        """This function splits "ID" or "ID subtree" into the id text and the subtree flag."""
+        words = msg.split()
+        if len(words) == 2 and words[1].lower() == 'subtree':
+            return words[0], True
+        return msg, False
+
+    @classmethod
+    @contract(chat='int', task_id='int', returns='list(int)')
+    def subtree_ids(cls, chat, task_id):
+        """This function gets a task and every task under it in the dependency tree."""
+        dependencies = cls.load_subtrees(chat, [task_id])
+        ids = set(depends_on_id for dep_ids in dependencies.values() for depends_on_id in dep_ids)
+        return [task_id] + sorted(ids - {task_id})
+
     @classmethod
     @contract(msg='str', chat='int', returns='str')
     def duplicate_task(cls, msg, chat):
-        """This function duplicates the task."""
+        """This function duplicates the task, or with "ID subtree" its whole dependency tree."""
+        msg, subtree = cls.subtree_argument(msg)
         if not msg.isdigit():
             return "You must inform the task id"
         else:
@@ -62,52 +127,145 @@ class TasksController:
             except sqlalchemy.orm.exc.NoResultFound:
                 return "_404_ Task {} not found x.x".format(task_id)
 
+            if subtree:
+                return cls.duplicate_subtree(task, chat)
+
             dtask = Task(chat=task.chat,
                          name=task.name,
                          status=task.status,
-                         dependencies=task.dependencies,
-                         parents=task.parents,
                          priority=task.priority,
                          overdue=task.overdue,
                          duedate=task.duedate)
             db.session.add(dtask)
+            db.session.flush()
 
-            for dependency in task.dependencies.split(',')[:-1]:
-                query = db.session.query(Task).filter_by(id=int(dependency), chat=chat)
-                dependency = query.one()
-                dependency.parents += '{},'.format(dtask.id)
+            query = db.session.query(TaskDependency).filter_by(chat=chat, task_id=task.id)
+            depids = [dependency.depends_on_id for dependency in query.all()]
+            for depid in depids:
+                db.session.add(TaskDependency(chat=chat, task_id=dtask.id, depends_on_id=depid))
+            cls.flow_log.record(chat, 'create', [dtask.id])
 
             db.session.commit()
+            cls.list_cache.bump(chat)
+            graph = cls.graphs.get(chat)
+            for depid in depids:
+                graph.add(dtask.id, depid)
             return "New task *TODO* [[{}]] {}".format(dtask.id, dtask.name)
 
+    @classmethod
+    @contract(chat='int', returns='str')
+    def duplicate_subtree(cls, task, chat):
+        """This function clones a task's tree with one insert of tasks and one of edges."""
+        ids = cls.subtree_ids(chat, task.id)
+        query = db.session.query(Task).filter(Task.chat == chat, Task.id.in_(ids))
+        tasks = query.order_by(Task.id).all()
+        rows = [{'chat': chat, 'name': old.name, 'status': old.status, 'priority': old.priority,
+                 'overdue': old.overdue, 'duedate': old.duedate} for old in tasks]
+        new_ids = dict(zip([old.id for old in tasks], cls.insert_tasks(rows)))
+
+        query = db.session.query(TaskDependency.task_id, TaskDependency.depends_on_id).filter(
+            TaskDependency.chat == chat, TaskDependency.task_id.in_(list(new_ids)))
+        edges = [(new_ids[task_id], new_ids[depends_on_id]) for task_id, depends_on_id in query
+                 if depends_on_id in new_ids]
+        if edges:
+            db.session.execute(sqlalchemy.insert(TaskDependency).values(
+                [{'chat': chat, 'task_id': task_id, 'depends_on_id': depends_on_id}
+                 for task_id, depends_on_id in edges]))
+        cls.flow_log.record(chat, 'create', sorted(new_ids.values()))
+
+        db.session.commit()
+        cls.list_cache.bump(chat)
+        graph = cls.graphs.get(chat)
+        for task_id, depends_on_id in edges:
+            graph.add(task_id, depends_on_id)
+        return "New task *TODO* [[{}]] {} with a copy of its {} dependencies".format(
+            new_ids[task.id], task.name, len(tasks) - 1)
+
     @classmethod
     @contract(msg='str', chat='int', returns='str')
     def delete_task(cls, msg, chat):
-        """This function deletes tasks."""
+        """This function deletes a task, or with "ID subtree" its whole dependency tree."""
+        msg, subtree = cls.subtree_argument(msg)
         if not msg.isdigit():
             return "You must inform the task id"
         else:
             task_id = int(msg)
             query = db.session.query(Task).filter_by(id=task_id, chat=chat)
-            try:
-                task = query.one()
-            except sqlalchemy.orm.exc.NoResultFound:
+            if query.count() == 0:
                 return "_404_ Task {} not found x.x".format(task_id)
-            for dependency in task.dependencies.split(',')[:-1]:
-                query = db.session.query(Task).filter_by(id=int(dependency), chat=chat)
-                dependency = query.one()
-                dependency.parents = dependency.parents.replace('{},'.format(task.id), '')
-            db.session.delete(task)
+
+            ids, kept = cls.deletable_subtree(chat, task_id) if subtree else ([task_id], [])
+            query = db.session.query(TaskDependency).filter(
+                TaskDependency.chat == chat,
+                sqlalchemy.or_(TaskDependency.task_id.in_(ids),
+                               TaskDependency.depends_on_id.in_(ids)))
+            query.delete(synchronize_session=False)
+            query = db.session.query(Task).filter(Task.chat == chat, Task.id.in_(ids))
+            query.delete(synchronize_session=False)
+            cls.flow_log.record(chat, 'delete', ids)
             db.session.commit()
+            cls.list_cache.bump(chat)
+            cls.graphs.get(chat).remove_tasks(ids)
+            if kept:
+                return ("Task [[{}]] and its {} dependencies deleted\n"
+                        "Kept {}: other tasks still depend on them").format(
+                            task_id, len(ids) - 1, ' '.join('[[{}]]'.format(i) for i in kept))
+            if subtree:
+                return "Task [[{}]] and its {} dependencies deleted".format(task_id, len(ids) - 1)
             return "Task [[{}]] deleted".format(task_id)
 
+    @classmethod
+    @contract(chat='int', task_id='int', returns='tuple')
+    def deletable_subtree(cls, chat, task_id):
+        """This function splits a task's tree into what can go and what others still need.
+
+        A dependency that a task outside the tree depends on is kept, and
+        so is everything under it.
+        """
+        dependencies = cls.load_subtrees(chat, [task_id])
+        ids = set(depends_on_id for dep_ids in dependencies.values() for depends_on_id in dep_ids)
+        ids.discard(task_id)
+        query = db.session.query(TaskDependency.depends_on_id).filter(
+            TaskDependency.chat == chat, TaskDependency.depends_on_id.in_(list(ids)),
+            TaskDependency.task_id.notin_(list(ids) + [task_id])).distinct()
+
+        kept = set()
+        stack = [depends_on_id for depends_on_id, in query]
+        while stack:
+            kept_id = stack.pop()
+            if kept_id not in kept:
+                kept.add(kept_id)
+                stack.extend(dependencies.get(kept_id, []))
+        return [task_id] + sorted(ids - kept), sorted(kept)
+
     @contract(msg='str', chat='int', new_status='str', returns='list')
     def change_multiple(self, msg, chat, new_status):
-        tasks = msg.split(' ')
+        """This function changes the status of several tasks in one transaction."""
+        task_ids = [int(task) for task in msg.split(' ') if task.isdigit()]
+        names = {}
+        statuses = {}
+        if task_ids:
+            query = db.session.query(Task.id, Task.name, Task.status).filter(
+                Task.chat == chat, Task.id.in_(task_ids))
+            for task_id, name, status in query:
+                names[task_id] = name
+                statuses[task_id] = status
+
         responses = []
-        for task in tasks:
-            response = self.change_status(task, chat, new_status)
-            responses.append(response)
+        for task in msg.split(' '):
+            if not task.isdigit():
+                responses.append("You must inform the task id")
+            elif int(task) not in names:
+                responses.append("_404_ Task {} not found x.x".format(int(task)))
+            else:
+                responses.append("*{}* task [[{}]] {}".format(new_status, int(task), names[int(task)]))
+
+        if names:
+            query = db.session.query(Task).filter(Task.chat == chat, Task.id.in_(list(names)))
+            query.update({Task.status: new_status}, synchronize_session=False)
+            self.flow_log.record_status(chat, statuses, new_status)
+            db.session.commit()
+            self.list_cache.bump(chat)
         return responses
 
     @contract(msg='str', chat='int', new_status='str', returns='str')
@@ -122,12 +280,15 @@ class TasksController:
                 task = query.one()
             except sqlalchemy.orm.exc.NoResultFound:
                 return "_404_ Task {} not found x.x".format(task_id)
+            self.flow_log.record_status(chat, {task.id: task.status}, new_status)
             task.status = new_status
             db.session.commit()
+            self.list_cache.bump(chat)
             return "*{}* task [[{}]] {}".format(new_status, task.id, task.name)
 
-    @contract(task='str', returns='str')
+    @contract(task='isinstance(Task)', returns='str')
     def get_priority(self, task):
+        """This function gets the icon of the task priority."""
         if task.priority == 'low':
             return '\U00002755'
         elif task.priority == 'medium':
@@ -137,118 +298,237 @@ class TasksController:
 
         return ''
 
-    @contract(chat='int', returns='str')
-    def list_overdue(self, chat):
-        tasks = ''
-        overdue = True
-        query = db.session.query(Task).filter_by(overdue=overdue, chat=chat).order_by(Task.id)
-        for task in query.all():
-            tasks += '[[{}]] {}\n'.format(task.id, task.name)
-
-        return tasks
-
-    @contract(chat='int', status='str', returns='str')
-    def filter_by_status(self, chat, status):
-        """This function orders the tasks using the status."""
-        tasks = ''
-        overdue = False
-        query = db.session.query(Task).filter_by(status=status, overdue=overdue, chat=chat).order_by(Task.id)
-        for task in query.all():
-            tasks += '[[{}]] {}\n'.format(task.id, task.name)
-        return tasks
-
-    @contract(chat='int', priority='str', returns='str')
-    def filter_by_priority(self, chat, priority):
-        """This method orders tasks by their priority."""
-        tasks = ''
-        query = db.session.query(Task).filter_by(priority=priority, chat=chat).order_by(Task.id)
-        for task in query.all():
-            tasks += '[[{}]] {}\n'.format(task.id, task.name)
-        return tasks
-
-    @contract(chat='int', returns='str')
-    def list_default(self, chat):
-        task_list = ''
-
-        task_list += '\U0001F4CB Task List\n'
-        query = db.session.query(Task).filter_by(parents='', chat=chat).order_by(Task.id)
+    @contract(chat='int', limit='int|None', returns='dict|None')
+    def load_board(self, chat, limit=None):
+        """This function loads all the tasks and dependencies of a chat at once.
 
-        today = None
-        NO_TIME = 0
-        difference = ''
+        With a limit, a chat with more tasks than that is not loaded and
+        None is returned, after reading at most limit + 1 tasks.
+        """
+        query = db.session.query(Task).filter_by(chat=chat).order_by(Task.id)
+        if limit is None:
+            tasks = query.all()
+        else:
+            tasks = query.limit(limit + 1).all()
+            if len(tasks) > limit:
+                return None
+
+        dependencies = {}
+        children = set()
+        query = db.session.query(TaskDependency).filter_by(chat=chat).order_by(
+            TaskDependency.task_id, TaskDependency.depends_on_id)
+        for edge in query.all():
+            dependencies.setdefault(edge.task_id, []).append(edge.depends_on_id)
+            children.add(edge.depends_on_id)
+
+        return {'tasks': tasks,
+                'tasks_by_id': {task.id: task for task in tasks},
+                'dependencies': dependencies,
+                'children': children}
+
+    @contract(tasks='list', returns='str')
+    def list_overdue(self, tasks):
+        tasks_text = ''
+        for task in tasks:
+            if task.overdue:
+                tasks_text += '[[{}]] {}\n'.format(task.id, task.name)
 
-        today = datetime.date.today()
+        return tasks_text
 
-        for task in query.all():
-            if task.duedate != None:
-                difference = task.duedate - today
+    @contract(tasks='list', status='str', returns='str')
+    def filter_by_status(self, tasks, status):
+        """This function orders the tasks using the status."""
+        tasks_text = ''
+        for task in tasks:
+            if task.status == status and not task.overdue:
+                tasks_text += '[[{}]] {}\n'.format(task.id, task.name)
+        return tasks_text
 
-            if task.duedate != None and difference.days < NO_TIME:
-                task.overdue = True
+    @contract(tasks='list', priority='str', returns='str')
+    def filter_by_priority(self, tasks, priority):
+        """This method orders tasks by their priority."""
+        tasks_text = ''
+        for task in tasks:
+            if task.priority == priority:
+                tasks_text += '[[{}]] {}\n'.format(task.id, task.name)
+        return tasks_text
+
+    @contract(chat='int', board='dict|None', returns='str')
+    def list_default(self, chat, board=None):
+        if board is None:
+            board = self.load_board(chat)
+
+        lines = ['\U0001F4CB Task List\n']
+        for task in board['tasks']:
+            if task.id in board['children']:
+                continue
+            self.task_lines(task, board['tasks_by_id'], board['dependencies'], lines)
+
+        return ''.join(lines)
+
+    @contract(chat='int', after='int|None', before='int|None', returns='dict')
+    def list_page(self, chat, after=None, before=None):
+        """This function renders a page of the task tree, seeking by root id.
+
+        Only the page's roots and their dependency trees are loaded, so the
+        cost is bounded by PAGE_SIZE and not by the size of the board.
+        """
+        is_root = ~sqlalchemy.exists().where(TaskDependency.chat == chat,
+                                             TaskDependency.depends_on_id == Task.id)
+        query = db.session.query(Task).filter(Task.chat == chat, is_root)
+        if before is not None:
+            roots = query.filter(Task.id < before).order_by(Task.id.desc())
+            roots = roots.limit(self.PAGE_SIZE + 1).all()
+            has_previous, has_next = len(roots) > self.PAGE_SIZE, True
+            roots = list(reversed(roots[:self.PAGE_SIZE]))
+        else:
+            if after is not None:
+                query = query.filter(Task.id > after)
+            roots = query.order_by(Task.id).limit(self.PAGE_SIZE + 1).all()
+            has_previous, has_next = after is not None, len(roots) > self.PAGE_SIZE
+            roots = roots[:self.PAGE_SIZE]
+
+        dependencies = self.load_subtrees(chat, [root.id for root in roots])
+        tasks_by_id = {root.id: root for root in roots}
+        dep_ids = set(dep_id for dep_ids in dependencies.values() for dep_id in dep_ids)
+        dep_ids -= set(tasks_by_id)
+        if dep_ids:
+            query = db.session.query(Task).filter(Task.chat == chat, Task.id.in_(dep_ids))
+            tasks_by_id.update((task.id, task) for task in query.all())
+
+        # A page must fit one message, so it drops the roots farthest from where it started.
+        chunks = []
+        for root in roots:
+            lines = []
+            self.task_lines(root, tasks_by_id, dependencies, lines)
+            chunks.append(''.join(lines))
+        header = '\U0001F4CB Task List\n'
+        while len(chunks) > 1 and len(header) + sum(map(len, chunks)) > MESSAGE_LIMIT:
+            if before is not None:
+                chunks.pop(0)
+                roots.pop(0)
+                has_previous = True
             else:
-                task.overdue = False
+                chunks.pop()
+                roots.pop()
+                has_next = True
+        if chunks and len(header) + len(chunks[0]) > MESSAGE_LIMIT:
+            chunks[0] = self.truncate_tree(chunks[0], roots[0].id, MESSAGE_LIMIT - len(header))
+
+        return {'text': header + ''.join(chunks),
+                'first': roots[0].id if roots else None,
+                'last': roots[-1].id if roots else None,
+                'has_previous': has_previous,
+                'has_next': has_next}
 
-            print(task.overdue)
-
-            icon = '\U0001F195'
-            if task.status == 'DOING':
-                icon = '\U000023FA'
-            elif task.status == 'DONE':
-                icon = '\U00002611'
-
-            task_list += '[[{}]] {} {}\n'.format(task.id, icon, task.name)
-            task_list += self.deps_text(task, chat)
+    @classmethod
+    @contract(text='str', root_id='int', limit='int,>0', returns='str')
+    def truncate_tree(cls, text, root_id, limit):
+        """This function cuts the tree of a single root down to limit, at a line."""
+        lines = text.splitlines(True)
+        kept = []
+        length = 0
+        for number, line in enumerate(lines):
+            note = "... {} more lines of [[{}]] not shown\n".format(len(lines) - number, root_id)
+            if length + len(line) + len(note) > limit:
+                return ''.join(kept) + note
+            kept.append(line)
+            length += len(line)
+        return text
 
-        return task_list
+    @classmethod
+    @contract(chat='int', root_ids='list(int)', returns='dict')
+    def load_subtrees(cls, chat, root_ids):
+        """This function loads the edges under root_ids with one recursive query."""
+        if not root_ids:
+            return {}
+        edges = TaskDependency.__table__
+        subtree = sqlalchemy.select(edges.c.task_id, edges.c.depends_on_id).where(
+            edges.c.chat == chat, edges.c.task_id.in_(root_ids)).cte('subtree', recursive=True)
+        below = edges.alias()
+        subtree = subtree.union(
+            sqlalchemy.select(below.c.task_id, below.c.depends_on_id).where(
+                below.c.chat == chat, below.c.task_id == subtree.c.depends_on_id))
+
+        dependencies = {}
+        query = sqlalchemy.select(subtree.c.task_id, subtree.c.depends_on_id).order_by(
+            subtree.c.task_id, subtree.c.depends_on_id)
+        for task_id, depends_on_id in db.session.execute(query):
+            dependencies.setdefault(task_id, []).append(depends_on_id)
+        return dependencies
+
+    @contract(chat='int', board='dict|None', returns='str')
+    def list_by_status(self, chat, board=None):
+        if board is None:
+            board = self.load_board(chat)
+        tasks = board['tasks']
 
-    @contract(chat='int', returns='str')
-    def list_by_status(self, chat):
         tasks_by_status = ''
 
         tasks_by_status += '\U0001F4DD _Status_\n'
         tasks_by_status += '\n\U0001F195 *TODO*\n'
-        tasks_by_status += self.filter_by_status(chat, 'TODO')
+        tasks_by_status += self.filter_by_status(tasks, 'TODO')
         tasks_by_status += '\n\U000023FA *DOING*\n'
-        tasks_by_status += self.filter_by_status(chat, 'DOING')
+        tasks_by_status += self.filter_by_status(tasks, 'DOING')
         tasks_by_status += '\n\U00002611 *DONE*\n'
-        tasks_by_status += self.filter_by_status(chat, 'DONE')
+        tasks_by_status += self.filter_by_status(tasks, 'DONE')
         tasks_by_status += '\n\U0001F198 *OVERDUE*\n'
-        tasks_by_status += self.list_overdue(chat)
+        tasks_by_status += self.list_overdue(tasks)
 
         return tasks_by_status
 
-    @contract(chat='int', returns='str')
-    def list_by_priority(self, chat):
+    @contract(chat='int', board='dict|None', returns='str')
+    def list_by_priority(self, chat, board=None):
+        if board is None:
+            board = self.load_board(chat)
+        tasks = board['tasks']
+
         tasks_by_priority = ''
 
         tasks_by_priority += '_Priorities_\n'
         tasks_by_priority += '*HIGH*\n'
-        tasks_by_priority += self.filter_by_priority(chat, 'high')
+        tasks_by_priority += self.filter_by_priority(tasks, 'high')
         tasks_by_priority += '*MEDIUM*\n'
-        tasks_by_priority += self.filter_by_priority(chat, 'medium')
+        tasks_by_priority += self.filter_by_priority(tasks, 'medium')
         tasks_by_priority += '*LOW*\n'
-        tasks_by_priority += self.filter_by_priority(chat, 'low')
+        tasks_by_priority += self.filter_by_priority(tasks, 'low')
 
         return tasks_by_priority
 
     @contract(msg='str', chat='int', returns='list')
     def list_tasks(self, msg, chat):
         """This function lists the tasks."""
-        task_list = ''
-        tasks_by_status = ''
-        tasks_by_priority = ''
-        list_messages = []
-
-        task_list += self.list_default(chat)
-        list_messages.append(task_list)
+        today = datetime.date.today()
+        version = self.list_cache.version(chat)
+        list_messages = self.list_cache.get(chat, today)
+        if list_messages is not None:
+            return list_messages
 
-        tasks_by_status += self.list_by_status(chat)
-        list_messages.append(tasks_by_status)
+        list_messages = self.board_messages(chat, self.load_board(chat))
+        self.list_cache.put(chat, today, version, list_messages)
+        return list_messages
 
-        tasks_by_priority += self.list_by_priority(chat)
-        list_messages.append(tasks_by_priority)
+    @contract(chat='int', returns='list(str)|None')
+    def list_whole(self, chat):
+        """This function renders the /list messages of a board whose tree fits one message.
+
+        It returns None for a larger board, which has to be paged instead.
+        """
+        board = self.load_board(chat, self.WHOLE_BOARD_SIZE)
+        if board is None:
+            return None
+        list_messages = self.board_messages(chat, board)
+        if len(list_messages[0]) > MESSAGE_LIMIT:
+            return None
         return list_messages
 
+    @contract(chat='int', board='dict', returns='list(str)')
+    def board_messages(self, chat, board):
+        """This function renders the tree, status and priority messages of a loaded board."""
+        return [self.list_default(chat, board),
+                self.list_by_status(chat, board),
+                self.list_by_priority(chat, board)]
+
     @contract(msg='str', chat='int', returns='str')
     def depends_on(self, msg, chat):
         """This function controls the task dependencies."""
@@ -268,38 +548,120 @@ class TasksController:
             except sqlalchemy.orm.exc.NoResultFound:
                 return "_404_ Task {} not found x.x".format(task_id)
 
+            graph = self.graphs.get(chat)
             if text == '':
-                for i in task.dependencies.split(',')[:-1]:
-                    i = int(i)
-                    query = db.session.query(Task).filter_by(id=i, chat=chat)
-                    task_dep = query.one()
-                    task_dep.parents = task_dep.parents.replace('{},'.format(task.id), '')
-
-                task.dependencies = ''
+                db.session.query(TaskDependency).filter_by(chat=chat, task_id=task_id).delete()
+                db.session.commit()
+                self.list_cache.bump(chat)
+                graph.clear_dependencies(task_id)
                 return "Dependencies removed from task {}".format(task_id)
-            elif self.dependency_exist(text, task_id):
-                return "Task {} already have a dependency of task {}".format(text, task_id)
-            else:
-                for depid in text.split(' '):
-                    if not depid.isdigit():
-                        return "All dependencies ids must be numeric, and not {}".format(depid)
-                    else:
-                        depid = int(depid)
-                        query = db.session.query(Task).filter_by(id=depid, chat=chat)
-                        try:
-                            taskdep = query.one()
-                            taskdep.parents += str(task.id) + ','
-                        except sqlalchemy.orm.exc.NoResultFound:
-                            return "_404_ Task {} not found x.x".format(depid)
-                            continue
-
-                        deplist = task.dependencies.split(',')
-                        if str(depid) not in deplist:
-                            task.dependencies += str(depid) + ','
+
+            depids = []
+            for depid in text.split(' '):
+                if not depid.isdigit():
+                    return "All dependencies ids must be numeric, and not {}".format(depid)
+                depid = int(depid)
+                if task_id in graph.dependencies.get(depid, ()):
+                    return "Task {} already have a dependency of task {}".format(depid, task_id)
+                if graph.creates_cycle(task_id, depid):
+                    return "Task {} can't depend on task {}, it would make a cycle".format(
+                        task_id, depid)
+
+                query = db.session.query(Task).filter_by(id=depid, chat=chat)
+                if query.count() == 0:
+                    return "_404_ Task {} not found x.x".format(depid)
+                depids.append(depid)
+
+            depids = [depid for depid in depids if depid not in graph.dependencies.get(task_id, ())]
+            for depid in depids:
+                db.session.add(TaskDependency(chat=chat, task_id=task_id, depends_on_id=depid))
 
             db.session.commit()
+            self.list_cache.bump(chat)
+            for depid in depids:
+                graph.add(task_id, depid)
             return "Task {} dependencies up to date".format(task_id)
 
+    @contract(msg='str', chat='int', returns='str')
+    def blocked_tasks(self, msg, chat):
+        """This function lists the unfinished tasks waiting on a task."""
+        if not msg.isdigit():
+            return "You must inform the task id"
+
+        task_id = int(msg)
+        query = db.session.query(Task).filter_by(id=task_id, chat=chat)
+        try:
+            task = query.one()
+        except sqlalchemy.orm.exc.NoResultFound:
+            return "_404_ Task {} not found x.x".format(task_id)
+
+        blocked = []
+        blocked_ids = self.graphs.get(chat).blocked_by(task_id)
+        if blocked_ids and task.status != 'DONE':
+            query = db.session.query(Task).filter(
+                Task.chat == chat, Task.id.in_(blocked_ids), Task.status != 'DONE')
+            blocked = query.order_by(Task.id).all()
+        if not blocked:
+            return "No task is blocked by task {}".format(task_id)
+
+        text = '\U0001F6A7 Blocked by [[{}]] {}\n'.format(task.id, task.name)
+        for blocked_task in blocked:
+            text += '[[{}]] {} {}\n'.format(
+                blocked_task.id, self.get_status_icon(blocked_task.status), blocked_task.name)
+        return text
+
+    @contract(msg='str', chat='int', returns='str')
+    def ready_tasks(self, msg, chat):
+        """This function lists the unfinished tasks whose dependencies are all done."""
+        query = db.session.query(Task).filter(Task.chat == chat, Task.status != 'DONE')
+        pending = query.order_by(Task.id).all()
+        pending_ids = {task.id for task in pending}
+        graph = self.graphs.get(chat)
+
+        text = '\U0001F3C1 Ready to start\n'
+        for task in pending:
+            if graph.is_ready(task.id, pending_ids):
+                text += '[[{}]] {} {}\n'.format(task.id, self.get_status_icon(task.status),
+                                                 task.name)
+        return text
+
+    @contract(msg='str', chat='int', returns='str')
+    def flow_report(self, msg, chat):
+        """This function reports how fast the chat finishes its tasks."""
+        return self.flow_log.report(chat)
+
+    @contract(msg='str', chat='int', returns='str')
+    def search_tasks(self, msg, chat):
+        """This function finds the tasks of a chat whose name has every word of msg."""
+        words = re.findall(r'\w+', msg)
+        if not words:
+            return "You must inform the text to search"
+
+        if db.SEARCH:
+            # Every word is a prefix; the chat column keeps the match to this board.
+            match = ' AND '.join(['name : "{}"*'.format(word) for word in words] +
+                                 ['chat : "{}"'.format(abs(chat))])
+            query = sqlalchemy.text(
+                'SELECT tasks.id, tasks.name, tasks.status FROM tasks_fts '
+                'JOIN tasks ON tasks.id = tasks_fts.rowid '
+                'WHERE tasks_fts MATCH :match AND tasks.chat = :chat '
+                'ORDER BY bm25(tasks_fts, 1.0, 0.0) LIMIT :limit')
+            rows = db.session.execute(query, {'match': match, 'chat': chat,
+                                              'limit': self.SEARCH_LIMIT}).fetchall()
+        else:
+            query = db.session.query(Task.id, Task.name, Task.status).filter(Task.chat == chat)
+            for word in words:
+                query = query.filter(Task.name.like('%{}%'.format(word)))
+            rows = query.order_by(Task.id).limit(self.SEARCH_LIMIT).all()
+
+        if not rows:
+            return "No task matches {}".format(' '.join(words))
+
+        lines = ['\U0001F50D {}\n'.format(' '.join(words))]
+        for task_id, name, status in rows:
+            lines.append('[[{}]] {} {}\n'.format(task_id, self.get_status_icon(status), name))
+        return ''.join(lines)
+
     @classmethod
     @contract(msg='str', chat='int', returns='str')
     def set_priority(cls, msg, chat):
@@ -322,14 +684,19 @@ class TasksController:
 
             if text == '':
                 task.priority = ''
+                cls.flow_log.record(chat, 'priority', [task_id], '')
+                db.session.commit()
+                cls.list_cache.bump(chat)
                 return "_Cleared_ all priorities from task {}".format(task_id)
             else:
                 if text.lower() not in ['high', 'medium', 'low']:
                     return "The priority *must be* one of the following: high, medium, low"
                 else:
                     task.priority = text.lower()
+                    cls.flow_log.record(chat, 'priority', [task_id], task.priority)
+                    db.session.commit()
+                    cls.list_cache.bump(chat)
                     return "*Task {}* priority has priority *{}*".format(task_id, text.lower())
-            db.session.commit()
 
     @classmethod
     @contract(msg='str', chat='int', returns='str')
@@ -353,7 +720,10 @@ class TasksController:
 
             if text == '':
                 task.duedate = None
+                task.overdue = False
+                cls.flow_log.record(chat, 'duedate', [task_id])
                 db.session.commit()
+                cls.list_cache.bump(chat)
                 return "_Cleared_ all duedate from task {}".format(task_id)
             else:
                 print(task.duedate)
@@ -372,40 +742,55 @@ class TasksController:
                 else:
                     task.duedate = duedate
                     task.overdue = False
+                    cls.flow_log.record(chat, 'duedate', [task_id], duedate.isoformat())
                     db.session.commit()
+                    cls.list_cache.bump(chat)
                     return "*Task {}* duedate has priority *{}*".format(task_id, duedate)
 
-    @contract(task='str', task_dependecy='int', returns='bool')
-    def dependency_exist(self, task, task_dependecy):
-        query = db.session.query(Task).filter_by(id=task)
-        task_dep = query.one()
-        dependencies_task = task_dep.dependencies.split(",")
-
-        return str(task_dependecy) in dependencies_task
-
-    @contract(task='Hashable', chat='int', preceed='str', returns='str')
-    def deps_text(self, task, chat, preceed=''):
-        text = ''
-
-        for i in range(len(task.dependencies.split(',')[:-1])):
-            line = preceed
-            query = db.session.query(Task).filter_by(
-                id=int(task.dependencies.split(',')[:-1][i]), chat=chat)
-            dep = query.one()
-
-            icon = '\U0001F195'
-            if dep.status == 'DOING':
-                icon = '\U000023FA'
-            elif dep.status == 'DONE':
-                icon = '\U00002611'
-
-            if i + 1 == len(task.dependencies.split(',')[:-1]):
-                line += '└── [[{}]] {} {}\n'.format(dep.id, icon, dep.name)
-                line += self.deps_text(dep, chat, preceed + '    ')
+    @contract(status='str', returns='str')
+    def get_status_icon(self, status):
+        """This function gets the icon of a task status."""
+        icon = '\U0001F195'
+        if status == 'DOING':
+            icon = '\U000023FA'
+        elif status == 'DONE':
+            icon = '\U00002611'
+
+        return icon
+
+    @contract(tasks_by_id='dict', dependencies='dict', lines='list', returns='None')
+    def task_lines(self, task, tasks_by_id, dependencies, lines):
+        """This function appends the lines of a root task and of its dependency tree.
+
+        The tree is walked with an explicit stack, so a long chain can't
+        overflow the interpreter's, and a task already on the path is
+        marked as a cycle instead of being expanded again.
+        """
+        lines.append('[[{}]] {} {}\n'.format(task.id, self.get_status_icon(task.status),
+                                             task.name))
+        path = [task.id]
+        on_path = {task.id}
+        stack = self.dep_entries(task.id, tasks_by_id, dependencies, '', 1)
+        while stack:
+            dep, preceed, last, depth = stack.pop()
+            while len(path) > depth:
+                on_path.discard(path.pop())
+
+            branch, indent = ('└── ', '    ') if last else ('├── ', '│   ')
+            line = '{}{}[[{}]] {} {}'.format(preceed, branch, dep.id,
+                                            self.get_status_icon(dep.status), dep.name)
+            if dep.id in on_path:
+                lines.append(line + ' \U0001F501\n')
             else:
-                line += '├── [[{}]] {} {}\n'.format(dep.id, icon, dep.name)
-                line += self.deps_text(dep, chat, preceed + '│   ')
+                lines.append(line + '\n')
+                path.append(dep.id)
+                on_path.add(dep.id)
+                stack.extend(self.dep_entries(dep.id, tasks_by_id, dependencies,
+                                              preceed + indent, depth + 1))
 
-            text += line
-
-        return text
\ No newline at end of file
+    @classmethod
+    def dep_entries(cls, task_id, tasks_by_id, dependencies, preceed, depth):
+        """This function gets the dependencies of a task as stack entries, the first on top."""
+        deps = [tasks_by_id[dep_id] for dep_id in dependencies.get(task_id, [])
+                if dep_id in tasks_by_id]
+        return [(dep, preceed, i + 1 == len(deps), depth) for i, dep in enumerate(deps)][::-1]
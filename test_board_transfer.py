@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import unittest
+
+import db
+from db import Task
+from fake_telegram import FakeTelegram
+from taskbot_api import Api
+
+class TestBoardTransfer(unittest.TestCase):
+    chat = 24024
+
+    def setUp(self):
+        os.environ['TASKBOT_GITHUB_ISSUES'] = '0'
+        self.server = FakeTelegram(poll_cap=0).start()
+        self.api = Api(token='TEST', api_url=self.server.url)
+        controller = self.api.controller
+        self.ids = [line.split('[[')[1].split(']]')[0]
+                    for line in controller.new_task('ship it\nwrite it\ntest it', self.chat)
+                    .split('\n')]
+        controller.depends_on('{} {} {}'.format(*self.ids), self.chat)
+        controller.set_priority('{} high'.format(self.ids[0]), self.chat)
+        controller.set_duedate('{} 01/01/2100'.format(self.ids[0]), self.chat)
+        controller.change_multiple(self.ids[1], self.chat, 'DOING')
+
+    def tearDown(self):
+        for chat in (self.chat, self.chat + 1):
+            for task in db.session.query(Task).filter_by(chat=chat).all():
+                self.api.controller.delete_task(str(task.id), chat)
+        del os.environ['TASKBOT_GITHUB_ISSUES']
+        self.server.stop()
+
+    def message(self, text, chat, document=None):
+        message = {'chat': {'id': chat}, 'caption' if document else 'text': text}
+        if document:
+            message['document'] = {'file_id': document}
+        return {'message': message}
+
+    def handle(self, *updates):
+        self.server.queue_updates(list(updates))
+        self.api.handle_updates(self.api.get_updates())
+        return self.server.sent_messages()[-1]['text']
+
+    def test_export_imports_into_another_chat(self):
+        self.assertEqual(self.handle(self.message('/export', self.chat)),
+                         'Exported 3 tasks and 2 dependencies')
+        document = [payload for method, payload in self.server.requests
+                    if method == 'sendDocument'][-1]
+        self.assertEqual(int(document['chat_id']), self.chat)
+        lines = [json.loads(line) for line in document['document'].splitlines()]
+        self.assertEqual([line['type'] for line in lines], ['task'] * 3 + ['dependency'] * 2)
+        self.assertEqual((lines[0]['priority'], lines[0]['duedate']), ('high', '2100-01-01'))
+
+        self.server.add_file('board', document['document'])
+        self.assertEqual(self.handle(self.message('/import', self.chat + 1, 'board')),
+                         'Imported 3 tasks and 2 dependencies')
+        imported = self.handle(self.message('/list', self.chat + 1))
+        self.assertIn('ship it', imported)
+        self.assertIn('write it', imported)
+        self.assertNotIn('[[{}]]'.format(self.ids[0]), imported)
+
+    def test_invalid_file_imports_nothing(self):
+        lines = [{'type': 'task', 'id': 1, 'name': 'one'},
+                 {'type': 'task', 'id': 2, 'name': 'two'},
+                 {'type': 'dependency', 'task_id': 1, 'depends_on_id': 2},
+                 {'type': 'dependency', 'task_id': 2, 'depends_on_id': 1}]
+        self.server.add_file('cycle', '\n'.join(json.dumps(line) for line in lines).encode())
+
+        self.assertEqual(self.handle(self.message('/import', self.chat + 1, 'cycle')),
+                         'Import failed at line 4: the dependencies make a cycle')
+        self.assertEqual(db.session.query(Task).filter_by(chat=self.chat + 1).count(), 0)
+
+    def test_import_takes_its_ids_from_the_database(self):
+        def lines():
+            # Another update creates a task after the import has started.
+            session = db.Session()
+            session.add(Task(chat=self.chat + 1, name='raced', status='TODO', priority='',
+                             overdue=False))
+            session.commit()
+            session.close()
+            yield json.dumps({'type': 'task', 'id': 1, 'name': 'imported', 'status': 'DONE',
+                              'duedate': '2000-01-01'})
+
+        self.assertEqual(self.api.board_transfer.import_board(self.chat + 1, lines()), (1, 0))
+        tasks = db.session.query(Task).filter_by(chat=self.chat + 1).order_by(Task.id).all()
+        self.assertEqual([task.name for task in tasks], ['raced', 'imported'])
+        # A finished task past its due date is flagged, as the overdue sweep does.
+        self.assertTrue(tasks[1].overdue)
+
+
+if __name__ == '__main__':
+    unittest.main()
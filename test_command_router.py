@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+import os
+import unittest
+
+from command_router import Command, CommandRouter, Reply
+from fake_telegram import FakeTelegram
+from taskbot_api import Api
+
+class TestCommand(unittest.TestCase):
+
+    def test_parse(self):
+        command = Command.parse({'message': {'chat': {'id': 1}, 'from': {'id': 2},
+                                             'text': '/rename@kanbot 3  new name '}})
+        self.assertEqual(command.name, '/rename')
+        self.assertEqual(command.text, '3  new name')
+        self.assertEqual((command.chat, command.sender), (1, 2))
+
+        self.assertIsNone(Command.parse({'callback_query': {}}))
+        self.assertIsNone(Command.parse({'message': {'chat': {'id': 1}, 'photo': []}}))
+
+    def test_failures_are_isolated(self):
+        def fail(command):
+            raise ValueError(command.text)
+
+        router = CommandRouter(lambda command: 'unknown')
+        router.register('/fail', fail)
+        commands = [Command('/fail', 'x', 1, 1, {}), Command('/other', '', 1, 1, {})]
+
+        answers = [responses for _, responses in router.answer(commands)]
+        self.assertEqual(answers, [[CommandRouter.FAILED], ['unknown']])
+
+class TestHandleUpdates(unittest.TestCase):
+    chat = 19019
+
+    def setUp(self):
+        os.environ['TASKBOT_GITHUB_ISSUES'] = '0'
+        self.server = FakeTelegram(poll_cap=0).start()
+        self.api = Api(token='TEST', api_url=self.server.url)
+
+    def tearDown(self):
+        del os.environ['TASKBOT_GITHUB_ISSUES']
+        self.server.stop()
+
+    def test_bad_updates_do_not_stop_the_batch(self):
+        def fail(command):
+            raise RuntimeError('boom')
+
+        self.api.router.register('/fail', fail)
+        message = {'chat': {'id': self.chat}}
+        self.api.handle_updates({'result': [
+            {'update_id': 1, 'channel_post': {}},
+            {'update_id': 2, 'message': dict(message, sticker={})},
+            {'update_id': 3, 'message': dict(message, text='/fail')},
+            {'update_id': 4, 'message': dict(message, text='/help')}]})
+
+        sent = self.server.sent_messages()
+        self.assertEqual(len(sent), 1)
+        self.assertTrue(sent[0]['text'].startswith(CommandRouter.FAILED + '\n'))
+        self.assertIn('Here is a list of things you can do.', sent[0]['text'])
+
+    def test_failed_replies_do_not_stop_the_batch(self):
+        call = self.api.call
+
+        def unreachable_edits(method, payload, read_timeout=None):
+            if method == 'editMessageText':
+                raise ConnectionError('gave up after the retries')
+            return call(method, payload, read_timeout)
+
+        self.api.call = unreachable_edits
+        self.api.router.register('/edit', lambda command: Reply('edited', None, 77))
+        message = {'chat': {'id': self.chat}}
+        self.api.handle_updates({'result': [
+            {'update_id': 1, 'message': dict(message, text='/edit')},
+            {'update_id': 2, 'message': dict(message, text='/help')}]})
+
+        self.assertIn('Here is a list of things you can do.',
+                      self.server.sent_messages()[0]['text'])
+
+
+if __name__ == '__main__':
+    unittest.main()
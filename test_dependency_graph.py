@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import db
+from dependency_graph import DependencyGraph, DependencyGraphs
+from tasks_controller import TasksController
+
+class TestDependencyGraph(unittest.TestCase):
+
+    def test_closure_is_incremental(self):
+        graph = DependencyGraph([(1, 2), (3, 4)])
+        graph.add(2, 3)
+
+        self.assertEqual(graph.depends_on(1), {2, 3, 4})
+        self.assertEqual(graph.blocked_by(4), {1, 2, 3})
+        self.assertTrue(graph.creates_cycle(4, 1))
+        self.assertTrue(graph.creates_cycle(2, 2))
+        self.assertFalse(graph.creates_cycle(1, 4))
+
+    def test_removing_edges_repairs_the_closure(self):
+        graph = DependencyGraph([(1, 2), (2, 3), (1, 4), (5, 3), (3, 6)])
+        graph.remove_task(2)
+        self.assertEqual(graph.depends_on(1), {4})
+        self.assertEqual(graph.blocked_by(3), {5})
+        self.assertEqual(graph.blocked_by(6), {3, 5})
+
+        graph.clear_dependencies(1)
+        self.assertEqual(graph.blocked_by(4), set())
+        self.assertEqual(graph.pairs, 3)
+
+    def test_cycles_from_old_boards_still_load(self):
+        graph = DependencyGraph([(1, 2), (2, 1), (2, 3)])
+        self.assertEqual(graph.depends_on(1), {1, 2, 3})
+        graph.clear_dependencies(2)
+        self.assertEqual(graph.depends_on(1), {2})
+
+    def test_cache_is_bounded_by_the_closure_pairs(self):
+        graphs = DependencyGraphs(pairs=5)
+        graphs.graphs[1] = DependencyGraph([(1, 2), (2, 3)])
+        graphs.graphs[2] = DependencyGraph([(4, 5), (5, 6)])
+        graphs.get(1)
+        self.assertEqual(list(graphs.graphs), [1])
+
+        graphs.graphs[2] = DependencyGraph([(1, 2), (2, 3), (3, 4)])
+        graphs.get(2)
+        self.assertEqual(list(graphs.graphs), [2])
+
+class TestDependencyCommands(unittest.TestCase):
+    chat = 16016
+
+    def setUp(self):
+        self.controller = TasksController()
+        self.ids = [self.controller.new_task(name, self.chat).split('[[')[1].split(']]')[0]
+                    for name in ['ONE', 'TWO', 'THREE']]
+
+    def tearDown(self):
+        for task_id in self.ids:
+            self.controller.delete_task(task_id, self.chat)
+
+    def test_indirect_cycle_is_rejected(self):
+        one, two, three = self.ids
+        self.controller.depends_on('{} {}'.format(one, two), self.chat)
+        self.controller.depends_on('{} {}'.format(two, three), self.chat)
+
+        response = self.controller.depends_on('{} {}'.format(three, one), self.chat)
+        self.assertEqual(response, "Task {} can't depend on task {}, it would make a cycle"
+                         .format(three, one))
+        response = self.controller.depends_on('{} {}'.format(one, one), self.chat)
+        self.assertIn('cycle', response)
+
+        query = db.session.query(db.TaskDependency).filter_by(chat=self.chat)
+        self.assertEqual(query.count(), 2)
+
+    def test_blocked_and_ready(self):
+        one, two, three = self.ids
+        self.controller.depends_on('{} {}'.format(one, two), self.chat)
+        self.controller.depends_on('{} {}'.format(two, three), self.chat)
+
+        blocked = self.controller.blocked_tasks(three, self.chat)
+        self.assertIn('[[{}]]'.format(one), blocked)
+        self.assertIn('[[{}]]'.format(two), blocked)
+
+        ready = self.controller.ready_tasks('', self.chat)
+        self.assertIn('[[{}]]'.format(three), ready)
+        self.assertNotIn('[[{}]]'.format(one), ready)
+
+        self.controller.change_multiple('{} {}'.format(two, three), self.chat, 'DONE')
+        self.assertIn('[[{}]]'.format(one), self.controller.ready_tasks('', self.chat))
+        self.assertEqual(self.controller.blocked_tasks(three, self.chat),
+                         'No task is blocked by task {}'.format(three))
+
+    def test_trees_stop_at_cycles(self):
+        tasks_by_id = {int(task_id): db.session.get(db.Task, int(task_id))
+                       for task_id in self.ids}
+        one, two = int(self.ids[0]), int(self.ids[1])
+        lines = []
+        self.controller.task_lines(tasks_by_id[one], tasks_by_id, {one: [two], two: [one]}, lines)
+
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[2], '    └── [[{}]] \U0001F195 ONE \U0001F501\n'.format(one))
+
+    def test_long_chains_render_without_recursion(self):
+        tasks_by_id = {i: db.Task(id=i, name='step {}'.format(i), status='TODO')
+                       for i in range(1, 3001)}
+        dependencies = {i: [i + 1] for i in range(1, 3000)}
+        dependencies[1].append(3000)
+        lines = []
+        self.controller.task_lines(tasks_by_id[1], tasks_by_id, dependencies, lines)
+
+        self.assertEqual(len(lines), 3001)
+        self.assertEqual(lines[2], '│   └── [[3]] \U0001F195 step 3\n')
+        self.assertEqual(lines[-2], '│   ' + '    ' * 2997 + '└── [[3000]] \U0001F195 step 3000\n')
+        self.assertEqual(lines[-1], '└── [[3000]] \U0001F195 step 3000\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import unittest
+
+import sqlalchemy
+
+import db
+from db import TaskEvent
+from flow_log import FlowLog
+from tasks_controller import TasksController
+
+class TestFlowLog(unittest.TestCase):
+    chat = 25025
+
+    def setUp(self):
+        self.clock = datetime.datetime(2030, 5, 6, 9, 0)
+        self.flow_log = TasksController.flow_log
+        TasksController.flow_log = FlowLog(now=lambda: self.clock)
+        self.controller = TasksController()
+
+    def tearDown(self):
+        TasksController.flow_log = self.flow_log
+
+    def new_task(self, name):
+        return self.controller.new_task(name, self.chat).split('[[')[1].split(']]')[0]
+
+    def test_every_change_is_an_event(self):
+        last_id = db.session.query(sqlalchemy.func.max(TaskEvent.id)).scalar() or 0
+        task_id = self.new_task('log me')
+        self.controller.rename_task('{} logged'.format(task_id), self.chat)
+        self.controller.set_priority('{} low'.format(task_id), self.chat)
+        self.controller.set_duedate('{} 01/01/2100'.format(task_id), self.chat)
+        self.controller.change_multiple(task_id, self.chat, 'DOING')
+        self.controller.change_multiple(task_id, self.chat, 'DOING')
+        self.controller.delete_task(task_id, self.chat)
+
+        query = db.session.query(TaskEvent.kind, TaskEvent.value).filter_by(
+            task_id=int(task_id)).filter(TaskEvent.id > last_id).order_by(TaskEvent.id)
+        self.assertEqual(query.all(), [('create', None), ('rename', 'logged'), ('priority', 'low'),
+                                       ('duedate', '2100-01-01'), ('status', 'DOING'),
+                                       ('delete', None)])
+
+    def test_report_reads_the_daily_totals(self):
+        self.assertEqual(self.controller.flow_report('', self.chat),
+                         'No task was finished yet, so there is nothing to report')
+
+        ids = [self.new_task('first'), self.new_task('second')]
+        self.clock += datetime.timedelta(hours=1)
+        self.controller.change_multiple(ids[0], self.chat, 'DOING')
+        self.clock += datetime.timedelta(hours=2)
+        self.controller.change_multiple(' '.join(ids), self.chat, 'DONE')
+        self.clock += datetime.timedelta(days=10)
+        self.controller.change_status(ids[0], self.chat, 'DONE')
+
+        report = self.controller.flow_report('', self.chat)
+        self.assertIn('Throughput: 0 this week, 2 in 30 days, 2 in all', report)
+        self.assertIn('Lead time: 3h in 30 days, 3h in all', report)
+        self.assertIn('Cycle time: 2h in 30 days, 2h in all', report)
+
+        for task_id in ids:
+            self.controller.delete_task(task_id, self.chat)
+        self.assertIn('2 in all', self.controller.flow_report('', self.chat))
+
+    def test_average_formats_the_largest_units(self):
+        self.assertEqual(FlowLog.average(0, 0), '-')
+        self.assertEqual(FlowLog.average(2, 2 * 30), '<1m')
+        self.assertEqual(FlowLog.average(1, 2 * 86400 + 3 * 3600 + 60), '2d 3h')
+
+
+if __name__ == '__main__':
+    unittest.main()
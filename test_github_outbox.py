@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import db
+from db import GithubIssue
+from github_integration import GithubIntegration
+from github_outbox import GithubOutbox
+
+class FakeGithubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        issue = json.loads(self.rfile.read(length).decode('utf8'))
+        status = self.server.statuses.pop(0) if self.server.statuses else 201
+        self.server.issues.append((issue['title'], status))
+
+        self.send_response(status)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, format, *args):
+        pass
+
+class TestGithubOutbox(unittest.TestCase):
+    chat = 12250
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeGithubHandler)
+        self.server.daemon_threads = True
+        self.server.connections = 0
+        self.server.issues = []
+        self.server.statuses = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        github = GithubIntegration(api_url='http://127.0.0.1:{}'.format(self.server.server_address[1]),
+                                   login=['user', 'password'])
+        self.notifications = []
+        self.outbox = GithubOutbox(lambda text, chat: self.notifications.append((text, chat)),
+                                   github)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        db.session.query(GithubIssue).filter_by(chat=self.chat).delete()
+        db.session.commit()
+
+    def test_drain_creates_issues_on_one_session(self):
+        for title in ['first', 'second', 'third']:
+            self.outbox.enqueue(self.chat, title)
+
+        self.assertEqual(self.outbox.drain(), 3)
+        self.assertEqual([title for title, _ in self.server.issues], ['first', 'second', 'third'])
+        self.assertEqual(self.server.connections, 1)
+        self.assertIn(('Successfully created Issue second', self.chat), self.notifications)
+
+    def test_failed_issue_is_retried_with_backoff(self):
+        self.server.statuses = [502]
+        issue_id, = self.outbox.enqueue(self.chat, 'flaky')
+
+        self.outbox.drain()
+        issue = db.session.query(GithubIssue).filter_by(id=issue_id).one()
+        self.assertEqual((issue.status, issue.attempts), ('PENDING', 1))
+        self.assertGreater(issue.next_attempt, datetime.datetime.now())
+        self.assertEqual(self.notifications, [])
+
+        issue.next_attempt = datetime.datetime.now()
+        db.session.commit()
+        self.outbox.drain()
+        db.session.refresh(issue)
+        self.assertEqual(issue.status, 'CREATED')
+        self.assertEqual(self.notifications, [('Successfully created Issue flaky', self.chat)])
+
+    def test_rejected_issue_is_reported(self):
+        self.server.statuses = [422]
+        self.outbox.enqueue(self.chat, 'invalid')
+
+        self.outbox.drain()
+        self.assertEqual(self.notifications, [('Could not create Issue invalid', self.chat)])
+
+
+if __name__ == '__main__':
+    unittest.main()
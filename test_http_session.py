@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import unittest
+
+from fake_telegram import FakeTelegram
+from http_session import HttpSession
+
+class TestHttpSession(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeTelegram().start()
+        self.url = self.server.bot_url() + 'sendMessage'
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_connections_are_reused_under_load(self):
+        http = HttpSession(pool_size=4)
+
+        def send(worker):
+            for i in range(25):
+                http.post_json(self.url, {'chat_id': worker, 'text': 'message {}'.format(i)})
+
+        workers = [threading.Thread(target=send, args=(worker,)) for worker in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        http.close()
+
+        self.assertEqual(len(self.server.sent_messages()), 100)
+        self.assertLessEqual(self.server.connections, 4)
+
+    def test_messages_are_json_bodies(self):
+        http = HttpSession()
+        http.post_json(self.url, {'chat_id': 1, 'text': '*bold* & [[1]]'})
+        http.close()
+
+        self.assertEqual(self.server.sent_messages(), [{'chat_id': 1, 'text': '*bold* & [[1]]'}])
+
+    def test_retries_honor_retry_after(self):
+        self.server.fail_next(429, retry_after=0)
+        self.server.fail_next(502)
+        http = HttpSession(backoff=0)
+
+        response = http.post_json(self.url, {'chat_id': 1, 'text': 'retried'})
+        http.close()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_gives_up_after_max_retries(self):
+        for _ in range(3):
+            self.server.fail_next(429, retry_after=0)
+        http = HttpSession(max_retries=2)
+
+        response = http.post_json(self.url, {'chat_id': 1, 'text': 'dropped'})
+        http.close()
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(HttpSession.get_retry_after(response), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
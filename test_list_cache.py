@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import unittest
+
+from list_cache import ListCache
+
+class TestListCache(unittest.TestCase):
+    today = datetime.date(2030, 1, 1)
+
+    def test_bump_invalidates(self):
+        cache = ListCache()
+        cache.put(1, self.today, cache.version(1), ['list'])
+        self.assertEqual(cache.get(1, self.today), ['list'])
+
+        cache.bump(1)
+        self.assertIsNone(cache.get(1, self.today))
+
+    def test_stale_render_is_not_stored(self):
+        cache = ListCache()
+        version = cache.version(1)
+        cache.bump(1)
+        cache.put(1, self.today, version, ['stale'])
+        self.assertIsNone(cache.get(1, self.today))
+
+    def test_day_rollover_invalidates(self):
+        cache = ListCache()
+        cache.put(1, self.today, cache.version(1), ['list'])
+        self.assertIsNone(cache.get(1, self.today + datetime.timedelta(days=1)))
+
+    def test_least_recently_used_is_evicted(self):
+        cache = ListCache(size=2)
+        for chat in [1, 2]:
+            cache.put(chat, self.today, cache.version(chat), [str(chat)])
+        cache.get(1, self.today)
+        cache.put(3, self.today, cache.version(3), ['3'])
+
+        self.assertEqual(list(cache.entries), [1, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
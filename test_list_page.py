@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+import os
+import unittest
+
+from sqlalchemy import event
+
+import db
+from fake_telegram import FakeTelegram
+from taskbot_api import Api
+from message_queue import MESSAGE_LIMIT
+from tasks_controller import TasksController
+
+class TestListPage(unittest.TestCase):
+    chat = 21021
+
+    def setUp(self):
+        self.controller = TasksController()
+        self.controller.PAGE_SIZE = 2
+        self.ids = [int(self.controller.new_task(name, self.chat).split('[[')[1].split(']]')[0])
+                    for name in ['A', 'B', 'C', 'D', 'E', 'F']]
+        # B and D hang under A and C, leaving A, C, E and F as roots.
+        self.controller.depends_on('{} {}'.format(self.ids[0], self.ids[1]), self.chat)
+        self.controller.depends_on('{} {}'.format(self.ids[2], self.ids[3]), self.chat)
+
+    def tearDown(self):
+        for task_id in self.ids:
+            self.controller.delete_task(str(task_id), self.chat)
+
+    def test_pages_seek_by_root_id(self):
+        a, b, c, d, e, f = self.ids
+        page = self.controller.list_page(self.chat)
+        self.assertEqual((page['first'], page['last']), (a, c))
+        self.assertEqual((page['has_previous'], page['has_next']), (False, True))
+        self.assertIn('└── [[{}]] \U0001F195 B\n'.format(b), page['text'])
+        self.assertIn('└── [[{}]] \U0001F195 D\n'.format(d), page['text'])
+
+        page = self.controller.list_page(self.chat, after=page['last'])
+        self.assertEqual((page['first'], page['last']), (e, f))
+        self.assertEqual((page['has_previous'], page['has_next']), (True, False))
+
+        page = self.controller.list_page(self.chat, before=page['first'])
+        self.assertEqual((page['first'], page['last']), (a, c))
+        self.assertFalse(page['has_previous'])
+
+    def test_oversized_tree_is_cut_to_one_message(self):
+        chat = self.chat + 100
+        names = '\n'.join('LONG DEPENDENCY NAME NUMBER {:03} {}'.format(i, 'x' * 30)
+                          for i in range(149))
+        ids = [line.split('[[')[1].split(']]')[0]
+               for line in self.controller.new_task(names, chat).split('\n')]
+        self.controller.depends_on(' '.join(ids[:-1]), chat)
+        try:
+            page = self.controller.list_page(chat)
+            self.assertLessEqual(len(page['text']), MESSAGE_LIMIT)
+            self.assertEqual((page['first'], page['last']), (int(ids[0]), int(ids[0])))
+            self.assertTrue(page['has_next'])
+            self.assertIn('more lines of [[{}]] not shown'.format(ids[0]), page['text'])
+        finally:
+            for task_id in ids:
+                self.controller.delete_task(task_id, chat)
+
+class TestListPageCallbacks(unittest.TestCase):
+    chat = 21022
+
+    def setUp(self):
+        os.environ['TASKBOT_GITHUB_ISSUES'] = '0'
+        self.server = FakeTelegram(poll_cap=0).start()
+        self.api = Api(token='TEST', api_url=self.server.url)
+        self.api.controller.PAGE_SIZE = 1
+        self.api.controller.WHOLE_BOARD_SIZE = 1
+        self.ids = [self.api.controller.new_task(name, self.chat).split('[[')[1].split(']]')[0]
+                    for name in ['FIRST', 'SECOND']]
+
+    def tearDown(self):
+        for task_id in self.ids:
+            self.api.controller.delete_task(task_id, self.chat)
+        del os.environ['TASKBOT_GITHUB_ISSUES']
+        self.server.stop()
+
+    def test_next_button_edits_the_page(self):
+        self.api.handle_updates({'result': [
+            {'update_id': 1, 'message': {'chat': {'id': self.chat}, 'text': '/list'}}]})
+        sent = self.server.sent_messages()[0]
+        self.assertIn('FIRST', sent['text'])
+        self.assertNotIn('SECOND', sent['text'])
+        button = sent['reply_markup']['inline_keyboard'][0][0]
+        self.assertEqual(button['callback_data'], '/page after {}'.format(self.ids[0]))
+
+        self.api.handle_updates({'result': [
+            {'update_id': 2, 'callback_query': {
+                'id': 'CALLBACK', 'from': {'id': 5}, 'data': button['callback_data'],
+                'message': {'message_id': 77, 'chat': {'id': self.chat}}}}]})
+
+        calls = dict(self.server.requests)
+        self.assertEqual(calls['answerCallbackQuery'], {'callback_query_id': 'CALLBACK'})
+        self.assertEqual(calls['editMessageText']['message_id'], 77)
+        self.assertIn('SECOND', calls['editMessageText']['text'])
+        self.assertEqual(calls['editMessageText']['reply_markup']['inline_keyboard'][0][0]
+                         ['callback_data'], '/page before {}'.format(self.ids[1]))
+
+    def test_repeated_list_is_served_from_the_cache(self):
+        update = {'update_id': 1, 'message': {'chat': {'id': self.chat}, 'text': '/list'}}
+        self.api.handle_updates({'result': [update]})
+        statements = []
+
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+        try:
+            self.api.handle_updates({'result': [dict(update, update_id=2)]})
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_statement)
+
+        self.assertEqual(statements, [])
+        sent = self.server.sent_messages()
+        self.assertEqual(sent[0]['text'], sent[1]['text'])
+        self.assertIn('reply_markup', sent[1])
+
+    def test_long_tree_is_paged_in_one_message(self):
+        chat = self.chat + 100
+        names = '\n'.join('DEPENDENCY {:03}'.format(i) for i in range(401))
+        ids = [line.split('[[')[1].split(']]')[0]
+               for line in self.api.controller.new_task(names, chat).split('\n')]
+        self.api.controller.depends_on(' '.join(ids), chat)
+        self.api.controller.WHOLE_BOARD_SIZE = 1000
+        try:
+            self.api.handle_updates({'result': [
+                {'update_id': 1, 'message': {'chat': {'id': chat}, 'text': '/list'}}]})
+            sent = self.server.sent_messages()
+            self.assertEqual(len(sent), 1)
+            self.assertLessEqual(len(sent[0]['text']), MESSAGE_LIMIT)
+            self.assertIn('more lines of [[{}]] not shown'.format(ids[0]), sent[0]['text'])
+        finally:
+            for task_id in ids:
+                self.api.controller.delete_task(task_id, chat)
+
+    def test_small_board_is_listed_whole_from_one_load(self):
+        self.api.controller.WHOLE_BOARD_SIZE = 200
+        statements = []
+
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+        try:
+            self.api.handle_updates({'result': [
+                {'update_id': 1, 'message': {'chat': {'id': self.chat}, 'text': '/list'}}]})
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_statement)
+
+        self.assertEqual(len([s for s in statements if s.startswith('SELECT')]), 2)
+        text = ''.join(message['text'] for message in self.server.sent_messages())
+        self.assertIn('FIRST', text)
+        self.assertIn('SECOND', text)
+        self.assertIn('_Status_', text)
+        self.assertIn('_Priorities_', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
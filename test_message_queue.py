@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from message_queue import MessageQueue, TokenBucket, coalesce, open_entities, split_message
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestMessageQueue(unittest.TestCase):
+
+    def test_split_respects_limit_and_lines(self):
+        lines = ['[[{}]] task number {}'.format(i, i) for i in range(400)]
+        chunks = split_message('\n'.join(lines))
+
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(len(chunk), 4096)
+        self.assertEqual('\n'.join(chunks).split('\n'), lines)
+
+    def test_split_keeps_entities_whole(self):
+        text = 'a ' * 10 + '*bold words here* tail'
+        for chunk in split_message(text, 30):
+            self.assertEqual(open_entities(chunk), [])
+            self.assertLessEqual(len(chunk), 30)
+
+    def test_split_reopens_entity_without_spaces(self):
+        chunks = split_message('*' + 'x' * 50 + '*', 20)
+
+        for chunk in chunks:
+            self.assertLessEqual(len(chunk), 20)
+            self.assertEqual(open_entities(chunk), [])
+        self.assertEqual(''.join(chunks).replace('*', ''), 'x' * 50)
+
+    def test_coalesce_merges_status_changes(self):
+        responses = ['*DONE* task [[{}]] task {}'.format(i, i) for i in range(50)]
+        self.assertEqual(coalesce(responses), ['\n'.join(responses)])
+
+    def test_token_bucket_paces_bursts(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=10, capacity=2, clock=clock)
+
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertAlmostEqual(bucket.reserve(), 0.1)
+        clock.now = 1.0
+        self.assertEqual(bucket.reserve(), 0.0)
+
+    def test_flush_sends_one_call_per_chat(self):
+        delivered = []
+        queue = MessageQueue(lambda text, chat_id, reply_markup: delivered.append((chat_id, text)))
+        for i in range(50):
+            queue.put('*DONE* task [[{}]]'.format(i), 1)
+        queue.put('other chat', 2)
+        queue.flush()
+
+        self.assertEqual(len(delivered), 2)
+        self.assertEqual(delivered[0][1].count('\n'), 49)
+        self.assertEqual(delivered[1], (2, 'other chat'))
+
+    def test_keyboard_goes_with_the_last_part(self):
+        delivered = []
+        queue = MessageQueue(lambda text, chat_id, reply_markup: delivered.append(
+            (len(text), reply_markup)), limit=100)
+        queue.put('\n'.join('line {}'.format(i) for i in range(40)), 1, {'inline_keyboard': []})
+        queue.flush()
+
+        self.assertGreater(len(delivered), 1)
+        self.assertTrue(all(length <= 100 for length, _ in delivered))
+        self.assertEqual([markup for _, markup in delivered],
+                         [None] * (len(delivered) - 1) + [{'inline_keyboard': []}])
+
+
+if __name__ == '__main__':
+    unittest.main()
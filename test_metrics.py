@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+import os
+import unittest
+from urllib.request import urlopen
+
+from fake_telegram import FakeTelegram
+from metrics import Histogram, Metrics, metrics
+from taskbot_api import Api
+
+class TestHistogram(unittest.TestCase):
+
+    def test_buckets_are_cumulative(self):
+        histogram = Histogram(buckets=(0.1, 1.0))
+        for value in [0.05, 0.5, 0.7, 3.0]:
+            histogram.observe(value)
+
+        lines = list(histogram.lines('latency', [('command', '/list')]))
+
+        self.assertEqual(lines, ['latency_bucket{command="/list",le="0.1"} 1',
+                                 'latency_bucket{command="/list",le="1.0"} 3',
+                                 'latency_bucket{command="/list",le="+Inf"} 4',
+                                 'latency_sum{command="/list"} 4.25',
+                                 'latency_count{command="/list"} 4'])
+        self.assertEqual(histogram.quantile(0.5), 1.0)
+
+    def test_drained_observations_merge_into_another_registry(self):
+        worker, dispatcher = Metrics(), Metrics()
+        dispatcher.observe_command('/new', 1, 0.002)
+        worker.observe_command('/new', 2, 0.2)
+        worker.observe_query(0.001)
+
+        dispatcher.merge(worker.drain())
+        dispatcher.merge(worker.drain())
+
+        self.assertEqual(dispatcher.commands['/new'].count, 2)
+        self.assertEqual(dispatcher.chats, {1: 1, 2: 1})
+        self.assertEqual(dispatcher.db_queries.count, 1)
+        self.assertEqual(worker.commands, {})
+
+    def test_served_over_http(self):
+        registry = Metrics()
+        registry.observe_command('/new', 1, 0.002)
+        registry.add_pending(3)
+        server = registry.serve(0)
+        try:
+            url = 'http://127.0.0.1:{}/metrics'.format(server.server_address[1])
+            text = urlopen(url).read().decode('utf8')
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertIn('# TYPE taskbot_command_seconds histogram', text)
+        self.assertIn('taskbot_command_seconds_count{command="/new"} 1', text)
+        self.assertIn('taskbot_updates_pending 3', text)
+
+class TestStats(unittest.TestCase):
+    chat = 15015
+
+    def setUp(self):
+        os.environ['TASKBOT_GITHUB_ISSUES'] = '0'
+        self.server = FakeTelegram(poll_cap=0).start()
+        self.api = Api(token='TEST', api_url=self.server.url)
+
+    def tearDown(self):
+        del os.environ['TASKBOT_GITHUB_ISSUES']
+        self.server.stop()
+
+    def message(self, text):
+        return {'message': {'chat': {'id': self.chat}, 'from': {'id': 7}, 'text': text}}
+
+    def test_commands_and_queries_are_recorded(self):
+        queries = metrics.db_queries.count
+        calls = metrics.controller['list_whole'].count
+        self.api.process_update(self.message('/new measured'))
+        self.api.process_update(self.message('/list'))
+        self.api.process_update(self.message('/delete {}'.format(
+            self.api.controller.load_board(self.chat)['tasks'][-1].id)))
+
+        self.assertEqual(metrics.controller['list_whole'].count, calls + 1)
+        self.assertNotIn('task_lines', metrics.controller)
+        self.assertGreater(metrics.db_queries.count, queries)
+        self.assertGreater(metrics.commands['/list'].count, 0)
+        self.assertGreater(metrics.chats[self.chat], 0)
+
+    def test_stats_are_for_admins_only(self):
+        _, responses = self.api.process_update(self.message('/stats'))
+        self.assertEqual(responses, ["I'm sorry dave. I'm afraid I can't do that."])
+
+        self.api.ADMINS = [7]
+        _, responses = self.api.process_update(self.message('/stats'))
+        self.assertTrue(responses[0].startswith('*Commands*\n'))
+        self.assertIn('{} '.format(self.chat), responses[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
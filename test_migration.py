@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import unittest
+
+import sqlalchemy
+
+import db
+
+class TestMigration(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        self.engine = sqlalchemy.create_engine('sqlite:///{}'.format(self.path))
+        with self.engine.begin() as connection:
+            connection.execute(sqlalchemy.text(
+                'CREATE TABLE tasks (id INTEGER PRIMARY KEY, chat INTEGER, name VARCHAR, '
+                'status VARCHAR, dependencies VARCHAR, parents VARCHAR, priority VARCHAR, '
+                'overdue BOOLEAN, duedate DATE)'))
+            connection.execute(sqlalchemy.text(
+                "INSERT INTO tasks (id, chat, name, status, dependencies, parents) VALUES "
+                "(1, 7, 'one', 'TODO', '2,3,', ''), (2, 7, 'two', 'TODO', '99,', '1,'), "
+                "(3, 7, 'three', 'TODO', '', '1,'), (4, 8, 'four', 'TODO', '1,', '')"))
+        db.Base.metadata.create_all(self.engine)
+
+    def tearDown(self):
+        self.engine.dispose()
+        os.remove(self.path)
+
+    def edges(self):
+        with self.engine.connect() as connection:
+            return connection.execute(sqlalchemy.text(
+                'SELECT chat, task_id, depends_on_id FROM task_dependencies '
+                'ORDER BY task_id, depends_on_id')).fetchall()
+
+    def test_strings_become_edges_once(self):
+        db.migrate_dependency_strings(self.engine)
+
+        # 99 and the task of another chat don't exist for these tasks, so they are dropped.
+        self.assertEqual(self.edges(), [(7, 1, 2), (7, 1, 3)])
+        columns = [column['name'] for column in sqlalchemy.inspect(self.engine).get_columns('tasks')]
+        self.assertNotIn('dependencies', columns)
+        self.assertNotIn('parents', columns)
+
+        statements = []
+        sqlalchemy.event.listen(self.engine, 'before_cursor_execute',
+                                lambda *args: statements.append(args[2]))
+        db.migrate_dependency_strings(self.engine)
+        self.assertFalse([statement for statement in statements
+                          if statement.startswith(('SELECT id', 'UPDATE', 'INSERT', 'ALTER'))])
+        self.assertEqual(self.edges(), [(7, 1, 2), (7, 1, 3)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import unittest
+
+import db
+from db import Task
+from overdue_scheduler import OverdueScheduler
+
+class TestOverdueScheduler(unittest.TestCase):
+    chat = 12260
+    today = datetime.date(2030, 5, 10)
+
+    def setUp(self):
+        self.notifications = []
+        self.scheduler = OverdueScheduler(lambda text, chat: self.notifications.append((text, chat)))
+        self.tasks = {}
+        for name, duedate, overdue, status in [
+                ('LATE', self.today - datetime.timedelta(days=1), False, 'TODO'),
+                ('TODAY', self.today, None, 'TODO'),
+                ('TOMORROW', self.today + datetime.timedelta(days=1), False, 'DOING'),
+                ('FLAGGED', self.today - datetime.timedelta(days=3), True, 'TODO'),
+                ('NEXT WEEK', self.today + datetime.timedelta(days=7), False, 'TODO'),
+                ('FINISHED', self.today + datetime.timedelta(days=1), False, 'DONE')]:
+            task = Task(chat=self.chat, name=name, status=status, priority='',
+                        overdue=overdue, duedate=duedate)
+            db.session.add(task)
+            self.tasks[name] = task
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.query(Task).filter_by(chat=self.chat).delete()
+        db.session.commit()
+
+    def test_sweep_flags_only_new_overdue_tasks(self):
+        self.assertEqual(self.scheduler.sweep(self.today), 1)
+        db.session.expire_all()
+
+        overdue = dict((task.name, task.overdue) for task in self.tasks.values())
+        self.assertEqual(overdue, {'LATE': True, 'TODAY': None, 'TOMORROW': False,
+                                   'FLAGGED': True, 'NEXT WEEK': False, 'FINISHED': False})
+        self.assertEqual(self.scheduler.sweep(self.today), 0)
+
+    def test_reminders_fire_from_the_heap(self):
+        self.scheduler.refresh(self.today)
+        names = [task.name for task in db.session.query(Task).filter(
+            Task.id.in_([reminder[2] for reminder in self.scheduler.reminders]))]
+        self.assertEqual(sorted(names), ['TODAY', 'TOMORROW'])
+
+        morning = datetime.datetime.combine(self.today, datetime.time(9, 0))
+        self.assertEqual(self.scheduler.remind(morning - datetime.timedelta(minutes=1)), 1)
+        self.assertEqual(self.notifications, [
+            ('\U000023F0 Task [[{}]] TODAY is due on 10/05/2030'.format(self.tasks['TODAY'].id),
+             self.chat)])
+
+        self.assertEqual(self.scheduler.remind(morning), 1)
+        self.scheduler.refresh(self.today)
+        self.assertEqual(self.scheduler.remind(morning), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
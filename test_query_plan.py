@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import re
+import unittest
+
+from sqlalchemy import event
+
+import db
+from overdue_scheduler import OverdueScheduler
+from tasks_controller import TasksController
+
+SCANNED_TABLES = ('tasks', 'task_dependencies')
+
+class TestQueryPlan(unittest.TestCase):
+
+    def run_controller(self, chat):
+        controller = TasksController()
+        ids = [controller.new_task(name, chat).split('[[')[1].split(']]')[0]
+               for name in ['PLAN A', 'PLAN B', 'PLAN C']]
+
+        controller.rename_task('{} PLAN AA'.format(ids[0]), chat)
+        controller.depends_on('{} {} {}'.format(ids[0], ids[1], ids[2]), chat)
+        controller.change_multiple('{} {}'.format(ids[0], ids[1]), chat, 'DOING')
+        controller.set_priority('{} high'.format(ids[1]), chat)
+        controller.set_duedate('{} 01/01/2100'.format(ids[2]), chat)
+        controller.duplicate_task(ids[0], chat)
+        controller.list_tasks('', chat)
+        controller.list_page(chat)
+        controller.list_page(chat, after=int(ids[0]))
+        controller.list_page(chat, before=int(ids[2]))
+        controller.search_tasks('PLAN', chat)
+        controller.change_multiple(ids[1], chat, 'DONE')
+        controller.flow_report('', chat)
+        controller.depends_on(ids[0], chat)
+        for task_id in ids:
+            controller.delete_task(task_id, chat)
+
+    def test_controller_queries_use_indexes(self):
+        statements = []
+
+        def record_statement(conn, cursor, statement, parameters, context, executemany):
+            if executemany:
+                parameters = parameters[0]
+            statements.append((statement, parameters))
+
+        event.listen(db.engine, 'before_cursor_execute', record_statement)
+        try:
+            self.run_controller(12240)
+            scheduler = OverdueScheduler(notify=None)
+            scheduler.sweep(datetime.date.today())
+            scheduler.refresh(datetime.date.today())
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record_statement)
+
+        scan = re.compile(r'^SCAN (TABLE )?({})\b'.format('|'.join(SCANNED_TABLES)))
+        connection = db.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            for statement, parameters in statements:
+                if not statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+                    continue
+                cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+                for row in cursor.fetchall():
+                    detail = row[-1]
+                    self.assertIsNone(scan.match(detail),
+                                      '{} -> {}'.format(' '.join(statement.split()), detail))
+        finally:
+            connection.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import db
+from tasks_controller import TasksController
+
+class TestSearch(unittest.TestCase):
+    chat = 23023
+
+    def setUp(self):
+        self.controller = TasksController()
+        names = 'write the report\nreview report draft\nbuy milk'
+        self.ids = [line.split('[[')[1].split(']]')[0]
+                    for line in self.controller.new_task(names, self.chat).split('\n')]
+        self.other = self.controller.new_task('report for another chat', self.chat + 1)
+        self.other = self.other.split('[[')[1].split(']]')[0]
+
+    def tearDown(self):
+        for task_id in self.ids:
+            self.controller.delete_task(task_id, self.chat)
+        self.controller.delete_task(self.other, self.chat + 1)
+
+    def test_search_is_ranked_and_scoped_to_the_chat(self):
+        self.assertTrue(db.SEARCH)
+        result = self.controller.search_tasks('repo', self.chat)
+
+        self.assertIn('[[{}]]'.format(self.ids[0]), result)
+        self.assertIn('[[{}]]'.format(self.ids[1]), result)
+        self.assertNotIn('milk', result)
+        self.assertNotIn('another chat', result)
+
+        self.assertEqual(self.controller.search_tasks('"milk', self.chat).count('\n'), 2)
+
+    def test_best_match_comes_first(self):
+        chat = self.chat + 2
+        names = 'a long report on the budget of the next quarter\nreport the report'
+        ids = [line.split('[[')[1].split(']]')[0]
+               for line in self.controller.new_task(names, chat).split('\n')]
+        try:
+            result = self.controller.search_tasks('report', chat)
+            self.assertLess(result.index('[[{}]]'.format(ids[1])),
+                            result.index('[[{}]]'.format(ids[0])))
+        finally:
+            for task_id in ids:
+                self.controller.delete_task(task_id, chat)
+
+    def test_index_follows_renames_and_deletes(self):
+        self.controller.rename_task('{} buy bread'.format(self.ids[2]), self.chat)
+        self.assertIn('bread', self.controller.search_tasks('bread', self.chat))
+        self.assertEqual(self.controller.search_tasks('milk', self.chat),
+                         'No task matches milk')
+
+        self.controller.delete_task(self.ids.pop(), self.chat)
+        self.assertEqual(self.controller.search_tasks('bread', self.chat),
+                         'No task matches bread')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import unittest
+
+import db
+from db import Task
+from fake_telegram import FakeTelegram
+from metrics import metrics
+from sharding import ShardedDispatcher
+from taskbot_api import Api
+
+class TestSharding(unittest.TestCase):
+    chats = [18018, 18019, 18020, 18021]
+
+    def setUp(self):
+        os.environ['TASKBOT_GITHUB_ISSUES'] = '0'
+        self.telegram = FakeTelegram(poll_cap=0).start()
+        self.api = Api(token='TEST', api_url=self.telegram.url, background=False)
+        self.api.ADMINS = [7]
+        self.dispatcher = ShardedDispatcher(2, api=self.api).start()
+
+    def tearDown(self):
+        self.dispatcher.stop(timeout=10)
+        del os.environ['TASKBOT_GITHUB_ISSUES']
+        self.telegram.stop()
+
+    def updates(self, text):
+        return {'result': [{'message': {'chat': {'id': chat}, 'text': text}}
+                           for chat in self.chats]}
+
+    def wait_for_replies(self, text, chats=None):
+        chats = set(chats or self.chats)
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            answered = set(payload['chat_id'] for payload in self.telegram.sent_messages()
+                           if text in payload['text'])
+            if answered == chats:
+                break
+            time.sleep(0.05)
+        return answered
+
+    def test_chats_are_answered_by_their_shard(self):
+        self.assertEqual([self.dispatcher.shard_of(update)
+                          for update in self.updates('/help')['result']], [0, 1, 0, 1])
+
+        self.dispatcher.handle_updates(self.updates('/help'))
+
+        self.assertEqual(self.wait_for_replies('Here is a list'), set(self.chats))
+        deadline = time.monotonic() + 5
+        while any(self.dispatcher.depths()) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(self.dispatcher.depths(), [0, 0])
+
+    def test_restart_answers_the_queued_updates_first(self):
+        process = self.dispatcher.shards[0].process
+        self.dispatcher.handle_updates(self.updates('/help'))
+        self.dispatcher.restart(0)
+        self.dispatcher.handle_updates(self.updates('/start'))
+
+        process.join(30)
+        self.dispatcher.supervise()
+        self.assertIsNot(self.dispatcher.shards[0].process, process)
+        self.assertEqual(self.wait_for_replies('Here is a list'), set(self.chats))
+        self.assertEqual(self.wait_for_replies('Welcome!'), set(self.chats))
+
+    def test_stats_merge_every_worker(self):
+        answered = metrics.commands['/help'].count
+        self.dispatcher.handle_updates(self.updates('/help'))
+        self.assertEqual(self.wait_for_replies('Here is a list'), set(self.chats))
+
+        deadline = time.monotonic() + 10
+        while metrics.commands['/help'].count < answered + 4 and time.monotonic() < deadline:
+            time.sleep(0.05)
+            self.dispatcher.collect()
+        self.dispatcher.handle_updates({'result': [{'message': {
+            'chat': {'id': 7}, 'from': {'id': 7}, 'text': '/stats'}}]})
+
+        self.assertEqual(self.wait_for_replies('*Commands*', [7]), {7})
+        stats = [payload['text'] for payload in self.telegram.sent_messages()
+                 if payload['chat_id'] == 7][-1]
+        self.assertIn('/help {}x'.format(answered + 4), stats)
+        self.assertIn('worker 0 has 0 queued', stats)
+        self.assertIn('worker 1 has 0 queued', stats)
+
+    def test_sweep_clears_the_workers_caches(self):
+        chat = self.chats[0]
+        self.dispatcher.handle_updates({'result': [
+            {'message': {'chat': {'id': chat}, 'text': '/new SWEPT'}},
+            {'message': {'chat': {'id': chat}, 'text': '/list'}}]})
+        self.assertEqual(self.wait_for_replies('Task List', [chat]), {chat})
+        task = db.session.query(Task).filter_by(chat=chat, name='SWEPT').one()
+        # What the overdue sweep does, behind the worker's back.
+        task.overdue = True
+        db.session.commit()
+
+        self.dispatcher.clear_caches()
+        self.dispatcher.handle_updates({'result': [
+            {'message': {'chat': {'id': chat}, 'text': '/list'}},
+            {'message': {'chat': {'id': chat}, 'text': '/delete {}'.format(task.id)}}]})
+        self.assertEqual(self.wait_for_replies('*OVERDUE*\n[[{}]] SWEPT'.format(task.id),
+                                               [chat]), {chat})
+
+
+if __name__ == '__main__':
+    unittest.main()
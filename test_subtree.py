@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from sqlalchemy import event
+
+import db
+from tasks_controller import TasksController
+
+class TestSubtree(unittest.TestCase):
+    chat = 22022
+
+    def setUp(self):
+        self.controller = TasksController()
+
+    def make_chain(self, length):
+        """This function creates tasks where each one depends on the next."""
+        names = '\n'.join('NODE {}'.format(i) for i in range(length))
+        ids = [line.split('[[')[1].split(']]')[0]
+               for line in self.controller.new_task(names, self.chat).split('\n')]
+        for parent, child in zip(ids, ids[1:]):
+            self.controller.depends_on('{} {}'.format(parent, child), self.chat)
+        return ids
+
+    def count_statements(self, function, *args):
+        statements = []
+
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+        try:
+            result = function(*args)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_statement)
+        return result, len(statements)
+
+    def test_duplicate_and_delete_cost_is_flat(self):
+        counts = []
+        for length in [3, 30]:
+            ids = self.make_chain(length)
+            response, duplicated = self.count_statements(
+                self.controller.duplicate_task, '{} subtree'.format(ids[0]), self.chat)
+            self.assertTrue(response.endswith('NODE 0 with a copy of its {} dependencies'
+                                              .format(length - 1)))
+            copy = response.split('[[')[1].split(']]')[0]
+            self.assertEqual(self.controller.subtree_ids(self.chat, int(copy)),
+                             list(range(int(copy), int(copy) + length)))
+
+            response, deleted = self.count_statements(
+                self.controller.delete_task, '{} subtree'.format(ids[0]), self.chat)
+            self.assertEqual(response, 'Task [[{}]] and its {} dependencies deleted'
+                             .format(ids[0], length - 1))
+            self.controller.delete_task('{} subtree'.format(copy), self.chat)
+            counts.append((duplicated, deleted))
+
+        self.assertEqual(counts[0], counts[1])
+        query = db.session.query(db.Task).filter_by(chat=self.chat)
+        self.assertEqual(query.count(), 0)
+        query = db.session.query(db.TaskDependency).filter_by(chat=self.chat)
+        self.assertEqual(query.count(), 0)
+
+    def test_delete_keeps_shared_dependencies(self):
+        names = 'A\nB\nC\nD\nE'
+        a, b, c, d, e = [line.split('[[')[1].split(']]')[0]
+                         for line in self.controller.new_task(names, self.chat).split('\n')]
+        # A needs C and E, B also needs C, and C needs D.
+        self.controller.depends_on('{} {} {}'.format(a, c, e), self.chat)
+        self.controller.depends_on('{} {}'.format(b, c), self.chat)
+        self.controller.depends_on('{} {}'.format(c, d), self.chat)
+
+        response = self.controller.delete_task('{} subtree'.format(a), self.chat)
+        self.assertEqual(response, 'Task [[{}]] and its 1 dependencies deleted\n'
+                                   'Kept [[{}]] [[{}]]: other tasks still depend on them'
+                         .format(a, c, d))
+        remaining = db.session.query(db.Task.id).filter_by(chat=self.chat)
+        self.assertEqual(sorted(task_id for task_id, in remaining),
+                         [int(b), int(c), int(d)])
+        self.assertEqual(self.controller.subtree_ids(self.chat, int(b)),
+                         [int(b), int(c), int(d)])
+
+        self.controller.delete_task('{} subtree'.format(b), self.chat)
+        self.assertEqual(db.session.query(db.Task).filter_by(chat=self.chat).count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,11 @@
 # -*- coding: utf-8 -*-
 
+import re
 import unittest
+
+from sqlalchemy import event
+
+import db
 from tasks_controller import TasksController
 
 class TestTaskBot(unittest.TestCase):
@@ -17,6 +22,131 @@ class TestTaskBot(unittest.TestCase):
         command = TasksController.delete_task(self.id, 12234)
         self.assertEqual(command, 'Task [[{}]] deleted'.format(self.id))
 
+    def test_list_default_query_count(self):
+        chat = 12235
+        controller = TasksController()
+        ids = []
+        for name in ['ROOT', 'CHILD', 'GRANDCHILD']:
+            command = controller.new_task(name, chat)
+            ids.append(command.split('[[')[1].split(']]')[0])
+        controller.depends_on('{} {}'.format(ids[0], ids[1]), chat)
+        controller.depends_on('{} {}'.format(ids[1], ids[2]), chat)
+
+        statements = []
+
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+        try:
+            task_list = controller.list_default(chat)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_statement)
+
+        self.assertIn('└── [[{}]] \U0001F195 CHILD\n'.format(ids[1]), task_list)
+        self.assertIn('    └── [[{}]] \U0001F195 GRANDCHILD\n'.format(ids[2]), task_list)
+        self.assertEqual(len([s for s in statements if s.startswith('SELECT')]), 2)
+
+        for task_id in ids:
+            controller.delete_task(task_id, chat)
+
+    def test_list_tasks_single_load(self):
+        chat = 12237
+        controller = TasksController()
+        ids = [controller.new_task(name, chat).split('[[')[1].split(']]')[0]
+               for name in ['FIRST', 'SECOND']]
+        controller.change_status(ids[1], chat, 'DOING')
+        controller.set_priority('{} high'.format(ids[0]), chat)
+
+        statements = []
+
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+        try:
+            task_list, by_status, by_priority = controller.list_tasks('', chat)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_statement)
+
+        self.assertIn('*DOING*\n[[{}]] SECOND\n'.format(ids[1]), by_status)
+        self.assertIn('*HIGH*\n[[{}]] FIRST\n'.format(ids[0]), by_priority)
+        self.assertEqual(len([s for s in statements if s.startswith('SELECT')]), 2)
+
+        for task_id in ids:
+            controller.delete_task(task_id, chat)
+
+    def test_bulk_new_and_status_change(self):
+        chat = 12238
+        controller = TasksController()
+        statements = []
+
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+        try:
+            created = controller.new_task('ONE\nTWO\n\nTHREE', chat).split('\n')
+            ids = [line.split('[[')[1].split(']]')[0] for line in created]
+            inserts = len([s for s in statements if s.startswith('INSERT INTO tasks ')])
+
+            del statements[:]
+            responses = controller.change_multiple('{} x 999999 {}'.format(ids[0], ids[2]), chat, 'DONE')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_statement)
+
+        self.assertEqual(len(created), 3)
+        self.assertEqual(inserts, 1)
+        self.assertEqual(responses, ['*DONE* task [[{}]] ONE'.format(ids[0]),
+                                     'You must inform the task id',
+                                     '_404_ Task 999999 not found x.x',
+                                     '*DONE* task [[{}]] THREE'.format(ids[2])])
+        # The event log writes its own rows; the tasks take one SELECT and one UPDATE.
+        self.assertEqual([s.split()[0] for s in statements if re.search(r'\btasks\b', s)],
+                         ['SELECT', 'UPDATE'])
+
+        for task_id in ids:
+            controller.delete_task(task_id, chat)
+
+    def test_list_tasks_cache(self):
+        chat = 12239
+        controller = TasksController()
+        task_id = controller.new_task('CACHED', chat).split('[[')[1].split(']]')[0]
+        first = controller.list_tasks('', chat)
+
+        statements = []
+
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+        try:
+            second = controller.list_tasks('', chat)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_statement)
+
+        self.assertEqual(first, second)
+        self.assertEqual(statements, [])
+
+        controller.rename_task('{} RENAMED'.format(task_id), chat)
+        self.assertIn('RENAMED', controller.list_tasks('', chat)[0])
+
+        controller.delete_task(task_id, chat)
+        self.assertNotIn('RENAMED', controller.list_tasks('', chat)[0])
+
+    def test_delete_task_removes_edges(self):
+        chat = 12236
+        controller = TasksController()
+        ids = [controller.new_task(name, chat).split('[[')[1].split(']]')[0]
+               for name in ['PARENT', 'CHILD']]
+        controller.depends_on('{} {}'.format(ids[0], ids[1]), chat)
+
+        controller.delete_task(ids[1], chat)
+        query = db.session.query(db.TaskDependency).filter_by(chat=chat)
+        self.assertEqual(query.count(), 0)
+
+        controller.delete_task(ids[0], chat)
+
 
 suite = unittest.TestLoader().loadTestsFromTestCase(TestTaskBot)
 unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+import os
+import unittest
+
+from fake_telegram import FakeTelegram
+from taskbot_api import Api
+
+class TestApi(unittest.TestCase):
+    chat = 12270
+
+    def setUp(self):
+        os.environ['TASKBOT_GITHUB_ISSUES'] = '0'
+        self.server = FakeTelegram(poll_cap=0).start()
+        self.api = Api(token='TEST', api_url=self.server.url)
+
+    def tearDown(self):
+        del os.environ['TASKBOT_GITHUB_ISSUES']
+        self.server.stop()
+
+    def message(self, text):
+        return {'message': {'chat': {'id': self.chat}, 'text': text}}
+
+    def test_updates_round_trip_through_the_base_url(self):
+        self.server.queue_updates([self.message('/help'), self.message('/new API TASK')])
+
+        updates = self.api.get_updates()
+        self.api.handle_updates(updates)
+
+        self.assertEqual([update['update_id'] for update in updates['result']], [1, 2])
+        sent = self.server.sent_messages()
+        self.assertEqual(len(sent), 1)
+        self.assertEqual(sent[0]['chat_id'], self.chat)
+        self.assertTrue(sent[0]['text'].startswith('Here is a list of things you can do.\n'))
+        self.assertIn('] API TASK', sent[0]['text'])
+
+        task_id = sent[0]['text'].split('[[')[1].split(']]')[0]
+        self.api.controller.delete_task(task_id, self.chat)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import os
+import time
+import unittest
+
+import pytest
+
+aiohttp = pytest.importorskip('aiohttp')
+
+from fake_telegram import FakeTelegram
+from taskbot_api import Api
+from taskbot_async import AsyncBot
+
+class EchoApi:
+    url = 'http://localhost/'
+
+    def process_update(self, update):
+        message = update['message']
+        return message['chat']['id'], [message['text']]
+
+class RecordingBot(AsyncBot):
+    def __init__(self, api):
+        super().__init__(api)
+        self.sent = []
+
+    async def send_message(self, text, chat_id, reply_markup=None):
+        if chat_id == 1:
+            await asyncio.sleep(0.05)
+        self.sent.append((chat_id, text))
+
+def make_update(update_id, chat, text):
+    return {'update_id': update_id, 'message': {'chat': {'id': chat}, 'text': text}}
+
+class TestAsyncBot(unittest.TestCase):
+
+    def test_chats_run_concurrently_in_order(self):
+        bot = RecordingBot(EchoApi())
+
+        async def run():
+            for update_id, chat, text in [(1, 1, 'a1'), (2, 1, 'a2'), (3, 2, 'b1'), (4, 1, 'a3')]:
+                bot.dispatch(make_update(update_id, chat, text))
+            await asyncio.gather(*bot.chat_workers.values())
+
+        asyncio.run(run())
+
+        self.assertEqual(bot.sent[0], (2, 'b1'))
+        self.assertEqual(bot.sent[1:], [(1, 'a1\na2\na3')])
+        self.assertEqual(bot.chat_workers, {})
+
+    def test_update_without_chat_is_skipped(self):
+        bot = RecordingBot(EchoApi())
+        bot.dispatch({'update_id': 5, 'channel_post': {}})
+        self.assertEqual(bot.chat_queues, {})
+
+class TestAsyncBotRetries(unittest.TestCase):
+
+    def setUp(self):
+        os.environ['TASKBOT_GITHUB_ISSUES'] = '0'
+        self.server = FakeTelegram(poll_cap=0).start()
+        self.bot = AsyncBot(Api(token='TEST', api_url=self.server.url, background=False),
+                            max_retries=2, backoff=0)
+        self.bot.MAX_BACKOFF = 0
+
+    def tearDown(self):
+        del os.environ['TASKBOT_GITHUB_ISSUES']
+        self.server.stop()
+
+    def test_send_retries_rate_limits_and_bad_gateways(self):
+        self.server.fail_next(429, retry_after=0)
+        self.server.fail_next(502, html=True)
+
+        async def send():
+            async with aiohttp.ClientSession() as self.bot.http:
+                await self.bot.send_message('retried', 5)
+
+        asyncio.run(send())
+        self.assertEqual([message['text'] for message in self.server.sent_messages()],
+                         ['retried'])
+
+    def test_poll_failures_back_off_instead_of_stopping(self):
+        self.bot.max_retries = 0
+        self.server.fail_next(502, html=True)
+        self.server.fail_next(409)
+        self.server.queue_updates([{'message': make_update(1, 5, '/help')['message']}])
+
+        async def poll():
+            task = asyncio.ensure_future(self.bot.run())
+            deadline = time.monotonic() + 5
+            while not self.server.sent_messages() and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+            task.cancel()
+
+        asyncio.run(poll())
+        self.assertIn('Here is a list', self.server.sent_messages()[0]['text'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import time
+import unittest
+import urllib.error
+import urllib.request
+
+from fake_telegram import FakeTelegram
+from taskbot_api import Api
+from webhook import SECRET_HEADER, WebhookServer
+
+class TestWebhook(unittest.TestCase):
+    chat = 17017
+
+    def setUp(self):
+        os.environ['TASKBOT_GITHUB_ISSUES'] = '0'
+        self.telegram = FakeTelegram(poll_cap=0).start()
+        self.api = Api(token='TEST', api_url=self.telegram.url)
+
+    def tearDown(self):
+        del os.environ['TASKBOT_GITHUB_ISSUES']
+        self.telegram.stop()
+
+    def post(self, server, update, secret='SECRET'):
+        request = urllib.request.Request(server.url, data=json.dumps(update).encode('utf8'),
+                                         headers={SECRET_HEADER: secret})
+        try:
+            return urllib.request.urlopen(request).status
+        except urllib.error.HTTPError as error:
+            return error.code
+
+    def update(self, update_id, text):
+        return {'update_id': update_id, 'message': {'chat': {'id': self.chat}, 'text': text}}
+
+    def test_updates_are_answered(self):
+        server = WebhookServer(self.api, 'SECRET').start()
+        try:
+            self.assertEqual(self.post(server, self.update(1, '/help')), 200)
+            self.assertEqual(self.post(server, self.update(2, '/help'), secret='WRONG'), 403)
+
+            deadline = time.monotonic() + 5
+            while not self.telegram.sent_messages() and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            server.stop()
+
+        sent = self.telegram.sent_messages()
+        self.assertEqual(len(sent), 1)
+        self.assertTrue(sent[0]['text'].startswith('Here is a list of things you can do.'))
+
+    def test_full_queue_pushes_back(self):
+        server = WebhookServer(self.api, 'SECRET', queue_size=1)
+        server.stopped.set()
+        server.start()
+        try:
+            self.assertEqual(self.post(server, self.update(1, '/help')), 200)
+            self.assertEqual(self.post(server, self.update(2, '/help')), 429)
+        finally:
+            server.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
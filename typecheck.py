@@ -0,0 +1,18 @@
+"""This module gives the @contract decorator, checked only when the contracts setting is on.
+
+Tests run with the contracts checked. Set contracts = false (or
+TASKBOT_CONTRACTS=0) in production: PyContracts is then never imported
+and @contract returns the function it decorates, so calls cost nothing.
+"""
+import settings
+
+CHECKED = settings.get_bool('contracts', True)
+
+if CHECKED:
+    from contracts import contract
+else:
+    def contract(*args, **kwargs):
+        """This decorator leaves the function unchecked."""
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda function: function
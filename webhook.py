@@ -0,0 +1,146 @@
+"""This module receives the bot updates through a Telegram webhook."""
+import hmac
+import json
+import queue
+import secrets
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from typecheck import contract
+
+import settings
+from taskbot_api import Api
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    """This class acknowledges the update POSTs as soon as they are queued."""
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        if self.path != self.server.path:
+            self.reply(404)
+        elif not hmac.compare_digest(self.headers.get(SECRET_HEADER, ''), self.server.secret):
+            self.reply(403)
+        else:
+            try:
+                update = json.loads(body.decode('utf8'))
+            except ValueError:
+                self.reply(400)
+                return
+            if not isinstance(update, dict):
+                self.reply(400)
+            elif self.server.offer(update):
+                self.reply(200)
+            else:
+                # Telegram retries the update later, so a full queue slows it down.
+                self.reply(429, {'Retry-After': '1'})
+
+    def reply(self, status, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+class WebhookServer(ThreadingHTTPServer):
+    """This class queues the webhook updates and hands them to api on a single consumer.
+
+    The queue is bounded: once it is full the POSTs are refused with 429
+    and Telegram delivers them again later.
+    """
+    daemon_threads = True
+
+    BATCH_SIZE = 100
+
+    def __init__(self, api, secret, address=('127.0.0.1', 0), path='/webhook', queue_size=1000):
+        super().__init__(address, WebhookHandler)
+        self.api = api
+        self.secret = secret
+        self.path = path
+        self.updates = queue.Queue(maxsize=queue_size)
+        self.stopped = threading.Event()
+
+    @property
+    def url(self):
+        """This function gets the local url the updates are posted to."""
+        return 'http://{}:{}{}'.format(self.server_address[0], self.server_address[1], self.path)
+
+    @contract(update='dict', returns='bool')
+    def offer(self, update):
+        """This function queues an update, returning False if the queue is full."""
+        try:
+            self.updates.put_nowait(update)
+        except queue.Full:
+            return False
+        return True
+
+    def take(self):
+        """This function waits for an update and takes the ones queued behind it."""
+        batch = [self.updates.get()]
+        while len(batch) < self.BATCH_SIZE:
+            try:
+                batch.append(self.updates.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def consume(self):
+        """This function hands the queued updates to Api.handle_updates, in order."""
+        while not self.stopped.is_set():
+            batch = [update for update in self.take() if update]
+            if not batch:
+                continue
+            try:
+                self.api.handle_updates({'result': batch})
+            except Exception as error:
+                print('Webhook updates failed: {!r}'.format(error))
+
+    def start(self):
+        """This function serves the webhook and the consumer on background threads."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        threading.Thread(target=self.consume, daemon=True).start()
+        return self
+
+    def stop(self):
+        """This function stops the server and the consumer."""
+        self.stopped.set()
+        try:
+            self.updates.put_nowait({})
+        except queue.Full:
+            pass
+        self.shutdown()
+        self.server_close()
+
+def main(workers=1):
+    """This function registers the webhook and answers the updates it receives."""
+    api = Api()
+    handler = api
+    if workers > 1:
+        import sharding
+        handler = sharding.ShardedDispatcher(workers, api=api).start()
+        handler.restart_on_hangup()
+
+    secret = settings.get('webhook_secret') or secrets.token_urlsafe(32)
+    server = WebhookServer(handler, secret,
+                           address=(settings.get('webhook_host', '0.0.0.0'),
+                                    settings.get_int('webhook_port', 8443)),
+                           path=settings.get('webhook_path', '/webhook'),
+                           queue_size=settings.get_int('webhook_queue_size', 1000))
+
+    public_url = settings.get('webhook_url')
+    if public_url:
+        print(api.set_webhook(public_url, secret))
+    elif not settings.get('webhook_secret'):
+        print('Set webhook_url or webhook_secret: the generated secret is not registered')
+
+    server.start()
+    server.stopped.wait()
+
+if __name__ == '__main__':
+    main()